@@ -8,83 +8,92 @@
 # external imports
 import logging
 import requests
-import xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
 import json
 import re
+from typing import Iterable, Iterator, Tuple
+
+# internal imports
+from Koha_Retry import Retry_Policy
+from Koha_MARC_Record import MARC_Record
+from Koha_ISO2709 import ISO2709_Record
+from Koha_MARC_Selector import Tag_Index, compile_selector
+from Koha_XML_Backend import fromstring
+from Koha_Cache import Record_Cache, cache_key
+from Koha_Rate_Limiter import Rate_Limiter
+from Koha_REST_API_Client import bounded_map, validate_int, DEFAULT_TIMEOUT
 
 NS = {
     'marc': 'http://www.loc.gov/MARC21/slim'
     }
 
-class Koha_API_PublicBiblio(object):
-    """Koha_API_PublicBiblio
+FORMATS = ["application/marcxml+xml",
+            "application/marc-in-json",
+            "application/marc",
+            "text/plain"]
+
+def validate_format(format):
+    """Returns the format if it is supported, else "application/marcxml+xml"."""
+    if format not in FORMATS:
+        return "application/marcxml+xml"
+    return format
+
+def validate_bibnb(bibnb):
+    """Returns True if the biblionumber only has digits."""
+    return re.sub(r"\D", "", str(bibnb)) == str(bibnb) # |||revoir cette conditin
+
+def public_biblio_url(kohaUrl, bibnb):
+    """Returns the getBiblioPublic URL of a biblionumber."""
+    if kohaUrl[-1:] in ["/", "\\"]:
+        kohaUrl = kohaUrl[:len(kohaUrl)-1]
+    return "{}/api/v1/public/biblios/{}".format(kohaUrl, bibnb)
+
+class Public_Biblio_Record(object):
+    """Public_Biblio_Record
     =======
-    A set of function wich handle data returned by Koha API 'getBiblioPublic' 
-    https://api.koha-community.org/20.11.html#operation/getBiblioPublic
+    The accessors of a record returned by Koha API 'getBiblioPublic', without any request :
+    built from the response content by PublicBiblioFetcher (and Koha_API_PublicBiblio).
     On init take as arguments :
     - biblionumber (Koha identifier)
-    - Koha server URL
-    - [optional] : format (the response format) :
-        - "application/marcxml+xml" (default)
-        - "application/marc-in-json"
-        - "application/marc"
-        - "text/plain"
+    - [optional] : format (the response format, see Koha_API_PublicBiblio)
+    - [optional] : content (the response content as bytes, parsed on init)
+    - [optional] : status ("Success" or "Error")
+    - [optional] : error_msg
 """
 
-    def __init__(self,bibnb,kohaUrl,service='Koha_API_PublicBiblio', format="application/marcxml+xml"):
-        self.logger = logging.getLogger(service)
-        if kohaUrl[-1:] in ["/", "\\"]:
-            kohaUrl = kohaUrl[:len(kohaUrl)-1]
-        self.endpoint = kohaUrl + "/api/v1/public/biblios/"
-        self.service = service
+    def __init__(self, bibnb, format="application/marcxml+xml", content=None, status='Success', error_msg=None):
         self.bibnb = str(bibnb)
-        if format not in ["application/marcxml+xml",
-                        "application/marc-in-json",
-                        "application/marc",
-                        "text/plain"]:
-            self.format = "application/marcxml+xml"
-        else:
-            self.format = format
-        if re.sub(r"\D", "", self.bibnb) != self.bibnb: # |||revoir cette conditin
-            self.status = "Error"
-            self.logger.error("{} :: Koha_API_PublicBiblio :: Biblionumber invalide".format(bibnb))
-            self.error_msg = "Biblionumber invalide"
-        else:
-            self.url =  '{}/{}'.format(self.endpoint, self.bibnb)
-            self.payload = {
-                
-                }
-            self.headers = {
-                "accept":self.format
-                }
-            
-            try:
-                r = requests.get(self.url, headers=self.headers, params=self.payload)
-                r.raise_for_status()
-            except requests.exceptions.HTTPError:
-                self.status = 'Error'
-                self.logger.error("{} :: Koha_API_PublicBiblio_Init :: HTTP Status: {} || Method: {} || URL: {} || Response: {}".format(bibnb, r.status_code, r.request.method, r.url, r.text))
-                self.error_msg = "Biblionumber inconnu ou service indisponible"
-            except requests.exceptions.RequestException as generic_error:
-                self.status = 'Error'
-                self.logger.error("{} :: Koha_API_PublicBiblio_Init :: Generic exception || URL: {} || {}".format(bibnb, self.url, generic_error))
-                self.error_msg = "Exception générique, voir les logs pour plus de détails"
-            else:
-                # apparently its double-encoded in JSON ?? See : https://stackoverflow.com/questions/4267019/double-decoding-unicode-in-python
-                # So yeah, decode->encode->decode for JSON
-                # Fixed with Bug 28604 - Bad encoding when using marc-in-json (20.11.09)
-                # if self.format == "application/marc-in-json":
-                #     self.record = r.content.decode('utf-8').encode('raw_unicode_escape').decode('utf-8')
-                # else:
-                #     self.record = r.content.decode('utf-8')
-                self.record = r.content.decode('utf-8')
-                self.record_parsed = None
-                if self.format == "application/marcxml+xml":
-                    self.record_parsed = ET.fromstring(self.record)
-                elif self.format == "application/marc-in-json":
-                    self.record_parsed = json.loads(self.record)
-                self.status = 'Success'
-                self.logger.debug("{} :: Koha_API_PublicBiblio :: Notice trouvée".format(bibnb))
+        self.format = validate_format(format)
+        self.status = status
+        if error_msg is not None:
+            self.error_msg = error_msg
+        if content is not None:
+            self.parse(content)
+
+    def parse(self, content):
+        """Parses the response content (bytes) and indexes it for the accessors."""
+        # apparently its double-encoded in JSON ?? See : https://stackoverflow.com/questions/4267019/double-decoding-unicode-in-python
+        # So yeah, decode->encode->decode for JSON
+        # Fixed with Bug 28604 - Bad encoding when using marc-in-json (20.11.09)
+        # if self.format == "application/marc-in-json":
+        #     self.record = r.content.decode('utf-8').encode('raw_unicode_escape').decode('utf-8')
+        # else:
+        #     self.record = r.content.decode('utf-8')
+        self.record = content.decode('utf-8')
+        self.index_record(content)
+
+    @property
+    def record_parsed(self):
+        """The record parsed for its format : an Element (MARCXML), a dict (marc-in-json),
+        a Koha_ISO2709.ISO2709_Record (marc) or None (text/plain).
+        Parsed again on each access : only the response string, marc_record & tag_index are kept."""
+        if self.format == "application/marcxml+xml":
+            return fromstring(self.record)
+        elif self.format == "application/marc-in-json":
+            return json.loads(self.record)
+        elif self.format == "application/marc":
+            return ISO2709_Record(self.record.encode('utf-8'))
+        return None
 
     def get_record(self):
             """Return the entire record as a string of the specified format."""
@@ -101,45 +110,64 @@ class Koha_API_PublicBiblio(object):
         else:
             return "Pas de message d'erreur"  
 
+    def index_record(self, content=None):
+        """Builds marc_record (a Koha_MARC_Record.MARC_Record) straight from the response content
+        and tag_index (a Koha_MARC_Selector.Tag_Index), once for all accessors.
+        The intermediate parse (Element, dict…) is not kept.
+
+        Takes as arguments :
+            content {bytes} : [optional] the response content, defaults to the record string
+
+        Text/plain format is not supported for the time being : marc_record & tag_index are None.
+        """
+        self.marc_record = None
+        self.tag_index = None
+        if content is None:
+            content = self.record.encode('utf-8')
+        if self.format in ["application/marcxml+xml", "application/marc-in-json", "application/marc"]:
+            self.marc_record = MARC_Record.from_content(content, self.format)
+        if self.marc_record is not None:
+            self.tag_index = Tag_Index(self.marc_record)
+
+    def get_marc_record(self):
+        """Return the record as a Koha_MARC_Record.MARC_Record (None if the format is not supported)."""
+        return self.marc_record
+
+    def __select(self, path):
+        """Returns all values of a Koha_MARC_Selector path ("214|210$c") as a list.
+        MARCXML : all values of the first tag, then of the second, etc. Empty subfields are None
+        Marc-in-json & Marc : values in the record order"""
+        if self.tag_index is None:
+            return []
+        values = compile_selector(path).values(self.tag_index, record_order=self.format != "application/marcxml+xml")
+        if self.format == "application/marcxml+xml":
+            # Like Element.text, empty MARCXML subfields are None
+            return [value if value != "" else None for value in values]
+        return values
+
     def get_leader(self):
         """Return the leader field content as a string.
 
-        Application/marc and Text/plain formats are not supported for the time being.
+        Text/plain format is not supported for the time being.
         """
-        if self.format == "application/marcxml+xml":
-            root = ET.fromstring(self.record)
-            return root.find("./marc:leader", NS).text
-        elif self.format == "application/marc-in-json":
-            return json.loads(self.record)["leader"]
-        elif self.format == "application/marc" or self.format == "text/plain":
+        if self.format == "text/plain":
             return "Pas de prise en charge de ce format pour le moment."
+        return self.marc_record.leader
 
     def get_title_info(self):
         """Return the first 200 field's title content as a string.
         Each subfield is separated by a space.
 
-        Application/marc and Text/plain formats are not supported for the time being.
+        Text/plain format is not supported for the time being.
         """
-        key_title = []
-        
-        if self.format == "application/marcxml+xml":
-            root = ET.fromstring(self.record)
-            for subfield in root.find("./marc:datafield[@tag='200']", NS).findall("./marc:subfield", NS):
-                if subfield.attrib['code'] in ('a','d','e','h','i','v') :
-                    key_title.append(str(subfield.text or "")) #AR294 : MARCXML can have empty subfields that returns None, but we need a string
-
-        elif self.format == "application/marc-in-json":
-            for field in json.loads(self.record)["fields"]:
-                if "200" in field.keys():
-                    for subfield in field["200"]["subfields"]:
-                        code = list(subfield.keys())[0]
-                        if code in ('a','d','e','h','i','v') :
-                            key_title.append(subfield[code])
-                    break # To match XML find first, prevents finding another 200
-        
-        elif self.format == "application/marc" or self.format == "text/plain":
+        if self.format == "text/plain":
             return "Pas de prise en charge de ce format pour le moment."
-        
+
+        key_title = []
+        field = self.marc_record.get_field("200") # Only the first 200
+        if field is not None:
+            for value in field.get_subfields('a','d','e','h','i','v'):
+                key_title.append(str(value or "")) #AR294 : MARCXML can have empty subfields, but we need a string
         return " ".join(key_title)
 
     def get_dates_pub(self):
@@ -150,27 +178,22 @@ class Koha_API_PublicBiblio(object):
          - 1st publication date (pos. 9-12)
          - 2nd publication date (pos. 13-16)
 
-        Application/marc and Text/plain formats are not supported for the time being.
+        Text/plain format is not supported for the time being.
         """
         zone_100 = None
         date_type = None
         date_1 = None
         date_2 = None
 
-        if self.format == "application/marcxml+xml":
-            root = ET.fromstring(self.record)
-            if root.find("./marc:datafield[@tag='100']/marc:subfield[@code='a']", NS) != None :
-                zone_100 = root.find("./marc:datafield[@tag='100']/marc:subfield[@code='a']", NS).text
-        
-        elif self.format == "application/marc-in-json":
-            for field in json.loads(self.record)["fields"]:
-                if "100" in field.keys():
-                    for subfield in field["100"]["subfields"]:
-                        code = list(subfield.keys())[0]
-                        if code == "a":
-                            zone_100 = subfield[code]
-
-        # elif self.format == "application/marc" or self.format == "text/plain":
+        values = self.__select("100$a")
+        if values:
+            # MARCXML used the first 100$a, marc-in-json the last one
+            if self.format != "application/marc-in-json":
+                zone_100 = values[0]
+            else:
+                zone_100 = values[-1]
+
+        # elif self.format == "text/plain":
         #     return "Pas de prise en charge de ce format pour le moment."
         
         date_type = zone_100[8:9]
@@ -182,28 +205,9 @@ class Koha_API_PublicBiblio(object):
     def get_editeurs(self):
         """Return all publishers in 210/214$c subfields as a list.
         
-        Application/marc and Text/plain formats are not supported for the time being.
+        Text/plain format is not supported for the time being.
         """
-        ed_list = []
-
-        if self.format == "application/marcxml+xml":
-            root = ET.fromstring(self.record)
-            for ed in root.findall("./marc:datafield[@tag='214']/marc:subfield[@code='c']", NS) + root.findall("./marc:datafield[@tag='210']/marc:subfield[@code='c']", NS):
-                ed_list.append(ed.text)
-
-        elif self.format == "application/marc-in-json":
-            for field in json.loads(self.record)["fields"]:
-                tag = list(field.keys())[0]
-                if tag == "210" or tag == "214":
-                    for subfield in field[tag]["subfields"]:
-                        code = list(subfield.keys())[0]
-                        if code == "c":
-                            ed_list.append(subfield[code])
-        
-        # elif self.format == "application/marc" or self.format == "text/plain":
-        #     return "Pas de prise en charge de ce format pour le moment."
-
-        return ed_list
+        return self.__select("214|210$c")
 
     def get_ppn(self, field, subfield=None):
         """Returns the PPN.
@@ -213,129 +217,214 @@ class Koha_API_PublicBiblio(object):
             field {str} : the field containing the PPN
             subfield {str} : if the field is not a controlfield, the subfield containing the PPN
         """
-        
-        if self.format == "application/marcxml+xml":
-            root = ET.fromstring(self.record)
-            if int(field) < 10:
-                if root.find("./marc:controlfield[@tag='{}']".format(str(field)), NS) != None :
-                    return root.find("./marc:controlfield[@tag='{}']".format(str(field)), NS).text
-            else:
-                if root.find("./marc:datafield[@tag='{}']/marc:subfield[@code='{}']".format(str(field), str(subfield)), NS) != None :
-                    return root.find("./marc:datafield[@tag='{}']/marc:subfield[@code='{}']".format(str(field), str(subfield)), NS).text
-
-        elif self.format == "application/marc-in-json":
-            for record_field in json.loads(self.record)["fields"]:
-                if str(field) in record_field.keys():
-                    if int(field) < 10:
-                        return record_field[str(field)]
-                    else:
-                        for record_subfield in record_field[str(field)]["subfields"]:
-                            code = list(record_subfield.keys())[0]
-                            if code == str(subfield):
-                                return record_subfield[code]       
+        if self.tag_index is None:
+            return None
+        # The tag is used as provided : "1" is not "001"
+        path = str(field)
+        if int(field) >= 10:
+            if subfield is None:
+                return None
+            path += "$" + str(subfield)
+        try:
+            selector = compile_selector(path)
+        except ValueError:
+            return None
+        values = selector.values(self.tag_index)
+        if not values:
+            return None
+        if self.format == "application/marcxml+xml" and values[0] == "":
+            return None
+        return values[0]
 
     def get_note_edition(self):
+        """Return all texts in 305$a subfields as a list.
         """
-        """
-        note_list = []
-
-        if self.format == "application/marcxml+xml":
-            root = ET.fromstring(self.record)
-            for note in root.findall("./marc:datafield[@tag='305']/marc:subfield[@code='a']", NS):
-                note_list.append(note.text)
-
-        elif self.format == "application/marc-in-json":
-            for field in json.loads(self.record)["fields"]:
-                tag = list(field.keys())[0]
-                if tag == "305":
-                    for subfield in field[tag]["subfields"]:
-                        code = list(subfield.keys())[0]
-                        if code == "a":
-                            note_list.append(subfield[code])
-        
-        # elif self.format == "application/marc" or self.format == "text/plain":
-        #     return "Pas de prise en charge de ce format pour le moment."
-
-        return note_list
+        return self.__select("305$a")
 
     def get_dates_from_21X(self):
         """Return all texts in 210/214$d subfields as a list.
         
-        Application/marc and Text/plain formats are not supported for the time being.
+        Text/plain format is not supported for the time being.
         """
-        date_list = []
-
-        if self.format == "application/marcxml+xml":
-            root = ET.fromstring(self.record)
-            for ed in root.findall("./marc:datafield[@tag='214']/marc:subfield[@code='d']", NS) + root.findall("./marc:datafield[@tag='210']/marc:subfield[@code='d']", NS):
-                date_list.append(ed.text)
-
-        elif self.format == "application/marc-in-json":
-            for field in json.loads(self.record)["fields"]:
-                tag = list(field.keys())[0]
-                if tag == "210" or tag == "214":
-                    for subfield in field[tag]["subfields"]:
-                        code = list(subfield.keys())[0]
-                        if code == "d":
-                            date_list.append(subfield[code])
-        
-        # elif self.format == "application/marc" or self.format == "text/plain":
-        #     return "Pas de prise en charge de ce format pour le moment."
-
-        return date_list
+        return self.__select("214|210$d")
     
     def get_desc(self):
-        """Return all texts in 215$d subfields as a list.
+        """Return all texts in 215$a subfields as a list.
         
-        Application/marc and Text/plain formats are not supported for the time being.
+        Text/plain format is not supported for the time being.
         """
-        desc_list = []
-
-        if self.format == "application/marcxml+xml":
-            root = ET.fromstring(self.record)
-            for ed in root.findall("./marc:datafield[@tag='215']/marc:subfield[@code='a']", NS):
-                desc_list.append(ed.text)
-
-        elif self.format == "application/marc-in-json":
-            for field in json.loads(self.record)["fields"]:
-                tag = list(field.keys())[0]
-                if tag == "215":
-                    for subfield in field[tag]["subfields"]:
-                        code = list(subfield.keys())[0]
-                        if code == "a":
-                            desc_list.append(subfield[code])
-        
-        # elif self.format == "application/marc" or self.format == "text/plain":
-        #     return "Pas de prise en charge de ce format pour le moment."
-
-        return desc_list
+        return self.__select("215$a")
 
     def get_wrong_isbn(self):
+        """Return all texts in 010$z subfields as a list.
         """
-        """
-        isbn_list = []
-
-        if self.format == "application/marcxml+xml":
-            root = ET.fromstring(self.record)
-            for isbn in root.findall("./marc:datafield[@tag='010']/marc:subfield[@code='z']", NS):
-                isbn_list.append(isbn.text)
-
-        elif self.format == "application/marc-in-json":
-            for field in json.loads(self.record)["fields"]:
-                tag = list(field.keys())[0]
-                if tag == "010":
-                    for subfield in field[tag]["subfields"]:
-                        code = list(subfield.keys())[0]
-                        if code == "z":
-                            isbn_list.append(subfield[code])
-        
-        # elif self.format == "application/marc" or self.format == "text/plain":
-        #     return "Pas de prise en charge de ce format pour le moment."
-
-        return isbn_list
+        return self.__select("010$z")
 
     # Manque de AbesXml :
     #     get_ppn_autre_support
     # Manque peut-être :
     #     get_dates_pub_210/214
-    #    get_bibnb_autre_support
\ No newline at end of file
+    #    get_bibnb_autre_support
+
+class Koha_API_PublicBiblio(Public_Biblio_Record):
+    """Koha_API_PublicBiblio
+    =======
+    A set of function wich handle data returned by Koha API 'getBiblioPublic' 
+    https://api.koha-community.org/20.11.html#operation/getBiblioPublic
+    On init take as arguments :
+    - biblionumber (Koha identifier)
+    - Koha server URL
+    - [optional] : format (the response format) :
+        - "application/marcxml+xml" (default)
+        - "application/marc-in-json"
+        - "application/marc"
+        - "text/plain"
+    - [optional] : retry_policy (a Koha_Retry.Retry_Policy for transient errors, defaults to Retry_Policy())
+    - [optional] : cache (a Koha_Cache.Record_Cache, the record is only downloaded if it is not cached or changed)
+"""
+
+    def __init__(self,bibnb,kohaUrl,service='Koha_API_PublicBiblio', format="application/marcxml+xml", retry_policy:Retry_Policy=None, cache:Record_Cache=None):
+        self.logger = logging.getLogger(service)
+        self.retry_policy = retry_policy if retry_policy is not None else Retry_Policy()
+        self.cache = cache
+        if kohaUrl[-1:] in ["/", "\\"]:
+            kohaUrl = kohaUrl[:len(kohaUrl)-1]
+        self.endpoint = kohaUrl + "/api/v1/public/biblios/"
+        self.service = service
+        self.bibnb = str(bibnb)
+        self.format = validate_format(format)
+        if not validate_bibnb(self.bibnb):
+            self.status = "Error"
+            self.logger.error("{} :: Koha_API_PublicBiblio :: Biblionumber invalide".format(bibnb))
+            self.error_msg = "Biblionumber invalide"
+        else:
+            self.url = public_biblio_url(kohaUrl, self.bibnb)
+            self.payload = {
+                
+                }
+            self.headers = {
+                "accept":self.format
+                }
+            
+            try:
+                if self.cache is None:
+                    r = self.retry_policy.send(lambda: requests.get(self.url, headers=self.headers, params=self.payload), "GET", self.logger)
+                    r.raise_for_status()
+                    content = r.content
+                else:
+                    r, content = self.cache.fetch(cache_key(self.url, self.format),
+                        lambda conditional_headers: self.retry_policy.send(lambda: requests.get(self.url, headers={**self.headers, **conditional_headers}, params=self.payload), "GET", self.logger))
+            except requests.exceptions.HTTPError as http_error:
+                r = http_error.response
+                self.status = 'Error'
+                self.logger.error("{} :: Koha_API_PublicBiblio_Init :: HTTP Status: {} || Method: {} || URL: {} || Response: {}".format(bibnb, r.status_code, r.request.method, r.url, r.text))
+                self.error_msg = "Biblionumber inconnu ou service indisponible"
+            except requests.exceptions.RequestException as generic_error:
+                self.status = 'Error'
+                self.logger.error("{} :: Koha_API_PublicBiblio_Init :: Generic exception || URL: {} || {}".format(bibnb, self.url, generic_error))
+                self.error_msg = "Exception générique, voir les logs pour plus de détails"
+            else:
+                self.parse(content)
+                self.status = 'Success'
+                self.logger.debug("{} :: Koha_API_PublicBiblio :: Notice trouvée".format(bibnb))
+
+
+class PublicBiblioFetcher(object):
+    """PublicBiblioFetcher
+    =======
+    Fetches many records from Koha API 'getBiblioPublic' concurrently over a pooled keep-alive session,
+    and returns them as Public_Biblio_Record (same accessors as Koha_API_PublicBiblio).
+    Worker threads only download the records, they are parsed by the thread iterating over the results.
+    On init take as arguments :
+    - Koha server URL
+    - [optional] : format (the response format, see Koha_API_PublicBiblio)
+    - [optional] : service (name of the service for the logs)
+    - [optional] : max_workers (maximum number of requests in flight, also the size of the connection pool, defaults to 10)
+    - [optional] : timeout (requests timeout in seconds, either a float or a (connect, read) tuple)
+    - [optional] : retry_policy (a Koha_Retry.Retry_Policy for transient errors, defaults to Retry_Policy())
+    - [optional] : rate_limiter (a Koha_Rate_Limiter.Rate_Limiter)
+    - [optional] : cache (a Koha_Cache.Record_Cache)
+
+Use the fetcher as a context manager (or call close()) to release the connections.
+"""
+
+    def __init__(self, kohaUrl, format="application/marcxml+xml", service='PublicBiblioFetcher', max_workers:int=10, timeout:float|tuple=DEFAULT_TIMEOUT, retry_policy:Retry_Policy=None, rate_limiter:Rate_Limiter=None, cache:Record_Cache=None):
+        self.logger = logging.getLogger(service)
+        self.service = service
+        self.kohaUrl = kohaUrl
+        self.format = validate_format(format)
+        self.max_workers = validate_int(max_workers, default=10)
+        self.timeout = timeout
+        self.retry_policy = retry_policy if retry_policy is not None else Retry_Policy()
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.headers = {
+            "accept":self.format
+            }
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=self.max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch(self, bibnbs:Iterable[str], ordered:bool=False) -> Iterator[Public_Biblio_Record]:
+        """Fetches the records concurrently and yields a Public_Biblio_Record for each biblionumber.
+        Check each record get_init_status() / get_error_msg() before using its accessors.
+
+        Takes as argument :
+            - bibnbs {iterable of str} : the biblionumbers, can be a lazy iterable
+            - [optionnal] ordered {bool} : if True, yields in input order, else as requests finish (default)"""
+        for bibnb, (content, error_msg) in bounded_map(self.download, bibnbs, max_workers=self.max_workers, ordered=ordered):
+            if error_msg is not None:
+                yield Public_Biblio_Record(bibnb, self.format, status='Error', error_msg=error_msg)
+                continue
+            try:
+                yield Public_Biblio_Record(bibnb, self.format, content=content)
+            except Exception as generic_error:
+                self.logger.error("{} :: PublicBiblioFetcher :: Could not parse the record || {}".format(bibnb, generic_error))
+                yield Public_Biblio_Record(bibnb, self.format, status='Error', error_msg="Notice illisible")
+
+    def fetch_one(self, bibnb) -> Public_Biblio_Record:
+        """Fetches a single record over the pooled session and returns a Public_Biblio_Record."""
+        return next(self.fetch([bibnb]))
+
+    def download(self, bibnb) -> Tuple[bytes|None, str|None]:
+        """Downloads a record without parsing it.
+        Returns a (content, None) tuple, or (None, error message) if it failed."""
+        bibnb = str(bibnb)
+        if not validate_bibnb(bibnb):
+            self.logger.error("{} :: PublicBiblioFetcher :: Biblionumber invalide".format(bibnb))
+            return None, "Biblionumber invalide"
+        url = public_biblio_url(self.kohaUrl, bibnb)
+        try:
+            if self.cache is None:
+                r = self.retry_policy.send(lambda: self.__get(url, self.headers), "GET", self.logger)
+                r.raise_for_status()
+                content = r.content
+            else:
+                r, content = self.cache.fetch(cache_key(url, self.format),
+                    lambda conditional_headers: self.retry_policy.send(lambda: self.__get(url, {**self.headers, **conditional_headers}), "GET", self.logger))
+        except requests.exceptions.HTTPError as http_error:
+            r = http_error.response
+            self.logger.error("{} :: PublicBiblioFetcher :: HTTP Status: {} || Method: {} || URL: {} || Response: {}".format(bibnb, r.status_code, r.request.method, r.url, r.text))
+            return None, "Biblionumber inconnu ou service indisponible"
+        except requests.exceptions.RequestException as generic_error:
+            self.logger.error("{} :: PublicBiblioFetcher :: Generic exception || URL: {} || {}".format(bibnb, url, generic_error))
+            return None, "Exception générique, voir les logs pour plus de détails"
+        self.logger.debug("{} :: PublicBiblioFetcher :: Notice trouvée".format(bibnb))
+        return content, None
+
+    def __get(self, url, headers) -> requests.Response:
+        """Sends a single GET request over the session, waiting for the rate limiter if one is set"""
+        if self.rate_limiter is None:
+            return self.session.get(url, headers=headers, timeout=self.timeout)
+        return self.rate_limiter.call(lambda: self.session.get(url, headers=headers, timeout=self.timeout))
+
+    def close(self) -> None:
+        """Releases the pooled connections"""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+# Extracts the same fields from many records into columns
+
+# external imports
+import xml.etree.ElementTree as ET
+from typing import Dict, Iterable, Iterator, List
+
+# Optional dependencies for to_numpy() & to_arrow()
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# internal imports
+from Koha_MARC_Record import MARC_Record
+from Koha_ISO2709 import ISO2709_Record
+from Koha_MARC_Selector import Tag_Index, compile_selector
+from Koha_XML_Backend import is_element
+
+# ----------------- Enum def -----------------
+
+MULTIPLE_MODES = ("first", "all", "join")
+
+# ----------------- Func def -----------------
+
+def as_record(record) -> MARC_Record|ISO2709_Record|ET.Element|None:
+    """Returns a record Koha_MARC_Selector.Tag_Index can index from any record representation :
+    MARC_Record, ISO2709_Record, marc:record ET Element, marc-in-json dict,
+    ISO2709 or MARCXML bytes, Koha_API_PublicBiblio / Public_Biblio_Record.
+    Returns None if the record can't be used"""
+    if isinstance(record, (MARC_Record, ISO2709_Record)) or is_element(record):
+        return record
+    if isinstance(record, dict):
+        return MARC_Record.from_marc_in_json(record)
+    if isinstance(record, (bytes, bytearray, memoryview)):
+        if bytes(record[:1]) == b"<" or bytes(record[:5]) == b"\xef\xbb\xbf<?":
+            return MARC_Record.from_marcxml(bytes(record))
+        return ISO2709_Record(record)
+    if hasattr(record, "get_marc_record"):
+        return record.get_marc_record()
+    return None
+
+# ----------------- Class def -----------------
+
+class Batch_Extractor(object):
+    """Batch_Extractor
+    =======
+    Extracts the same fields from many records into columns.
+    Records are processed one at a time : each is indexed once (Koha_MARC_Selector.Tag_Index),
+    then every compiled selector reads its tags and the values are appended to plain Python lists.
+    to_numpy() & to_arrow() only convert the finished lists.
+    On init take as arguments :
+    - specs {list of str} : the Koha_MARC_Selector paths to extract ("200$a", "100$a[9:13]", "210|214$c", "001", "LDR[6:7]"), one column each
+    - [optional] multiple {str} : what a column gets when a record has many values :
+        - "first" (default) : the first value, or None
+        - "all" : the list of values
+        - "join" : the values joined with separator, or None
+    - [optional] separator {str} : used by the "join" mode (defaults to " ; ")
+Raises ValueError if a spec or multiple is invalid"""
+
+    def __init__(self, specs:Iterable[str], multiple:str="first", separator:str=" ; "):
+        self.selectors = [compile_selector(spec) for spec in specs]
+        self.columns = [selector.path for selector in self.selectors]
+        if multiple not in MULTIPLE_MODES:
+            raise ValueError(f"Invalid multiple mode : {multiple}")
+        self.multiple = multiple
+        self.separator = separator
+
+    def extract_record(self, record) -> List:
+        """Returns the extracted values of a record as a list, in the specs order (None for an unusable record).
+        The record is indexed in a single walk, then each selector only reads its tags"""
+        record = as_record(record)
+        if record is None:
+            return [None] * len(self.selectors)
+        index = Tag_Index(record)
+        output = []
+        for selector in self.selectors:
+            values = selector.values(index)
+            if self.multiple == "all":
+                output.append(values)
+            elif not values:
+                output.append(None)
+            elif self.multiple == "first":
+                output.append(values[0])
+            else:
+                output.append(self.separator.join(values))
+        return output
+
+    def iter_rows(self, records:Iterable) -> Iterator[List]:
+        """Yields the extracted values of each record as a list"""
+        for record in records:
+            yield self.extract_record(record)
+
+    def extract(self, records:Iterable) -> Dict[str, List]:
+        """Returns the extracted values as columns : a dict of spec -> list of values, one per record.
+        records can be a lazy iterable of any record representation (see as_record())"""
+        columns = [[] for _ in self.selectors]
+        appends = [column.append for column in columns]
+        for row in self.iter_rows(records):
+            for append, value in zip(appends, row):
+                append(value)
+        return dict(zip(self.columns, columns))
+
+def to_numpy(columns:Dict[str, List]) -> Dict:
+    """Returns the columns as a dict of numpy object arrays (a copy of the lists, values are still Python objects).
+    Raises ImportError if numpy is not installed"""
+    if numpy is None:
+        raise ImportError("numpy is required for to_numpy()")
+    output = {}
+    for name, values in columns.items():
+        array = numpy.empty(len(values), dtype=object)
+        array[:] = values
+        output[name] = array
+    return output
+
+def to_arrow(columns:Dict[str, List]):
+    """Returns the columns as a pyarrow.Table (use its to_pandas() for a DataFrame).
+    Raises ImportError if pyarrow is not installed"""
+    if pyarrow is None:
+        raise ImportError("pyarrow is required for to_arrow()")
+    return pyarrow.table(columns)
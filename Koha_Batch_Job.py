@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+# Resumable bulk writes on top of KohaRESTAPIClient.bulk_write_biblios()
+
+# external imports
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Iterator, Set, TextIO, Tuple
+
+# internal imports
+from Koha_REST_API_Client import KohaRESTAPIClient, Bulk_Write_Result, Status, validate_int, write_journal_entry
+
+# ----------------- Func def -----------------
+
+def default_item_key(index:int, item:Tuple) -> str:
+    """Returns the checkpoint key of an item : its biblionumber,
+    or its position in the input for records to add"""
+    if item[0] is not None:
+        return str(item[0]).strip()
+    return f"#{index}"
+
+# ----------------- Class def -----------------
+
+class Koha_Batch_Job(object):
+    """Koha_Batch_Job
+    =======
+    Runs bulk adds / updates and stores each outcome in a SQLite checkpoint file.
+    When the same job is run again, items already successfully written are skipped,
+    so a crashed job only has to process the remaining items.
+    On init take as arguments :
+    - client {KohaRESTAPIClient} : the client used to write the records
+    - checkpoint_path {str} : the SQLite checkpoint file, created if needed
+    - [optional] job_name {str} : name of the job, a checkpoint file can store many jobs
+    - [optional] service {str} : name of the service for the logs
+"""
+    def __init__(self, client:KohaRESTAPIClient, checkpoint_path:str, job_name:str="default", service:str="Koha_Batch_Job"):
+        self.client = client
+        self.checkpoint_path = checkpoint_path
+        self.job_name = str(job_name)
+        self.service = service
+        self.logger = logging.getLogger(service)
+        self.db = sqlite3.connect(checkpoint_path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS outcomes (
+            job TEXT NOT NULL,
+            key TEXT NOT NULL,
+            status TEXT NOT NULL,
+            response TEXT,
+            latency REAL,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (job, key)
+        )""")
+        self.db.commit()
+
+    def run(self, items:Iterable[Tuple], key:Callable[[int, Tuple], str]=default_item_key, retry_errors:bool=True, commit_every:int=1, max_workers:int=None, journal:str|TextIO=None) -> Iterator[Bulk_Write_Result]:
+        """Writes every item not already done and yields their Bulk_Write_Result.
+        The results index is the position of the item in items, skipped items included.
+        If the generator is closed early, the writes already sent are waited for and still checkpointed.
+
+        Takes as argument :
+            - items {iterable of tuples} : same items as KohaRESTAPIClient.bulk_write_biblios().
+            Must be provided in the same order on every run if key relies on the position
+            - [optionnal] key {callable} : returns the checkpoint key of an item from (index, item).
+            Defaults to the biblionumber, or the position for records to add
+            - [optionnal] retry_errors {bool} : if False, items that failed on a previous run are also skipped
+            - [optionnal] commit_every {int} : number of outcomes between two checkpoint commits (defaults to 1).
+            Outcomes not commited when the job dies are processed again
+            - [optionnal] max_workers {int} : maximum number of requests in flight
+            - [optionnal] journal {str or text file} : also writes a bulk write journal, with the positions in items"""
+        commit_every = max(validate_int(commit_every, default=1), 1)
+        done = self.done_keys(include_errors=not retry_errors)
+        skipped = 0
+        # Keys & input positions of items sent to the client, by position in the filtered stream
+        pending:Dict[int, Tuple[str, int]] = {}
+
+        def remaining_items():
+            nonlocal skipped
+            sent = 0
+            for index, item in enumerate(items):
+                item_key = key(index, item)
+                if item_key in done:
+                    skipped += 1
+                    continue
+                pending[sent] = (item_key, index)
+                sent += 1
+                yield item
+
+        journal_file = journal
+        if type(journal) == str:
+            journal_file = open(journal, mode="a", encoding="utf-8")
+
+        def record(result:Bulk_Write_Result) -> None:
+            # Journal entries are written once the index is mapped back to the position in items
+            item_key, result.index = pending.pop(result.index)
+            self.__store(item_key, result)
+            if journal_file is not None:
+                write_journal_entry(journal_file, result)
+
+        results = self.client.bulk_write_biblios(remaining_items(), max_workers=max_workers, on_drained=record)
+        uncommitted = 0
+        try:
+            for result in results:
+                record(result)
+                uncommitted += 1
+                if uncommitted >= commit_every:
+                    self.db.commit()
+                    uncommitted = 0
+                yield result
+        finally:
+            # Records the writes still in flight before the last commit
+            results.close()
+            self.db.commit()
+            if type(journal) == str:
+                journal_file.close()
+            self.logger.info(f"{self.service} :: {self.job_name} :: {skipped} items skipped as already done")
+
+    def __store(self, item_key:str, result:Bulk_Write_Result) -> None:
+        """Upserts the outcome of an item"""
+        entry = result.to_dict()
+        self.db.execute("""INSERT INTO outcomes (job, key, status, response, latency, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (job, key) DO UPDATE SET status=excluded.status, response=excluded.response,
+                latency=excluded.latency, updated_at=excluded.updated_at""",
+            (self.job_name, item_key, entry["status"], entry["response"], entry["latency"], datetime.now().isoformat()))
+
+    def done_keys(self, include_errors:bool=False) -> Set[str]:
+        """Returns the keys of all items successfully written by this job.
+        If include_errors is True, also returns the failed ones"""
+        if include_errors:
+            cursor = self.db.execute("SELECT key FROM outcomes WHERE job = ?", (self.job_name,))
+        else:
+            cursor = self.db.execute("SELECT key FROM outcomes WHERE job = ? AND status = ?", (self.job_name, Status.SUCCESS.name))
+        return {row[0] for row in cursor}
+
+    def failed(self) -> Dict[str, str]:
+        """Returns the failed items of this job as a {key: response} dict"""
+        cursor = self.db.execute("SELECT key, response FROM outcomes WHERE job = ? AND status = ?", (self.job_name, Status.ERROR.name))
+        return {row[0]:row[1] for row in cursor}
+
+    def stats(self) -> Dict[str, int]:
+        """Returns the number of stored outcomes for each status"""
+        cursor = self.db.execute("SELECT status, COUNT(*) FROM outcomes WHERE job = ? GROUP BY status", (self.job_name,))
+        return {row[0]:row[1] for row in cursor}
+
+    def reset(self) -> None:
+        """Deletes every outcome of this job"""
+        self.db.execute("DELETE FROM outcomes WHERE job = ?", (self.job_name,))
+        self.db.commit()
+
+    def close(self) -> None:
+        """Closes the checkpoint file"""
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+
+# Persistent record cache with HTTP revalidation, used by KohaRESTAPIClient & Koha_API_PublicBiblio
+
+# external imports
+import logging
+import sqlite3
+import threading
+import time
+import requests
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+# Returned by LRU_Cache.get() when the key is not cached
+MISSING = object()
+
+# ----------------- Func def -----------------
+
+def cache_key(url:str, content_type:str) -> str:
+    """Returns the cache key of a record : its URL (endpoint & id) and the requested content type"""
+    return f"{url}|{content_type}"
+
+# ----------------- Class def -----------------
+
+class Cache_Entry(object):
+    """Cache_Entry
+    =======
+    A cached response :
+    - content {bytes}
+    - etag {str} : the ETag header (None if Koha did not send one)
+    - last_modified {str} : the Last-Modified header (None if Koha did not send one)
+    - fresh {bool} : True if the entry is younger than the cache TTL and can be used without asking Koha"""
+    __slots__ = ("content", "etag", "last_modified", "fresh")
+
+    def __init__(self, content:bytes, etag:str|None, last_modified:str|None, fresh:bool):
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fresh = fresh
+
+    def has_validators(self) -> bool:
+        """Returns True if the entry can be revalidated with a conditional request"""
+        return bool(self.etag or self.last_modified)
+
+    def conditional_headers(self) -> Dict:
+        """Returns the If-None-Match / If-Modified-Since headers to revalidate the entry"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+class LRU_Cache(object):
+    """LRU_Cache
+    =======
+    Thread-safe in-memory least recently used cache, with hit / miss statistics.
+    On init take as arguments :
+    - [optional] capacity {int} : maximum number of entries (defaults to 10000)
+    - [optional] ttl {float} : seconds after which an entry expires (defaults to None, never)
+    - [optional] max_size {int} : maximum total size of the entries, as measured by sizeof (defaults to None, no limit)
+    - [optional] sizeof {callable} : returns the size of a value (defaults to len)
+"""
+    def __init__(self, capacity:int=10000, ttl:float|None=None, max_size:int|None=None, sizeof:Callable[[Any], int]=len):
+        self.capacity = max(int(capacity), 1)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        # key -> (value, size, stored_at)
+        self.__entries:OrderedDict[Hashable, Tuple[Any, int, float]] = OrderedDict()
+        self.__lock = threading.Lock()
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, key:Hashable) -> bool:
+        return self.get(key, count=False) is not MISSING
+
+    def get(self, key:Hashable, count:bool=True) -> Any:
+        """Returns the value cached for this key and marks it as recently used.
+        Returns MISSING if the key is not cached (or expired)
+
+        Takes as argument :
+            - key {hashable}
+            - [optionnal] count {bool} : if False, the lookup is not counted in the stats"""
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[2] >= self.ttl:
+                self.__remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                if count:
+                    self.misses += 1
+                return MISSING
+            self.__entries.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry[0]
+
+    def put(self, key:Hashable, value:Any, size:int=None) -> None:
+        """Caches a value, evicting the least recently used entries if needed.
+        Values bigger than max_size are not cached
+
+        Takes as argument :
+            - key {hashable}
+            - value
+            - [optionnal] size {int} : the size of the value, counted against max_size (defaults to sizeof(value))"""
+        if size is None:
+            size = self.sizeof(value) if self.max_size is not None else 0
+        if self.max_size is not None and size > self.max_size:
+            return
+        with self.__lock:
+            if key in self.__entries:
+                self.__remove(key)
+            self.__entries[key] = (value, size, time.monotonic())
+            self.size += size
+            while len(self.__entries) > self.capacity or (self.max_size is not None and self.size > self.max_size):
+                self.__remove(next(iter(self.__entries)))
+                self.evictions += 1
+
+    def invalidate(self, key:Hashable) -> None:
+        """Removes an entry"""
+        with self.__lock:
+            if key in self.__entries:
+                self.__remove(key)
+
+    def clear(self) -> None:
+        """Removes all entries"""
+        with self.__lock:
+            self.__entries.clear()
+            self.size = 0
+
+    def __remove(self, key:Hashable) -> None:
+        """Removes an entry. Must be called with the lock held"""
+        self.size -= self.__entries.pop(key)[1]
+
+    def stats(self) -> Dict:
+        """Returns the cache counters as a dict"""
+        with self.__lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries":len(self.__entries),
+                "size":self.size,
+                "hits":self.hits,
+                "misses":self.misses,
+                "hit_ratio":self.hits / lookups if lookups else 0,
+                "evictions":self.evictions,
+                "expirations":self.expirations
+            }
+
+class Record_Cache(object):
+    """Record_Cache
+    =======
+    Thread-safe on-disk (SQLite) cache of Koha responses, keyed by (URL, content type).
+    Entries younger than ttl are served without any request.
+    Older entries are revalidated with If-None-Match / If-Modified-Since when Koha sent an ETag / Last-Modified :
+    a 304 response refreshes the entry without downloading the record again.
+    When the cache grows over max_size bytes, the least recently used entries are evicted.
+    On init take as arguments :
+    - path {str} : the SQLite file, created if needed (":memory:" for a cache living with the process)
+    - [optional] max_size {int} : maximum total size of the cached contents in bytes (defaults to 256 MiB)
+    - [optional] ttl {float} : seconds during which an entry is served without revalidation (defaults to 3600).
+    0 revalidates every time, None never expires
+    - [optional] service {str} : name of the service for the logs
+"""
+    def __init__(self, path:str, max_size:int=256 * 1024 * 1024, ttl:float|None=3600, service:str="Record_Cache"):
+        self.path = path
+        self.max_size = int(max_size)
+        self.ttl = ttl
+        self.service = service
+        self.logger = logging.getLogger(service)
+        self.__lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # Reads update accessed_at : no fsync on every commit
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            content BLOB NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            size INTEGER NOT NULL,
+            stored_at REAL NOT NULL,
+            accessed_at REAL NOT NULL
+        )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at)")
+        self.db.commit()
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    # ---------- Entries ----------
+
+    def get(self, key:str) -> Cache_Entry|None:
+        """Returns the entry stored for this key, or None"""
+        with self.__lock:
+            row = self.db.execute("SELECT content, etag, last_modified, stored_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            self.db.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self.db.commit()
+        content, etag, last_modified, stored_at = row
+        fresh = self.ttl is None or now - stored_at < self.ttl
+        return Cache_Entry(bytes(content), etag, last_modified, fresh)
+
+    def put(self, key:str, content:bytes, etag:str=None, last_modified:str=None) -> None:
+        """Stores a response, then evicts the least recently used entries if the cache is too big"""
+        content = bytes(content)
+        if len(content) > self.max_size:
+            return
+        with self.__lock:
+            now = time.time()
+            row = self.db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.size -= row[0]
+            self.db.execute("INSERT OR REPLACE INTO entries (key, content, etag, last_modified, size, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                            (key, content, etag, last_modified, len(content), now, now))
+            self.size += len(content)
+            self.__evict()
+            self.db.commit()
+
+    def touch(self, key:str) -> None:
+        """Marks an entry as fresh again (after a 304 response)"""
+        with self.__lock:
+            now = time.time()
+            self.db.execute("UPDATE entries SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+            self.db.commit()
+
+    def invalidate(self, key:str) -> None:
+        """Removes an entry"""
+        with self.__lock:
+            row = self.db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.size -= row[0]
+                self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.db.commit()
+
+    def invalidate_url(self, url:str) -> None:
+        """Removes the entries of this URL, whatever their content type"""
+        with self.__lock:
+            pattern = url.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "|%"
+            removed = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries WHERE key LIKE ? ESCAPE '\\'", (pattern,)).fetchone()[0]
+            self.db.execute("DELETE FROM entries WHERE key LIKE ? ESCAPE '\\'", (pattern,))
+            self.size -= removed
+            self.db.commit()
+
+    def clear(self) -> None:
+        """Removes all entries"""
+        with self.__lock:
+            self.db.execute("DELETE FROM entries")
+            self.db.commit()
+            self.size = 0
+
+    def __evict(self) -> None:
+        """Deletes the least recently used entries until the cache fits in max_size. Must be called with the lock held"""
+        while self.size > self.max_size:
+            rows = self.db.execute("SELECT key, size FROM entries ORDER BY accessed_at LIMIT 64").fetchall()
+            if not rows:
+                self.size = 0
+                return
+            for key, size in rows:
+                self.db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.size -= size
+                self.evictions += 1
+                if self.size <= self.max_size:
+                    return
+
+    # ---------- HTTP ----------
+
+    def fetch(self, key:str, do_request:Callable[[Dict], requests.Response], is_current:Callable[[], bool]=None) -> Tuple[requests.Response|None, bytes]:
+        """Returns a response content through the cache, as a (response, content) tuple.
+        response is None if the content was served from the cache without any request.
+        Raises requests.exceptions.HTTPError if Koha answered with an error status
+
+        Takes as argument :
+            - key {str} : the cache key (see cache_key())
+            - do_request {callable} : sends the GET request with the extra headers dict it gets as argument,
+            and returns a requests.Response
+            - [optionnal] is_current {callable} : called once the response arrived, if it returns False
+            (the entry was invalidated during the request) the response is returned but not stored"""
+        entry = self.get(key)
+        if entry is not None and entry.fresh:
+            self.__count("hits")
+            return None, entry.content
+        headers = {}
+        if entry is not None and entry.has_validators():
+            headers = entry.conditional_headers()
+        r = do_request(headers)
+        if r.status_code == 304 and entry is not None:
+            self.__count("revalidations")
+            if is_current is None or is_current():
+                self.touch(key)
+            return r, entry.content
+        self.__count("misses")
+        r.raise_for_status()
+        if is_current is None or is_current():
+            self.put(key, r.content, r.headers.get("ETag"), r.headers.get("Last-Modified"))
+        return r, r.content
+
+    # ---------- Misc ----------
+
+    def __count(self, counter:str) -> None:
+        """Increments a stat counter"""
+        with self.__lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> Dict:
+        """Returns the cache counters as a dict"""
+        with self.__lock:
+            nb_entries = self.db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "entries":nb_entries,
+            "size":self.size,
+            "hits":self.hits,
+            "misses":self.misses,
+            "revalidations":self.revalidations,
+            "evictions":self.evictions
+        }
+
+    def close(self) -> None:
+        """Closes the SQLite connection"""
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+# Zero-copy ISO2709 (application/marc) decoder & encoder, used by Koha_MARC_Record
+
+# external imports
+from typing import Iterable, Iterator, List, Tuple
+
+# ISO2709 delimiters
+FIELD_TERMINATOR = b"\x1e"
+RECORD_TERMINATOR = b"\x1d"
+SUBFIELD_DELIMITER = b"\x1f"
+
+LEADER_LENGTH = 24
+DIRECTORY_ENTRY_LENGTH = 12
+WHITESPACES = b" \r\n\t"
+
+# A decoded field is either a controlfield (tag, value)
+# or a datafield (tag, ind1, ind2, [(code, value), …])
+Field_Tuple = Tuple
+
+# ----------------- Func def -----------------
+
+def is_control_tag(tag:str) -> bool:
+    """Returns True if the tag is a controlfield tag (00X)"""
+    return tag[:2] == "00"
+
+def iter_iso2709(data:bytes|bytearray|memoryview, encoding:str="utf-8") -> Iterator["ISO2709_Record"]:
+    """Yields each record of a multi-record ISO2709 buffer as an ISO2709_Record, without copying it.
+    Records are delimited by the length in their leader, or by the record terminator if it is invalid.
+    Works with any buffer (bytes, bytearray, mmap…)
+
+    Takes as argument :
+        - data {bytes-like} : the buffer
+        - [optionnal] encoding {str} : the records encoding (defaults to utf-8)"""
+    view = memoryview(data)
+    # Searching the record terminator is faster on the buffer itself
+    search = data if hasattr(data, "find") else view
+    size = len(view)
+    offset = 0
+    while offset < size:
+        # Skips whitespaces between records (trailing new line…)
+        if view[offset] in WHITESPACES:
+            offset += 1
+            continue
+        end = record_end(search, offset)
+        yield ISO2709_Record(view[offset:end], encoding)
+        offset = end
+
+def record_end(data:bytes|memoryview, offset:int) -> int:
+    """Returns the offset right after the record starting at offset.
+    data can be any buffer supporting slicing (bytes, bytearray, memoryview, mmap…)"""
+    size = len(data)
+    length_digits = bytes(data[offset:offset + 5])
+    if length_digits.isdigit():
+        end = offset + int(length_digits)
+        # The length is trusted only if the record terminator is where it says
+        if LEADER_LENGTH < end - offset and end <= size and data[end - 1] == RECORD_TERMINATOR[0]:
+            return end
+    # Falls back on the record terminator
+    if hasattr(data, "find"):
+        pos = data.find(RECORD_TERMINATOR, offset)
+    else:
+        pos = bytes(data[offset:]).find(RECORD_TERMINATOR)
+        pos = offset + pos if pos >= 0 else -1
+    return size if pos < 0 else pos + 1
+
+def encode_iso2709(leader:str, fields:Iterable[Field_Tuple], encoding:str="utf-8") -> bytes:
+    """Returns a record as ISO2709 bytes.
+    The record length, base address & entry map of the leader are recomputed
+
+    Takes as argument :
+        - leader {str} : the leader (padded / truncated to 24 characters)
+        - fields {iterable of tuples} : (tag, value) for controlfields, (tag, ind1, ind2, [(code, value), …]) for datafields
+        - [optionnal] encoding {str} : defaults to utf-8"""
+    directory = bytearray()
+    body = bytearray()
+    for field in fields:
+        start = len(body)
+        if len(field) == 2:
+            body += field[1].encode(encoding)
+        else:
+            body += (field[1] + field[2]).encode(encoding)
+            for code, value in field[3]:
+                body += SUBFIELD_DELIMITER
+                body += (code + value).encode(encoding)
+        body += FIELD_TERMINATOR
+        directory += f"{field[0][:3]:0>3}{len(body) - start:04d}{start:05d}".encode("ascii")
+    directory += FIELD_TERMINATOR
+    base_address = LEADER_LENGTH + len(directory)
+    length = base_address + len(body) + 1
+    leader = (leader or "").ljust(LEADER_LENGTH)[:LEADER_LENGTH]
+    leader = f"{length:05d}" + leader[5:10] + "22" + f"{base_address:05d}" + leader[17:20] + "4500"
+    output = bytearray(leader.encode("ascii", errors="replace"))
+    output += directory
+    output += body
+    output += RECORD_TERMINATOR
+    return bytes(output)
+
+# ----------------- Class def -----------------
+
+class ISO2709_Record(object):
+    """ISO2709_Record
+    =======
+    A read-only view over an ISO2709 record.
+    The leader & directory are parsed once on init, fields are only sliced & decoded when requested :
+    the record is never copied as a whole.
+    On init take as arguments :
+    - data {bytes-like} : the record (bytes, bytearray, memoryview, mmap…)
+    - [optional] encoding {str} : the record encoding (defaults to utf-8)"""
+    __slots__ = ("data", "encoding", "leader", "base_address", "directory")
+
+    def __init__(self, data:bytes|bytearray|memoryview, encoding:str="utf-8"):
+        self.data = data if type(data) == memoryview else memoryview(data)
+        self.encoding = encoding
+        self.leader = str(self.data[:LEADER_LENGTH], "ascii", errors="replace")
+        self.base_address = int(self.leader[12:17])
+        # (tag, start, end) of each field content, without its terminator
+        self.directory:List[Tuple[str, int, int]] = []
+        directory = bytes(self.data[LEADER_LENGTH:self.base_address - 1])
+        for pos in range(0, len(directory) - len(directory) % DIRECTORY_ENTRY_LENGTH, DIRECTORY_ENTRY_LENGTH):
+            start = self.base_address + int(directory[pos + 7:pos + 12])
+            end = start + int(directory[pos + 3:pos + 7]) - 1
+            self.directory.append((directory[pos:pos + 3].decode("ascii", errors="replace"), start, end))
+
+    def __len__(self) -> int:
+        return len(self.directory)
+
+    def __iter__(self) -> Iterator[Field_Tuple]:
+        return self.iter_fields()
+
+    def tags(self) -> List[str]:
+        """Returns the tags of all fields as a list, in the record order"""
+        return [entry[0] for entry in self.directory]
+
+    def get_raw(self, tag:str) -> List[memoryview]:
+        """Returns the raw content (without terminator) of all tag fields as a list of memoryview"""
+        return [self.data[start:end] for entry_tag, start, end in self.directory if entry_tag == tag]
+
+    def decode_field(self, index:int) -> Field_Tuple:
+        """Decodes the index-th field of the directory.
+        Returns (tag, value) for controlfields, (tag, ind1, ind2, [(code, value), …]) for datafields"""
+        tag, start, end = self.directory[index]
+        if is_control_tag(tag):
+            return tag, str(self.data[start:end], self.encoding, errors="replace")
+        # Only this field is copied, to split it at C speed
+        parts = self.data[start:end].tobytes().split(SUBFIELD_DELIMITER)
+        indicators = parts[0].decode(self.encoding, errors="replace").ljust(2)
+        subfields = [(part[:1].decode(self.encoding, errors="replace"), part[1:].decode(self.encoding, errors="replace"))
+                        for part in parts[1:] if part]
+        return tag, indicators[0], indicators[1], subfields
+
+    def iter_fields(self, *tags:str) -> Iterator[Field_Tuple]:
+        """Yields the decoded fields with these tags (all fields if none is provided), in the record order"""
+        for index, entry in enumerate(self.directory):
+            if not tags or entry[0] in tags:
+                yield self.decode_field(index)
+
+    def get_subfields(self, tag:str, *codes:str) -> List[str]:
+        """Returns the values of the codes subfields (all if none is provided) of all tag fields as a list"""
+        return [value for field in self.iter_fields(tag) if len(field) == 4
+                    for code, value in field[3] if not codes or code in codes]
+
+    def get_value(self, tag:str, code:str=None) -> str|None:
+        """Returns the first controlfield value, or the first subfield value if code is provided.
+        Returns None if it does not exist"""
+        for field in self.iter_fields(tag):
+            if len(field) == 2:
+                return field[1]
+            for subfield_code, value in field[3]:
+                if subfield_code == code:
+                    return value
+        return None
+
+    def to_bytes(self) -> bytes:
+        """Returns a copy of the record bytes"""
+        return self.data.tobytes()
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+# Streaming reader for multi-record ISO2709 / MARCXML files, feeding KohaRESTAPIClient.bulk_write_biblios
+
+# external imports
+import mmap
+import os
+import xml.etree.ElementTree as ET
+from collections import deque
+from typing import Callable, Iterator, Tuple
+from xml.parsers import expat
+
+# internal imports
+from Koha_REST_API_Client import Content_Type, Record_Schema, validate_content_type
+from Koha_ISO2709 import ISO2709_Record, record_end, WHITESPACES
+from Koha_MARC_Record import MARC_Record, MARC_NS
+
+# marc:record tags, with & without namespace
+RECORD_TAGS = (f"{{{MARC_NS}}}record", "record")
+
+# ----------------- Func def -----------------
+
+def sniff_format(path:str) -> Content_Type:
+    """Returns MARCXML if the file starts with "<" (after whitespaces), else RAW_MARC"""
+    with open(path, mode="rb") as f:
+        start = f.read(1024).lstrip(WHITESPACES + b"\xef\xbb\xbf")
+    if start[:1] == b"<":
+        return Content_Type.MARCXML
+    return Content_Type.RAW_MARC
+
+def iter_iso2709_file(path:str) -> Iterator[Tuple[int, bytes]]:
+    """Yields (byte offset, record bytes) for each record of an ISO2709 file.
+    The file is memory-mapped : only the current record is copied in memory"""
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, mode="rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        size = len(mm)
+        offset = 0
+        while offset < size:
+            # Skips whitespaces between records (trailing new line…)
+            if mm[offset] in WHITESPACES:
+                offset += 1
+                continue
+            end = record_end(mm, offset)
+            yield offset, mm[offset:end]
+            offset = end
+
+def iter_marcxml_file(path:str, chunk_size:int=1024 * 1024) -> Iterator[Tuple[int, ET.Element]]:
+    """Yields (byte offset, marc:record Element) for each record of a MARCXML file (collection or single record).
+    The file is read by chunks with expat : only the records of the current chunk are kept in memory.
+    The offset is the position of the record start tag in the file"""
+    parser = expat.ParserCreate(namespace_separator="}")
+    parser.buffer_text = True
+    ready = deque()
+    state = {"builder":None, "depth":0, "offset":0}
+
+    def qualify(name:str) -> str:
+        # expat gives "uri}local", ET uses "{uri}local"
+        return "{" + name if "}" in name else name
+
+    def start(name, attrs):
+        tag = qualify(name)
+        if state["builder"] is None:
+            if tag not in RECORD_TAGS:
+                return
+            state["builder"] = ET.TreeBuilder()
+            state["offset"] = parser.CurrentByteIndex
+        state["depth"] += 1
+        state["builder"].start(tag, {qualify(key):value for key, value in attrs.items()})
+
+    def end(name):
+        if state["builder"] is None:
+            return
+        state["builder"].end(qualify(name))
+        state["depth"] -= 1
+        if state["depth"] == 0:
+            ready.append((state["offset"], state["builder"].close()))
+            state["builder"] = None
+
+    def data(text):
+        if state["builder"] is not None:
+            state["builder"].data(text)
+
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = data
+    with open(path, mode="rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            parser.Parse(chunk, not chunk)
+            while ready:
+                yield ready.popleft()
+            if not chunk:
+                break
+
+# ----------------- Class def -----------------
+
+class MARC_File_Reader(object):
+    """MARC_File_Reader
+    =======
+    Streams the records of a multi-record ISO2709 or MARCXML file, one at a time, with their byte offset in the file.
+    On init take as arguments :
+    - path {str} : the file
+    - [optional] format {Content_Type} : RAW_MARC or MARCXML (defaults to guessing it from the file content)
+    - [optional] encoding {str} : ISO2709 records encoding (defaults to utf-8)
+    - [optional] chunk_size {int} : bytes read at once in MARCXML files (defaults to 1 MiB)"""
+
+    def __init__(self, path:str, format:Content_Type=None, encoding:str="utf-8", chunk_size:int=1024 * 1024):
+        self.path = path
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self.format = validate_content_type(format, default=False)
+        if self.format not in [Content_Type.RAW_MARC, Content_Type.MARCXML]:
+            self.format = sniff_format(path)
+
+    def __iter__(self) -> Iterator[Tuple[int, bytes]]:
+        return self.iter_raw()
+
+    def iter_raw(self) -> Iterator[Tuple[int, bytes]]:
+        """Yields (byte offset, record bytes in the file format).
+        ISO2709 records are yielded as they are in the file,
+        MARCXML records are serialized on their own (with the MARC21/slim namespace)"""
+        if self.format == Content_Type.RAW_MARC:
+            yield from iter_iso2709_file(self.path)
+        else:
+            for offset, elem in iter_marcxml_file(self.path, self.chunk_size):
+                yield offset, MARC_Record.from_marcxml(elem).to_marcxml()
+
+    def iter_records(self) -> Iterator[Tuple[int, MARC_Record]]:
+        """Yields (byte offset, Koha_MARC_Record.MARC_Record)"""
+        if self.format == Content_Type.RAW_MARC:
+            for offset, data in iter_iso2709_file(self.path):
+                yield offset, MARC_Record.from_iso2709(data, self.encoding)
+        else:
+            for offset, elem in iter_marcxml_file(self.path, self.chunk_size):
+                yield offset, MARC_Record.from_marcxml(elem)
+
+    def iter_bulk_items(self, get_id:Callable[[ISO2709_Record|MARC_Record], str|None]=None, record_schema:Record_Schema=Record_Schema.UNIMARC, framework_id:str=None) -> Iterator[Tuple]:
+        """Yields KohaRESTAPIClient.bulk_write_biblios() items :
+        (biblionumber or None, record bytes, format, record_schema, framework_id).
+        Records are sent in the file format.
+
+        Takes as argument :
+            - [optionnal] get_id {callable} : returns the biblionumber to update from the record, or None to add it.
+            It gets a Koha_ISO2709.ISO2709_Record for ISO2709 files (decoded lazily), a MARC_Record for MARCXML files :
+            both have get_value() & get_subfields(). If not set, all records are added
+            - [optionnal] record_schema {Record_Schema} : defaults to UNIMARC
+            - [optionnal] framework_id {str} : code of the framework ID in Koha"""
+        if self.format == Content_Type.RAW_MARC:
+            for offset, data in iter_iso2709_file(self.path):
+                id = None
+                if get_id is not None:
+                    id = get_id(ISO2709_Record(data, self.encoding))
+                yield id, data, self.format, record_schema, framework_id
+        else:
+            # The record built to serialize it is the one given to get_id : no parse of the serialized bytes
+            for offset, record in self.iter_records():
+                id = None
+                if get_id is not None:
+                    id = get_id(record)
+                yield id, record.to_marcxml(), self.format, record_schema, framework_id
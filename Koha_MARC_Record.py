@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+
+# Compact MARC record model shared by Koha_API_PublicBiblio, Koha_SRU & KohaRESTAPIClient
+
+# external imports
+import json
+import xml.etree.ElementTree as ET
+from enum import Enum
+from typing import Dict, Iterator, List
+
+# internal imports
+from Koha_ISO2709 import ISO2709_Record, encode_iso2709
+# Parsing goes through the backend (lxml if installed),
+# records are always built with xml.etree so to_marcxml() output does not depend on it
+from Koha_XML_Backend import fromstring
+
+MARC_NS = "http://www.loc.gov/MARC21/slim"
+NS = {"marc": MARC_NS}
+
+# Content type values (see Koha_REST_API_Client.Content_Type)
+MARCXML = "application/marcxml+xml"
+MARC_IN_JSON = "application/marc-in-json"
+RAW_MARC = "application/marc"
+
+# ----------------- Func def -----------------
+
+def local_name(tag:str) -> str:
+    """Returns the XML tag without its namespace ("" for lxml comments & processing instructions)"""
+    if not isinstance(tag, str):
+        return ""
+    return tag.rsplit("}", 1)[-1]
+
+def format_value(format:Enum|str) -> str:
+    """Returns the content type as a string, from a Content_Type member or a string"""
+    if isinstance(format, Enum):
+        return format.value
+    return str(format)
+
+# ----------------- Class def -----------------
+
+class MARC_Subfield(object):
+    """MARC_Subfield
+    =======
+    A subfield : code {str} & value {str}"""
+    __slots__ = ("code", "value")
+
+    def __init__(self, code:str, value:str):
+        self.code = code
+        self.value = value
+
+    def __repr__(self) -> str:
+        return f"${self.code}{self.value}"
+
+class MARC_Field(object):
+    """MARC_Field
+    =======
+    A controlfield (value is set, subfields is None)
+    or a datafield (ind1, ind2 & subfields are set, value is None)"""
+    __slots__ = ("tag", "ind1", "ind2", "value", "subfields")
+
+    def __init__(self, tag:str, value:str=None, ind1:str=" ", ind2:str=" ", subfields:List[MARC_Subfield]=None):
+        self.tag = str(tag)
+        if value is not None:
+            self.value = value
+            self.ind1 = None
+            self.ind2 = None
+            self.subfields = None
+        else:
+            self.value = None
+            self.ind1 = ind1 or " "
+            self.ind2 = ind2 or " "
+            self.subfields = subfields if subfields is not None else []
+
+    def __repr__(self) -> str:
+        if self.is_control_field():
+            return f"{self.tag} {self.value}"
+        return f"{self.tag} {self.ind1}{self.ind2}" + "".join(repr(subfield) for subfield in self.subfields)
+
+    def is_control_field(self) -> bool:
+        """Returns True if the field is a controlfield"""
+        return self.subfields is None
+
+    def get_subfields(self, *codes:str) -> List[str]:
+        """Returns the values of the subfields with these codes (all subfields if none is provided) as a list, in the field order"""
+        if self.subfields is None:
+            return []
+        if not codes:
+            return [subfield.value for subfield in self.subfields]
+        return [subfield.value for subfield in self.subfields if subfield.code in codes]
+
+    def get_subfield(self, code:str) -> str|None:
+        """Returns the value of the first subfield with this code, or None"""
+        for subfield in self.subfields or []:
+            if subfield.code == code:
+                return subfield.value
+        return None
+
+    def add_subfield(self, code:str, value:str) -> None:
+        """Appends a subfield to a datafield"""
+        self.subfields.append(MARC_Subfield(code, value))
+
+class MARC_Record(object):
+    """MARC_Record
+    =======
+    A MARC record : leader {str} & fields {list of MARC_Field}, with a tag index.
+    Use from_marcxml(), from_marc_in_json(), from_iso2709() or from_content() to build one,
+    to_marcxml(), to_marc_in_json(), to_iso2709() or to_content() to export it.
+    Modify the fields with add_field() & remove_field() to keep the tag index up to date"""
+    __slots__ = ("leader", "fields", "_index")
+
+    def __init__(self, leader:str=None, fields:List[MARC_Field]=None):
+        self.leader = leader
+        self.fields = []
+        self._index:Dict[str, List[MARC_Field]] = {}
+        for field in fields or []:
+            self.add_field(field)
+
+    def __iter__(self) -> Iterator[MARC_Field]:
+        return iter(self.fields)
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+    def __repr__(self) -> str:
+        return "\n".join([f"LDR {self.leader}"] + [repr(field) for field in self.fields])
+
+    # ---------- Fields access ----------
+
+    def add_field(self, field:MARC_Field) -> None:
+        """Appends a field to the record"""
+        self.fields.append(field)
+        self._index.setdefault(field.tag, []).append(field)
+
+    def remove_field(self, field:MARC_Field) -> None:
+        """Removes this field from the record"""
+        self.fields.remove(field)
+        self._index[field.tag].remove(field)
+        if not self._index[field.tag]:
+            del self._index[field.tag]
+
+    def get_fields(self, *tags:str) -> List[MARC_Field]:
+        """Returns the fields with these tags (all fields if none is provided) as a list, in the record order"""
+        if not tags:
+            return list(self.fields)
+        if len(tags) == 1:
+            return list(self._index.get(tags[0], []))
+        return [field for field in self.fields if field.tag in tags]
+
+    def get_field(self, tag:str) -> MARC_Field|None:
+        """Returns the first field with this tag, or None"""
+        fields = self._index.get(tag)
+        if fields:
+            return fields[0]
+        return None
+
+    def get_subfields(self, tag:str, *codes:str) -> List[str]:
+        """Returns the values of the codes subfields of all tag fields as a list, in the record order"""
+        return [value for field in self._index.get(tag, []) for value in field.get_subfields(*codes)]
+
+    def get_value(self, tag:str, code:str=None) -> str|None:
+        """Returns the first controlfield value, or the first subfield value if code is provided.
+        Returns None if it does not exist"""
+        for field in self._index.get(tag, []):
+            if field.is_control_field():
+                return field.value
+            value = field.get_subfield(code)
+            if value is not None:
+                return value
+        return None
+
+    # ---------- MARCXML ----------
+
+    @classmethod
+    def from_marcxml(cls, xml:ET.Element|bytes|str) -> "MARC_Record":
+        """Builds a record from a marc:record Element, or from a MARCXML string / bytes.
+        If the root is not a record (collection, SRU response…), uses the first record found"""
+        if type(xml) in [bytes, str]:
+            xml = fromstring(xml)
+        if xml.tag not in [f"{{{MARC_NS}}}record", "record"]:
+            found = xml.find(".//marc:record", NS)
+            if found is not None:
+                xml = found
+        record = cls()
+        for elem in xml:
+            name = local_name(elem.tag)
+            if name == "leader":
+                record.leader = elem.text
+            elif name == "controlfield":
+                record.add_field(MARC_Field(elem.get("tag"), value=elem.text or ""))
+            elif name == "datafield":
+                record.add_field(MARC_Field(elem.get("tag"),
+                                            ind1=elem.get("ind1", " "),
+                                            ind2=elem.get("ind2", " "),
+                                            subfields=[MARC_Subfield(subfield.get("code"), subfield.text or "") for subfield in elem]))
+        return record
+
+    def to_marcxml_element(self, qualified:bool=True) -> ET.Element:
+        """Returns the record as a marc:record Element.
+        If qualified is False, tags are not namespaced and the namespace is set as the xmlns attribute of the record
+        (what to_marcxml() serializes)"""
+        ns = f"{{{MARC_NS}}}" if qualified else ""
+        root = ET.Element(f"{ns}record")
+        if not qualified:
+            root.set("xmlns", MARC_NS)
+        if self.leader is not None:
+            ET.SubElement(root, f"{ns}leader").text = self.leader
+        for field in self.fields:
+            if field.is_control_field():
+                ET.SubElement(root, f"{ns}controlfield", tag=field.tag).text = field.value
+            else:
+                datafield = ET.SubElement(root, f"{ns}datafield", tag=field.tag, ind1=field.ind1, ind2=field.ind2)
+                for subfield in field.subfields:
+                    ET.SubElement(datafield, f"{ns}subfield", code=subfield.code).text = subfield.value
+        return root
+
+    def to_marcxml(self) -> bytes:
+        """Returns the record as MARCXML bytes (UTF-8), using MARC21/slim as the default namespace"""
+        return ET.tostring(self.to_marcxml_element(qualified=False), encoding="utf-8")
+
+    # ---------- Marc-in-json ----------
+
+    @classmethod
+    def from_marc_in_json(cls, data:Dict|bytes|str) -> "MARC_Record":
+        """Builds a record from a marc-in-json dict, or from its JSON string / bytes"""
+        if type(data) in [bytes, str]:
+            data = json.loads(data)
+        record = cls(data.get("leader"))
+        for field in data.get("fields", []):
+            for tag, content in field.items():
+                if type(content) == dict:
+                    record.add_field(MARC_Field(tag,
+                                                ind1=content.get("ind1", " "),
+                                                ind2=content.get("ind2", " "),
+                                                subfields=[MARC_Subfield(code, value) for subfield in content.get("subfields", []) for code, value in subfield.items()]))
+                else:
+                    record.add_field(MARC_Field(tag, value=content))
+        return record
+
+    def to_marc_in_json(self) -> Dict:
+        """Returns the record as a marc-in-json dict (use json.dumps to serialize it)"""
+        fields = []
+        for field in self.fields:
+            if field.is_control_field():
+                fields.append({field.tag:field.value})
+            else:
+                fields.append({field.tag:{
+                    "ind1":field.ind1,
+                    "ind2":field.ind2,
+                    "subfields":[{subfield.code:subfield.value} for subfield in field.subfields]
+                }})
+        return {"leader":self.leader, "fields":fields}
+
+    # ---------- ISO2709 ----------
+
+    @classmethod
+    def from_iso2709(cls, data:bytes|memoryview|ISO2709_Record, encoding:str="utf-8") -> "MARC_Record":
+        """Builds a record from ISO2709 bytes, or from a Koha_ISO2709.ISO2709_Record"""
+        if not isinstance(data, ISO2709_Record):
+            data = ISO2709_Record(data, encoding)
+        record = cls(data.leader)
+        for field in data.iter_fields():
+            if len(field) == 2:
+                record.add_field(MARC_Field(field[0], value=field[1]))
+            else:
+                record.add_field(MARC_Field(field[0], ind1=field[1], ind2=field[2],
+                                            subfields=[MARC_Subfield(code, value) for code, value in field[3]]))
+        return record
+
+    def to_iso2709(self, encoding:str="utf-8") -> bytes:
+        """Returns the record as ISO2709 bytes.
+        The record length, base address & entry map of the leader are recomputed"""
+        return encode_iso2709(self.leader, self.__iter_tuples(), encoding)
+
+    def __iter_tuples(self) -> Iterator[tuple]:
+        """Yields the fields as Koha_ISO2709 field tuples"""
+        for field in self.fields:
+            if field.is_control_field():
+                yield field.tag, field.value
+            else:
+                yield field.tag, field.ind1, field.ind2, [(subfield.code, subfield.value) for subfield in field.subfields]
+
+    # ---------- Any format ----------
+
+    @classmethod
+    def from_content(cls, content:bytes|str|Dict, format:Enum|str) -> "MARC_Record":
+        """Builds a record from a Koha response content in MARCXML, MARC_IN_JSON or RAW_MARC
+        (format is a Content_Type member or its value).
+        Raises ValueError for other formats"""
+        format = format_value(format)
+        if format == MARCXML:
+            return cls.from_marcxml(content)
+        elif format == MARC_IN_JSON:
+            return cls.from_marc_in_json(content)
+        elif format == RAW_MARC:
+            if type(content) == str:
+                content = content.encode("utf-8")
+            return cls.from_iso2709(content)
+        raise ValueError(f"Content type not supported : {format}")
+
+    def to_content(self, format:Enum|str) -> bytes:
+        """Returns the record as bytes in MARCXML, MARC_IN_JSON or RAW_MARC
+        (format is a Content_Type member or its value).
+        Raises ValueError for other formats"""
+        format = format_value(format)
+        if format == MARCXML:
+            return self.to_marcxml()
+        elif format == MARC_IN_JSON:
+            return json.dumps(self.to_marc_in_json(), ensure_ascii=False).encode("utf-8")
+        elif format == RAW_MARC:
+            return self.to_iso2709()
+        raise ValueError(f"Content type not supported : {format}")
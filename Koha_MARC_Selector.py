@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+
+# Compiled field-path selectors ("001", "200$a", "210|214$c", "100$a[9:13]"),
+# used by Koha_API_PublicBiblio, Koha_SRU & Koha_Batch_Extract
+
+# external imports
+import heapq
+import re
+import xml.etree.ElementTree as ET
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple
+
+# internal imports
+from Koha_MARC_Record import MARC_Record, MARC_Field, MARC_NS, local_name
+from Koha_ISO2709 import ISO2709_Record, Field_Tuple
+from Koha_XML_Backend import is_element
+
+# tags (alternatives separated by |), optional $ followed by subfield codes, optional [start:stop] slice
+SELECTOR_REGEX = re.compile(r"^(LDR|\w{3}(?:\|\w{3})*)(?:\$(\w+))?(?:\[(-?\d*):(-?\d*)\])?$")
+
+RECORD_TAGS = (f"{{{MARC_NS}}}record", "record")
+
+# ----------------- Func def -----------------
+
+def find_marc_record(elem:ET.Element) -> ET.Element|None:
+    """Returns elem if it is a marc:record, else the first marc:record inside it (SRU record, collection…), or None"""
+    if elem.tag in RECORD_TAGS:
+        return elem
+    return next(elem.iter(RECORD_TAGS[0]), None)
+
+def decode_marc_field(field:MARC_Field) -> Field_Tuple:
+    """Returns a MARC_Field as a field tuple"""
+    if field.is_control_field():
+        return field.tag, field.value
+    return field.tag, field.ind1, field.ind2, [(subfield.code, subfield.value) for subfield in field.subfields]
+
+def decode_element(elem:ET.Element) -> Field_Tuple:
+    """Returns a marc:controlfield / marc:datafield Element as a field tuple"""
+    if local_name(elem.tag) == "controlfield":
+        return elem.get("tag"), elem.text or ""
+    return (elem.get("tag"), elem.get("ind1", " "), elem.get("ind2", " "),
+            [(subfield.get("code"), subfield.text or "") for subfield in elem])
+
+@lru_cache(maxsize=1024)
+def compile_selector(path:str) -> "Selector":
+    """Returns the compiled Selector of a path, compiled once and cached.
+    Raises ValueError if the path is invalid"""
+    return Selector(path)
+
+def select(path:str, record, record_order:bool=True) -> List[str]:
+    """Returns the values of a path in a record as a list (see Selector.values())"""
+    return compile_selector(path).values(record, record_order)
+
+def select_first(path:str, record) -> str|None:
+    """Returns the first value of a path in a record, or None (see Selector.first())"""
+    return compile_selector(path).first(record)
+
+# ----------------- Class def -----------------
+
+class Tag_Index(object):
+    """Tag_Index
+    =======
+    A record indexed by tag in a single walk over its fields.
+    Fields are decoded to field tuples only when their tag is requested, once.
+    On init take as argument :
+    - record : a Koha_MARC_Record.MARC_Record, a Koha_ISO2709.ISO2709_Record
+    or a marc:record ET Element (or an Element containing one, like an SRU record)
+    Raises TypeError if the record is none of them"""
+    __slots__ = ("leader", "_fields", "_decode", "_decoded")
+
+    def __init__(self, record:MARC_Record|ISO2709_Record|ET.Element):
+        self.leader:str|None = None
+        # tag -> [(position in the record, raw field)]
+        self._fields:Dict[str, List[Tuple]] = {}
+        self._decoded:Dict[str, List[Tuple[int, Field_Tuple]]] = {}
+        if isinstance(record, MARC_Record):
+            self.leader = record.leader
+            self._decode:Callable = decode_marc_field
+            for position, field in enumerate(record.fields):
+                self._fields.setdefault(field.tag, []).append((position, field))
+        elif isinstance(record, ISO2709_Record):
+            self.leader = record.leader
+            self._decode = record.decode_field
+            for position, entry in enumerate(record.directory):
+                self._fields.setdefault(entry[0], []).append((position, position))
+        elif is_element(record):
+            self._decode = decode_element
+            record = find_marc_record(record)
+            for position, elem in enumerate(record if record is not None else []):
+                # Only controlfields & datafields have a tag attribute
+                tag = elem.get("tag")
+                if tag is not None:
+                    self._fields.setdefault(tag, []).append((position, elem))
+                elif local_name(elem.tag) == "leader":
+                    self.leader = elem.text
+        else:
+            raise TypeError(f"Can't index a {type(record).__name__}")
+
+    def get(self, tag:str) -> List[Tuple[int, Field_Tuple]]:
+        """Returns the (position, field tuple) of the tag fields as a list, in the record order"""
+        decoded = self._decoded.get(tag)
+        if decoded is None:
+            decoded = [(position, self._decode(raw)) for position, raw in self._fields.get(tag, [])]
+            self._decoded[tag] = decoded
+        return decoded
+
+class Selector(object):
+    """Selector
+    =======
+    A compiled field path :
+    - "001" : controlfield value
+    - "200$a" : values of the $a subfields of all 200 fields. "200$ae" : $a & $e, in the field order
+    - "200" : for a datafield, all its subfields separated by a space
+    - "210|214$c" : values in 210 & 214 fields
+    - "100$a[9:13]" : slice applied to each value
+    - "LDR" : the leader
+    Use compile_selector() to get it, compiled once & cached.
+    On init take as argument :
+    - path {str}
+    Raises ValueError if the path is invalid"""
+    __slots__ = ("path", "tags", "codes", "slice")
+
+    def __init__(self, path:str):
+        self.path = str(path).strip()
+        match = SELECTOR_REGEX.match(self.path)
+        if not match:
+            raise ValueError(f"Invalid selector : {path}")
+        tags, codes, start, stop = match.groups()
+        self.tags = tuple(tags.split("|"))
+        self.codes = tuple(codes) if codes else None
+        self.slice = None
+        if start is not None:
+            self.slice = slice(int(start) if start else None, int(stop) if stop else None)
+
+    def __repr__(self) -> str:
+        return f"Selector({self.path!r})"
+
+    def values(self, record:Tag_Index|MARC_Record|ISO2709_Record|ET.Element, record_order:bool=True) -> List[str]:
+        """Returns the values of this path in a record as a list.
+        Index the record with Tag_Index first to evaluate many selectors on it.
+
+        Takes as argument :
+            - record {Tag_Index, MARC_Record, ISO2709_Record or marc:record Element}
+            - [optionnal] record_order {bool} : with many tags, if False, returns the values of the first tag, then of the second, etc."""
+        index = record if isinstance(record, Tag_Index) else Tag_Index(record)
+        if self.tags[0] == "LDR":
+            values = [index.leader] if index.leader is not None else []
+        else:
+            if len(self.tags) == 1:
+                fields = index.get(self.tags[0])
+            elif record_order:
+                fields = heapq.merge(*[index.get(tag) for tag in self.tags], key=lambda item: item[0])
+            else:
+                fields = [item for tag in self.tags for item in index.get(tag)]
+            values = []
+            for _, field in fields:
+                if len(field) == 2:
+                    values.append(field[1])
+                elif self.codes is None:
+                    values.append(" ".join(value for _, value in field[3]))
+                else:
+                    values += [value for code, value in field[3] if code in self.codes]
+        if self.slice is not None:
+            return [value[self.slice] for value in values]
+        return values
+
+    def first(self, record:Tag_Index|MARC_Record|ISO2709_Record|ET.Element) -> str|None:
+        """Returns the first value of this path in a record, or None"""
+        values = self.values(record)
+        return values[0] if values else None
@@ -0,0 +1,402 @@
+# -*- coding: utf-8 -*-
+
+# Coded for Koha 23.11
+# asyncio version of Koha_REST_API_Client, requires aiohttp
+
+# external imports
+import asyncio
+import logging
+import json
+import time
+import aiohttp
+from typing import AsyncIterator, Dict, Iterable, Tuple
+
+# internal imports
+from Koha_Retry import Retry_Policy
+from Koha_MARC_Record import MARC_Record
+from Koha_REST_API_Client import TOKEN_RETRY_DELAY, Content_Type, Record_Schema, Errors, Status, Api_Name, validate_bibnb, validate_int, validate_content_type, validate_post_biblio, add_to_dict_if_inexistent
+
+# Default total timeout in seconds
+DEFAULT_TIMEOUT = 60
+
+# ----------------- Class def -----------------
+
+class AsyncKohaRESTAPIClient(object):
+    """AsyncKohaRESTAPIClient
+    =======
+    Same functions as KohaRESTAPIClient, as coroutines
+    On init take as arguments :
+    - koha_url : Koha server URL
+    - client_id
+    - client_secret
+    - service [opt] : service name
+    - max_concurrency [opt] : maximum number of requests in flight at once (defaults to 10)
+    - limit_per_host [opt] : maximum number of connections to Koha (defaults to max_concurrency)
+    - timeout [opt] : total timeout of a request in seconds (defaults to DEFAULT_TIMEOUT)
+    - token_refresh_margin [opt] : the token is refreshed this many seconds before it expires (defaults to 60)
+    - retry_policy [opt] : a Koha_Retry.Retry_Policy for transient errors (defaults to Retry_Policy())
+
+No request is sent on init : use the client as an async context manager,
+or await open() then close() :
+
+    async with AsyncKohaRESTAPIClient(url, id, secret) as koha:
+        record = await koha.get_biblio("1")
+"""
+    def __init__(self, koha_url, client_id, client_secret, service='AsyncKohaRESTAPIClient', max_concurrency:int=10, limit_per_host:int=None, timeout:float=DEFAULT_TIMEOUT, token_refresh_margin:int=60, retry_policy:Retry_Policy=None):
+        self.service = service
+        self.logger = logging.getLogger(service)
+        self.endpoint = str(koha_url).rstrip("/") + "/api/v1/"
+        self.error:Errors = None
+        self.error_msg:str = None
+        self.status:Status = Status.UNKNOWN
+        self.max_concurrency = max(validate_int(max_concurrency, default=10), 1)
+        self.limit_per_host = validate_int(limit_per_host, default=self.max_concurrency)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retry_policy = retry_policy if retry_policy is not None else Retry_Policy()
+        self.session:aiohttp.ClientSession = None
+        self.__semaphore:asyncio.Semaphore = None
+
+        # OAuth token lifecycle
+        self.__client_id = client_id
+        self.__client_secret = client_secret
+        self.token:Dict = None
+        self.token_expires_at:float = 0
+        self.token_refresh_margin = validate_int(token_refresh_margin, default=60)
+        self.__token_lock:asyncio.Lock = None
+        # Why the last token request failed, and when a new one can be sent
+        self.__token_error_msg:str = None
+        self.__token_retry_at:float = 0
+
+    # ---------- Session methods ----------
+
+    async def open(self) -> Status:
+        """Creates the shared connector & session, then gets a token.
+        Returns the client status"""
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.limit_per_host, limit_per_host=self.limit_per_host)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self.__semaphore = asyncio.Semaphore(self.max_concurrency)
+            self.__token_lock = asyncio.Lock()
+        await self.__get_token(init=True)
+        return self.status
+
+    async def close(self) -> None:
+        """Closes the session and all its pooled connections"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    # ---------- Token methods ----------
+
+    async def __get_token(self, init:bool=False) -> bool:
+        """Requests a new client_credentials token and stores it with its expiry date.
+        Returns True if the token was retrieved.
+        Only the init request sets status, error & error_msg : a failed refresh leaves them as they are"""
+        service = "AsyncKohaRESTAPIClient_Init" if init else self.service
+        url = self.endpoint + "oauth/token"
+        try:
+            # Asking for a token has no side effect, it can always be retried
+            status, content = await self.__send_with_retry("POST", url, {},
+                            data={
+                                "grant_type": "client_credentials",
+                                "client_id": self.__client_id,
+                                "client_secret": self.__client_secret
+                            },
+                            idempotent=True
+                        )
+        # Error managing
+        except (aiohttp.ClientError, asyncio.TimeoutError) as generic_error:
+            error = Errors.GENERIC_REQUEST_ERROR
+            self.logger.error(f"{service} :: Generic exception || URL : {url} || Reason : {generic_error!r}")
+            error_msg = f"Generic exception : {generic_error!r}"
+        else:
+            if status < 400:
+                # Access authorized
+                token = json.loads(content)
+                # Store token & its expiry date (Koha defaults to 3600s)
+                self.token_expires_at = time.monotonic() + validate_int(token.get("expires_in"), default=3600)
+                self.token = token
+                self.__token_error_msg = None
+                if init:
+                    self.status = Status.SUCCESS
+                    self.error = None
+                    self.error_msg = None
+                    self.logger.info(f"{service} :: Access authorized")
+                else:
+                    self.logger.debug(f"{service} :: Token refreshed")
+                return True
+            error = Errors.HTTP_ERROR
+            self.logger.error(f"{service} :: HTTP Status : {status} || Method : POST || URL : {url} || Reason : {content.decode(errors='replace')}")
+            error_msg = f"HTTP Status {status}"
+        self.__token_error_msg = f"{error.name} : {error_msg}"
+        if init:
+            self.status = Status.ERROR
+            self.error = error
+            self.error_msg = error_msg
+        return False
+
+    async def refresh_token(self, stale_token:Dict=None) -> Dict:
+        """Refreshes the token, only one coroutine at a time.
+        If another coroutine already replaced stale_token with a token that is not about to expire,
+        does not request a new one.
+        Returns the new token, or None if the refresh failed.
+        After a failure, no token is requested for TOKEN_RETRY_DELAY seconds : None is returned at once"""
+        async with self.__token_lock:
+            if self.token is not None and self.token is not stale_token and not self.token_expires_soon():
+                return self.token
+            if time.monotonic() < self.__token_retry_at:
+                return None
+            if await self.__get_token():
+                return self.token
+            self.__token_retry_at = time.monotonic() + TOKEN_RETRY_DELAY
+            return None
+
+    def token_expires_soon(self) -> bool:
+        """Returns True if the token expires in less than token_refresh_margin seconds"""
+        return time.monotonic() >= self.token_expires_at - self.token_refresh_margin
+
+    def __authorization(self, token:Dict|None) -> str:
+        """Returns the Authorization header value of a token.
+        Raises aiohttp.ClientError if no token could be retrieved,
+        so API methods return an Errors element like for any other failed request"""
+        if token is None:
+            raise aiohttp.ClientError(f"No access token ({self.__token_error_msg or 'unknown error'})")
+        return f"{token['token_type']} {token['access_token']}"
+
+    async def __send(self, method:str, url:str, headers:Dict, **kwargs) -> Tuple[int, bytes]:
+        """Sends an authenticated request through the session.
+        Returns the (HTTP status, content) tuple.
+        Transient errors are retried according to the retry policy.
+        If Koha answers 401, refreshes the token and retries the request once.
+        If that refresh fails, raises aiohttp.ClientError instead of sending the rejected token again"""
+        token = self.token
+        if token is None or self.token_expires_soon():
+            refreshed = await self.refresh_token(token)
+            # If the refresh failed, the current token is used until it actually expires
+            if refreshed is not None or token is None or time.monotonic() >= self.token_expires_at:
+                token = refreshed
+        for attempt in range(2):
+            headers["Authorization"] = self.__authorization(token)
+            status, content = await self.__send_with_retry(method, url, headers, **kwargs)
+            if status != 401 or attempt > 0:
+                break
+            self.logger.debug(f"{self.service} :: HTTP 401 on {method} {url}, refreshing token then retrying")
+            token = await self.refresh_token(token)
+        return status, content
+
+    async def __send_with_retry(self, method:str, url:str, headers:Dict, idempotent:bool=None, **kwargs) -> Tuple[int, bytes]:
+        """Sends the request, retrying it according to the retry policy.
+        Each attempt holds the semaphore only while the request is in flight, not while waiting before a retry.
+        Returns the (HTTP status, content) tuple, raises the last exception if the last attempt raised one"""
+        policy = self.retry_policy
+        if idempotent is not None:
+            method_kind = "GET" if idempotent else "POST"
+        else:
+            method_kind = method
+        attempt = 1
+        while True:
+            try:
+                async with self.__semaphore:
+                    async with self.session.request(method, url, headers=headers, **kwargs) as r:
+                        content = await r.read()
+                        status = r.status
+                        retry_after = r.headers.get("Retry-After")
+            # Could not connect : the request was not sent
+            except aiohttp.ClientConnectorError as error:
+                if attempt >= policy.max_attempts:
+                    raise
+                wait = policy.wait_time(attempt)
+                reason = repr(error)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                if attempt >= policy.max_attempts or not policy.is_idempotent(method_kind):
+                    raise
+                wait = policy.wait_time(attempt)
+                reason = repr(error)
+            else:
+                if attempt >= policy.max_attempts or not policy.should_retry_status(method_kind, status):
+                    return status, content
+                wait = policy.wait_time(attempt, retry_after)
+                reason = f"HTTP Status {status}"
+            self.logger.warning(f"{self.service} :: {reason} on {method} {url}, attempt {attempt}/{policy.max_attempts}, retrying in {wait:.2f}s")
+            await asyncio.sleep(wait)
+            attempt += 1
+
+    async def __request(self, api:Api_Name, method:str, url:str, headers:Dict, not_found:Errors=Errors.GENERIC_REQUEST_ERROR, **kwargs) -> bytes|Errors:
+        """Sends the request and handles errors like KohaRESTAPIClient.
+        Returns the response content, or an Errors element"""
+        try:
+            status, content = await self.__send(method, url, headers, **kwargs)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as generic_error:
+            self.logger.error(f"{self.service} :: {api.name} Generic exception. Method : {method} || URL : {url} || Reason : {generic_error!r}")
+            return Errors.GENERIC_REQUEST_ERROR
+        if status >= 400:
+            self.logger.error(f"{self.service} :: {api.name} Generic exception. HTTP Status : {status} || Method : {method} || URL : {url} || Reason : {content.decode(errors='replace')}")
+            if status == 404:
+                return not_found
+            return Errors.GENERIC_REQUEST_ERROR
+        return content
+
+    # ---------- API methods ----------
+
+    # ----- Authorities -----
+    async def get_auth(self, id:str, format:Content_Type=Content_Type.RAW_MARC) -> bytes|Errors:
+        """Returns the authority record WITHOUT decoding it.
+        If an error occurred, returns an Errors element"""
+        # Checks if the provided ID is a number
+        api = Api_Name.GET_AUTH
+        auth_id = validate_bibnb(id)
+        # Leaves if not
+        if auth_id == None:
+            self.logger.error(f"{self.service} :: {api.name} Invalid input authority ID ({id})")
+            return Errors.INVALID_AUTH_ID
+        # Checks if content-type is correct
+        content_type = validate_content_type(format)
+
+        headers = {"accept":content_type.value}
+        content = await self.__request(api, "GET", f"{self.endpoint}authorities/{auth_id}", headers, not_found=Errors.AUTHORIRY_DOES_NOT_EXIST)
+        if type(content) != Errors:
+            self.logger.debug(f"{self.service} :: {api.name} Authority {id} retrieved")
+        return content
+
+    async def get_auths(self, ids:Iterable[str], format:Content_Type=Content_Type.RAW_MARC) -> AsyncIterator[Tuple[str, bytes|Errors]]:
+        """Fetches many authority records concurrently (up to max_concurrency), WITHOUT decoding them.
+        Yields (id, record or Errors element) tuples as requests finish"""
+        async for output in self.__fetch_many(self.get_auth, ids, format):
+            yield output
+
+    async def list_auth(self, query:Dict={}, format:Content_Type=Content_Type.RAW_MARC, page:int=1, nb_res:int=40, auth_type:str=None) -> bytes|Errors:
+        """Returns a list of authorities WITHOUT decoding them.
+        If an error occurred, returns an Errors element
+
+        If an authority type is provided in the query, will use this one"""
+        api = Api_Name.GET_AUTH_LIST
+        # Checks if content-type is correct
+        content_type = validate_content_type(format)
+        page = validate_int(page, default=1)
+        nb_res = validate_int(nb_res, default=1)
+
+        headers = {"accept":content_type.value}
+        params = {
+            "_page":page,
+            "_per_page":nb_res
+        }
+        data = {}
+        # If query is a dict, use it as body
+        if type(query) == dict:
+            data = dict(query)
+        # If an auth type is provided and none was provided in the query, adds it
+        if auth_type:
+            add_to_dict_if_inexistent(data, "framework_id", str(auth_type))
+        content = await self.__request(api, "GET", f"{self.endpoint}authorities", headers, data=data, params=params)
+        if type(content) != Errors:
+            self.logger.debug(f"{self.service} :: {api.name} Authority list retrieved")
+        return content
+
+    # ----- Biblios -----
+
+    async def get_biblio(self, id:str, format:Content_Type=Content_Type.RAW_MARC) -> bytes|Errors:
+        """Returns the record WITHOUT decoding it.
+        If an error occurred, returns an Errors element"""
+        # Checks if the provided ID is a number
+        api = Api_Name.GET_BIBLIO
+        bibnb = validate_bibnb(id)
+        # Leaves if not
+        if bibnb == None:
+            self.logger.error(f"{self.service} :: {api.name} Invalid input biblionumber ({id})")
+            return Errors.INVALID_BIBNB
+        # Checks if content-type is correct
+        content_type = validate_content_type(format)
+
+        headers = {"accept":content_type.value}
+        content = await self.__request(api, "GET", f"{self.endpoint}biblios/{bibnb}", headers, not_found=Errors.RECORD_DOES_NOT_EXIST)
+        if type(content) != Errors:
+            self.logger.debug(f"{self.service} :: {api.name} Record {id} retrieved")
+        return content
+
+    async def get_biblios(self, ids:Iterable[str], format:Content_Type=Content_Type.RAW_MARC) -> AsyncIterator[Tuple[str, bytes|Errors]]:
+        """Fetches many records concurrently (up to max_concurrency), WITHOUT decoding them.
+        Yields (biblionumber, record or Errors element) tuples as requests finish"""
+        async for output in self.__fetch_many(self.get_biblio, ids, format):
+            yield output
+
+    async def __post_biblio(self, api:Api_Name, record:str|MARC_Record, format:Content_Type=Content_Type.RAW_MARC, record_schema:Record_Schema=Record_Schema.UNIMARC, framework_id:str=None, id:str=None) -> bytes|Errors:
+        """Private function for add & update biblio.
+        Returns the API repsonse content (or an error)
+        Takes the same arguments as KohaRESTAPIClient.__post_biblio"""
+        # Check the parameters
+        validated = validate_post_biblio(api, format, record_schema, id)
+        if type(validated) == Errors:
+            if validated == Errors.INVALID_BIBNB:
+                self.logger.error(f"{self.service} :: UPDATE_BIBLIO Invalid input biblionumber ({id})")
+            return validated
+        api, content_type, record_schema, bibnb = validated
+
+        headers = {
+            "Content-type":content_type.value,
+            "x-record-schema":record_schema.value
+        }
+        # Add framework id if set
+        if framework_id:
+            headers["x-framework-id"] = framework_id
+        if isinstance(record, MARC_Record):
+            record = record.to_content(content_type)
+        url = f"{self.endpoint}biblios"
+        method = "POST"
+        if api == Api_Name.UPDATE_BIBLIO:
+            url = url + f"/{bibnb}"
+            method = "PUT"
+        content = await self.__request(api, method, url, headers, not_found=Errors.RECORD_DOES_NOT_EXIST, data=record)
+        if type(content) != Errors:
+            if api == Api_Name.UPDATE_BIBLIO:
+                self.logger.debug(f"{self.service} :: {api.name} Record {id} updated")
+            else:
+                self.logger.debug(f"{self.service} :: {api.name} Record added")
+        return content
+
+    async def add_biblio(self, record:str|MARC_Record, format:Content_Type=Content_Type.RAW_MARC, record_schema:Record_Schema=Record_Schema.UNIMARC, framework_id:str=None) -> bytes|Errors:
+        """Add a new biblio record to Koha
+        Returns the API repsonse content (or an error)
+        Takes the same arguments as KohaRESTAPIClient.add_biblio"""
+        return await self.__post_biblio(Api_Name.ADD_BIBLIO, record=record, format=format, record_schema=record_schema, framework_id=framework_id)
+
+    async def update_biblio(self, id:str, record:str|MARC_Record, format:Content_Type=Content_Type.RAW_MARC, record_schema:Record_Schema=Record_Schema.UNIMARC, framework_id:str=None) -> bytes|Errors:
+        """Update a biblio record in Koha
+        Returns the API repsonse content (or an error)
+        Takes the same arguments as KohaRESTAPIClient.update_biblio"""
+        return await self.__post_biblio(Api_Name.UPDATE_BIBLIO, record=record, format=format, record_schema=record_schema, framework_id=framework_id, id=id)
+
+    async def __fetch_many(self, method, ids:Iterable[str], format:Content_Type) -> AsyncIterator[Tuple[str, bytes|Errors]]:
+        """Private function for get_biblios & get_auths.
+        Never has more than 2 * max_concurrency ids scheduled at once, so ids can be a lazy iterable.
+        The semaphore in __send_with_retry limits the number of requests in flight"""
+        async def fetch(id):
+            return id, await method(id, format)
+        ids = iter(ids)
+        max_pending = 2 * self.max_concurrency
+        pending = set()
+        try:
+            exhausted = False
+            while True:
+                # Fill the window
+                while not exhausted and len(pending) < max_pending:
+                    try:
+                        id = next(ids)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.add(asyncio.ensure_future(fetch(id)))
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
@@ -6,19 +6,32 @@
 import logging
 import json
 import requests
+from requests.adapters import HTTPAdapter
+import io
 import re
+import threading
+import time
 import urllib.parse
-import xml.etree.ElementTree as ET
-from typing import Dict, List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterable, Iterator, List, TextIO, Tuple
 from enum import Enum
 
+# internal imports
+from Koha_Retry import Retry_Policy
+from Koha_Rate_Limiter import Rate_Limiter
+from Koha_MARC_Record import MARC_Record
+from Koha_Cache import LRU_Cache, Record_Cache, cache_key, MISSING
+from Koha_Single_Flight import Single_Flight
+from Koha_XML_Backend import iterparse, tostring
+
 
 NS = {"marc": "http://www.loc.gov/MARC21/slim"}
 
-# ↓ Tf ?
-# Ensuite, faire les appels
-# Token expire après 3600, check sa validité + relancer un get token si nécessaire
-# ya moyen qu'après un call les inforamtions du tokken sont renvoyés
+# Default (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (10, 60)
+# Seconds without asking for a new token after a failed refresh
+TOKEN_RETRY_DELAY = 5
 
 # ----------------- Enum def -----------------
 
@@ -134,14 +147,186 @@ def validate_api_name(api:Api_Name|str) -> Api_Name|None:
     else:
         return None
 
+def validate_post_biblio(api:Api_Name|str, format:Content_Type|str, record_schema:Record_Schema|str, id:str=None) -> Tuple[Api_Name, Content_Type, Record_Schema, str|None]|Errors:
+    """Checks the parameters of an add or update biblio request.
+    Returns a (Api_Name, Content_Type, Record_Schema, biblionumber) tuple,
+    or an Errors element if a parameter is invalid.
+    The biblionumber is only checked for UPDATE_BIBLIO, else it is None"""
+    # Check if the api name is correct : if not, return an error
+    api = validate_api_name(api)
+    if api == None or api not in [
+        Api_Name.ADD_BIBLIO,
+        Api_Name.UPDATE_BIBLIO
+        ]:
+        return Errors.API_NOT_SUPPORTED
+    
+    # Check if the content type is correct : if not, return an error
+    content_type = validate_content_type(format, default=False)
+    if content_type == None or content_type in [
+        Content_Type.JSON,
+        Content_Type.RAW_TEXT
+        ]:
+        return Errors.CONTENT_TYPE_NOT_SUPPORTED
+    
+    # Check if the record chema is correct : if not, return an error
+    record_schema = validate_record_schema(record_schema, default=False)
+    if record_schema == None:
+        return Errors.RECORD_SCHEMA_NOT_SUPPORTED
+
+    # If update, validate the biblionumber
+    bibnb = None
+    if api == Api_Name.UPDATE_BIBLIO:
+        bibnb = validate_bibnb(id)
+        # Leaves if not
+        if bibnb == None:
+            return Errors.INVALID_BIBNB
+
+    return api, content_type, record_schema, bibnb
+
 def add_to_dict_if_inexistent(dict:dict, key:str, value:None) -> None:
     """Checks if this key is already defined in the dict.
     If not, adds it and the value, else, does nothing"""
     if not key in dict:
         dict[key] = value
 
+def bounded_map(func:Callable, items:Iterable, max_workers:int=4, ordered:bool=False, max_pending:int=None, drain:Callable=None) -> Iterator[Tuple]:
+    """Calls func on each item using a thread pool and yields (item, result) tuples.
+    Never has more than max_pending items submitted at once, so items can be a lazy iterable.
+    If the generator is closed early, calls already running are waited for, those not started are cancelled.
+
+    Takes as argument :
+        - func {callable} : function taking one item
+        - items {iterable} : the items
+        - [optionnal] max_workers {int} : number of threads (defaults to 4)
+        - [optionnal] ordered {bool} : if True, yields results in input order, else as they finish (default)
+        - [optionnal] max_pending {int} : maximum number of submitted items not yet yielded (defaults to 2 * max_workers)
+        - [optionnal] drain {callable} : called with (item, result) for each call that finished but was not yielded
+        because the generator was closed early"""
+    max_workers = max(validate_int(max_workers, default=4), 1)
+    max_pending = max(validate_int(max_pending, default=2 * max_workers), max_workers)
+    items = iter(items)
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        exhausted = False
+        while True:
+            # Fill the window
+            while not exhausted and len(pending) < max_pending:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.append((item, executor.submit(func, item)))
+            if not pending:
+                break
+            # Yield the oldest in ordered mode, the first finished otherwise
+            if ordered:
+                item, future = pending.popleft()
+                yield item, future.result()
+            else:
+                done, _ = wait([future for _, future in pending], return_when=FIRST_COMPLETED)
+                for entry in [entry for entry in pending if entry[1] in done]:
+                    pending.remove(entry)
+                    yield entry[0], entry[1].result()
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        if drain is not None:
+            for item, future in pending:
+                if not future.cancelled() and future.exception() is None:
+                    drain(item, future.result())
+
+def has_next_page(r:requests.Response, page:int, per_page:int) -> bool|None:
+    """Checks if a paginated Koha response has a next page, using the Link header, then the X-Total-Count header.
+    Returns None if the response has neither"""
+    if r.headers.get("Link"):
+        return "next" in r.links
+    total = validate_int(r.headers.get("X-Total-Count"), default=-1)
+    if total >= 0:
+        return page * per_page < total
+    return None
+
+def split_records(content:bytes, format:Content_Type) -> List[Dict|bytes]:
+    """Splits the content of a list of records into individual records.
+    Returns a list of dict for JSON & MARC_IN_JSON, of bytes for MARCXML & RAW_MARC"""
+    if not content:
+        return []
+    if format in [Content_Type.JSON, Content_Type.MARC_IN_JSON]:
+        records = json.loads(content)
+        if type(records) == dict:
+            return [records]
+        return records
+    elif format == Content_Type.MARCXML:
+        output = []
+        for _, elem in iterparse(io.BytesIO(content), tags=(f"{{{NS['marc']}}}record",)):
+            if elem.tag == f"{{{NS['marc']}}}record":
+                output.append(tostring(elem))
+                elem.clear()
+        return output
+    elif format == Content_Type.RAW_MARC:
+        # Each ISO2709 record ends with the record terminator
+        return [record + b"\x1d" for record in content.split(b"\x1d") if record.strip()]
+    return [content]
+
+def write_journal_entry(journal_file:TextIO, result:"Bulk_Write_Result") -> None:
+    """Appends a Bulk_Write_Result as a JSON line to an open bulk write journal (see read_journal())"""
+    journal_file.write(json.dumps(result.to_dict(), ensure_ascii=False) + "\n")
+    journal_file.flush()
+
+def read_journal(path:str, status:Status|None=Status.ERROR) -> List[Dict]:
+    """Reads a bulk write journal and returns its entries as a list of dict.
+    Use it to find which input items must be replayed.
+
+    Takes as argument :
+        - path {str} : the journal file
+        - [optionnal] status {Status} : only returns entries with this status (defaults to ERROR).
+        If None, returns all entries"""
+    output = []
+    with open(path, mode="r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if status is None or entry["status"] == status.name:
+                output.append(entry)
+    return output
+
 # ----------------- Class def -----------------
 
+class Bulk_Write_Result(object):
+    """Bulk_Write_Result
+    =======
+    The outcome of one item of KohaRESTAPIClient.bulk_write_biblios()
+    - index {int} : position of the item in the input
+    - id {str} : the biblionumber provided in the item (None for an add)
+    - api {Api_Name} : ADD_BIBLIO or UPDATE_BIBLIO
+    - status {Status} : SUCCESS or ERROR
+    - response {bytes or Errors} : the Koha response content, or an Errors element
+    - latency {float} : seconds spent on the item"""
+    def __init__(self, index:int, id:str|None, api:Api_Name, response:bytes|Errors, latency:float):
+        self.index = index
+        self.id = id
+        self.api = api
+        self.response = response
+        self.latency = latency
+        self.status = Status.ERROR if type(response) == Errors else Status.SUCCESS
+
+    def to_dict(self) -> Dict:
+        """Returns the result as a JSON serializable dict"""
+        response = self.response
+        if type(response) == Errors:
+            response = response.name
+        elif type(response) == bytes:
+            response = response.decode("utf-8", errors="replace")
+        return {
+            "index":self.index,
+            "id":self.id,
+            "api":self.api.name,
+            "status":self.status.name,
+            "response":response,
+            "latency":round(self.latency, 6)
+        }
+
 class KohaRESTAPIClient(object):
     """KohaRESTAPIClient
     =======
@@ -151,49 +336,255 @@ class KohaRESTAPIClient(object):
     - client_id
     - client_secret
     - service [opt] : service name
+    - pool_connections [opt] : number of connection pools to cache (defaults to 10)
+    - pool_maxsize [opt] : maximum number of connections kept alive per host (defaults to 10).
+    Should be at least the number of threads sharing the client
+    - timeout [opt] : requests timeout in seconds, either a float or a (connect, read) tuple
+    (defaults to DEFAULT_TIMEOUT)
+    - token_refresh_margin [opt] : the token is refreshed this many seconds before it expires (defaults to 60)
+    - retry_policy [opt] : a Koha_Retry.Retry_Policy for transient errors (defaults to Retry_Policy()).
+    add_biblio is not retried once it reached Koha, unless the policy allows non idempotent retries
+    - rate_limiter [opt] : a Koha_Rate_Limiter.Rate_Limiter adapting the request rate & concurrency to Koha's health.
+    Share the same instance between clients talking to the same server
+    - cache [opt] : a Koha_Cache.Record_Cache used by get_biblio & get_auth.
+    Updated records are removed from the cache
+    - memory_cache [opt] : a Koha_Cache.LRU_Cache used by get_biblio & get_auth, checked before cache.
+    Updated records are removed from the cache
+    - coalesce_requests [opt] : if True (default), concurrent get_biblio / get_auth calls for the same record & format
+    share a single request
+
+All requests go through a single keep-alive requests.Session, shared by every thread using the client.
+Use the client as a context manager (or call close()) to release the connections.
+The OAuth token is refreshed shortly before it expires, and requests answered with a 401 are retried once after a refresh.
+If a refresh fails, the request returns an Errors element and no new token is requested for TOKEN_RETRY_DELAY seconds.
+status, error & error_msg only describe the init authentication.
 """
-    def __init__(self, koha_url, client_id, client_secret, service='KohaRESTAPIClient'):
+    def __init__(self, koha_url, client_id, client_secret, service='KohaRESTAPIClient', pool_connections:int=10, pool_maxsize:int=10, timeout:float|tuple=DEFAULT_TIMEOUT, token_refresh_margin:int=60, retry_policy:Retry_Policy=None, rate_limiter:Rate_Limiter=None, cache:Record_Cache=None, memory_cache:LRU_Cache=None, coalesce_requests:bool=True):
         self.service = service
         self.init_logger()
         self.endpoint = str(koha_url).rstrip("/") + "/api/v1/"
         self.error:Errors = None
         self.error_msg:str = None
         self.status:Status = Status.UNKNOWN
+        self.timeout = timeout
+        self.retry_policy = retry_policy if retry_policy is not None else Retry_Policy()
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.memory_cache = memory_cache
+        self.single_flight = Single_Flight() if coalesce_requests else None
+        # Incremented by each invalidation of a record URL : a fetch started before it must not fill the caches
+        self.__generations:Dict[str, int] = {}
+        self.__generations_lock = threading.Lock()
+
+        # Pooled keep-alive session
+        self.session = requests.Session()
+        self.pool_maxsize = validate_int(pool_maxsize, default=10)
+        adapter = HTTPAdapter(pool_connections=validate_int(pool_connections, default=10),
+                            pool_maxsize=self.pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # OAuth token lifecycle
+        self.__client_id = client_id
+        self.__client_secret = client_secret
+        self.token:Dict = None
+        self.token_expires_at:float = 0
+        self.token_refresh_margin = validate_int(token_refresh_margin, default=60)
+        self.__token_lock = threading.Lock()
+        # Why the last token request failed, and when a new one can be sent
+        self.__token_error_msg:str = None
+        self.__token_retry_at:float = 0
 
         # Try authentification
+        self.__get_token(init=True)
+
+    # ---------- Token methods ----------
+
+    def __get_token(self, init:bool=False) -> bool:
+        """Requests a new client_credentials token and stores it with its expiry date.
+        Returns True if the token was retrieved.
+        Only the init request sets status, error & error_msg : a failed refresh leaves them as they are
+
+        Takes as argument :
+            - [optionnal, default to False] init : if True, logs as 'KohaRESTAPIClient_Init' & sets the client status"""
+        # Stays None if no response was received (timeout, connection error…)
+        r = None
         try:
-            r = requests.request(method="POST", url=self.endpoint + "oauth/token",
+            # Asking for a token has no side effect, it can always be retried
+            r = self.retry_policy.send(lambda: self.__session_request("POST", self.endpoint + "oauth/token",
                             data={
                                 "grant_type": "client_credentials",
-                                "client_id": client_id,
-                                "client_secret": client_secret
+                                "client_id": self.__client_id,
+                                "client_secret": self.__client_secret
                             }
-                        )
+                        ), logger=self.log.logger, idempotent=True)
             r.raise_for_status()
         # Error managing
         except requests.exceptions.HTTPError:
-            self.status = Status.ERROR
-            self.error = Errors.HTTP_ERROR
-            self.log.http_error(r, init=True)
-            self.error_msg = r.reason
+            error = Errors.HTTP_ERROR
+            self.log.http_error(r, init=init)
+            error_msg = r.reason
         except requests.exceptions.RequestException as generic_error:
-            try:
-                self.status = Status.ERROR
-                self.error = Errors.GENERIC_REQUEST_ERROR
-                self.log.request_generic_error(r, generic_error, msg="Generic exception", init=True)
-                self.error_msg = f"Generic exception : {r.reason}"
-            except NameError as e:
-                self.status = Status.ERROR
-                self.error = Errors.GENERIC_REQUEST_ERROR_INTO_NAME_ERROR
-                self.log.generic_error(e, msg="Generic exception then NameError", init=True)
-                self.error_msg = e
+            error = Errors.GENERIC_REQUEST_ERROR
+            self.log.request_generic_error(r, generic_error, msg="Generic exception", init=init)
+            error_msg = f"Generic exception : {r.reason if r is not None else generic_error}"
         # Access authorized
         else:
             token = json.loads(r.content)
-            # Store token 
+            # Store token & its expiry date (Koha defaults to 3600s)
+            self.token_expires_at = time.monotonic() + validate_int(token.get("expires_in"), default=3600)
             self.token = token
-            self.status = Status.SUCCESS
-            self.log.info(f"{self.log.init_name} :: Access authorized")
+            self.__token_error_msg = None
+            if init:
+                self.status = Status.SUCCESS
+                self.error = None
+                self.error_msg = None
+                self.log.info(f"{self.log.init_name} :: Access authorized")
+            else:
+                self.log.debug("Token refreshed")
+            return True
+        self.__token_error_msg = f"{error.name} : {error_msg}"
+        if init:
+            self.status = Status.ERROR
+            self.error = error
+            self.error_msg = error_msg
+        return False
+
+    def refresh_token(self, stale_token:Dict=None) -> Dict:
+        """Refreshes the token, only one thread at a time.
+        If another thread already replaced stale_token with a token that is not about to expire,
+        does not request a new one.
+        Returns the new token, or None if the refresh failed.
+        After a failure, no token is requested for TOKEN_RETRY_DELAY seconds : None is returned at once
+
+        Takes as argument :
+            - [optionnal] stale_token {dict} : the token the caller considers invalid"""
+        with self.__token_lock:
+            if self.token is not None and self.token is not stale_token and not self.token_expires_soon():
+                return self.token
+            if time.monotonic() < self.__token_retry_at:
+                return None
+            if self.__get_token():
+                return self.token
+            self.__token_retry_at = time.monotonic() + TOKEN_RETRY_DELAY
+            return None
+
+    def token_expires_soon(self) -> bool:
+        """Returns True if the token expires in less than token_refresh_margin seconds"""
+        return time.monotonic() >= self.token_expires_at - self.token_refresh_margin
+
+    def __valid_token(self) -> Dict|None:
+        """Returns the current token, refreshing it first if it is about to expire.
+        If the refresh failed, returns the current token until it actually expires, then None"""
+        token = self.token
+        if token is None or self.token_expires_soon():
+            refreshed = self.refresh_token(token)
+            if refreshed is not None:
+                return refreshed
+            if token is None or time.monotonic() >= self.token_expires_at:
+                return None
+        return token
+
+    def __authorization(self, token:Dict|None) -> str:
+        """Returns the Authorization header value of a token.
+        Raises requests.exceptions.RequestException if no token could be retrieved,
+        so API methods return an Errors element like for any other failed request"""
+        if token is None:
+            raise requests.exceptions.RequestException(f"No access token ({self.__token_error_msg or 'unknown error'})")
+        return f"{token['token_type']} {token['access_token']}"
+
+    def __session_request(self, method:str, url:str, **kwargs) -> requests.Response:
+        """Sends a single request through the session, waiting for the rate limiter if one is set"""
+        if self.rate_limiter is None:
+            return self.session.request(method, url, timeout=self.timeout, **kwargs)
+        return self.rate_limiter.call(lambda: self.session.request(method, url, timeout=self.timeout, **kwargs))
+
+    def __send(self, method:str, url:str, headers:Dict, **kwargs) -> requests.Response:
+        """Sends an authenticated request through the session and returns the response.
+        Transient errors are retried according to the retry policy.
+        If Koha answers 401, refreshes the token and retries the request once.
+        If that refresh fails, raises requests.exceptions.RequestException instead of sending the rejected token again
+
+        Takes as argument :
+            - method {str} : HTTP method
+            - url {str} : the full URL
+            - headers {dict} : request headers, without Authorization
+            - any other keyword argument is passed to requests.Session.request"""
+        token = self.__valid_token()
+        headers["Authorization"] = self.__authorization(token)
+        r = self.retry_policy.send(lambda: self.__session_request(method, url, headers=headers, **kwargs), method, self.log.logger)
+        if r.status_code == 401:
+            self.log.debug(f"HTTP 401 on {method} {url}, refreshing token then retrying")
+            token = self.refresh_token(token)
+            headers["Authorization"] = self.__authorization(token)
+            r = self.retry_policy.send(lambda: self.__session_request(method, url, headers=headers, **kwargs), method, self.log.logger)
+        return r
+
+    # ---------- Session methods ----------
+
+    def close(self) -> None:
+        """Closes the session and all its pooled connections"""
+        self.session.close()
+
+    def __get_record(self, url:str, headers:Dict) -> Tuple[requests.Response|None, bytes]:
+        """Sends a GET request for a single record, through the memory cache & the cache if set.
+        Concurrent calls for the same record & format share the same request if coalesce_requests is True.
+        Returns (response, content), response being None if the content came from a cache.
+        Raises requests.exceptions.HTTPError for error statuses"""
+        key = cache_key(url, headers["accept"])
+        if self.memory_cache is not None:
+            content = self.memory_cache.get(key)
+            if content is not MISSING:
+                return None, content
+        if self.single_flight is not None:
+            return self.single_flight.do(key, lambda: self.__fetch_record(key, url, headers))
+        return self.__fetch_record(key, url, headers)
+
+    def __fetch_record(self, key:str, url:str, headers:Dict) -> Tuple[requests.Response|None, bytes]:
+        """Private function for __get_record : gets the record from the cache or Koha, then stores it in the memory cache.
+        If the record was invalidated (updated) during the request, the content is returned but not cached"""
+        generation = self.__generation(url)
+        is_current = lambda: self.__generation(url) == generation
+        if self.cache is None:
+            r = self.__send("GET", url, headers)
+            r.raise_for_status()
+            content = r.content
+        else:
+            r, content = self.cache.fetch(key, lambda conditional_headers: self.__send("GET", url, {**headers, **conditional_headers}), is_current)
+        if self.memory_cache is not None and is_current():
+            self.memory_cache.put(key, content)
+        if not is_current():
+            # Invalidated between the check & the put : the invalidation may have run before the put
+            if self.memory_cache is not None:
+                self.memory_cache.invalidate(key)
+            if self.cache is not None:
+                self.cache.invalidate(key)
+        return r, content
+
+    def __generation(self, url:str) -> int:
+        """Returns the number of invalidations of this record URL"""
+        with self.__generations_lock:
+            return self.__generations.get(url, 0)
+
+    def __invalidate_record(self, url:str) -> None:
+        """Removes a record from the caches, whatever its content type.
+        Fetches of this record in progress will not store their (stale) content, nor be shared with later calls"""
+        with self.__generations_lock:
+            self.__generations[url] = self.__generations.get(url, 0) + 1
+        if self.single_flight is not None:
+            for content_type in Content_Type:
+                self.single_flight.forget(cache_key(url, content_type.value))
+        if self.memory_cache is not None:
+            for content_type in Content_Type:
+                self.memory_cache.invalidate(cache_key(url, content_type.value))
+        if self.cache is not None:
+            self.cache.invalidate_url(url)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     # ---------- API methods ----------
 
@@ -212,33 +603,119 @@ class KohaRESTAPIClient(object):
         content_type = validate_content_type(format)
 
         # Try getting the authority
+        r = None
         # Hm, I'm getting an error 500 when trying to get the auth record as MARCXML
         # But other 4 format work, so Idk, marcxml issue ? Though it works for biblios
         try:
             headers = {
-                "Authorization":f"{self.token['token_type']} {self.token['access_token']}",
                 "accept":content_type.value
             }
-            r = requests.get(f"{self.endpoint}authorities/{auth_id}", headers=headers)
-            r.raise_for_status()
+            r, content = self.__get_record(f"{self.endpoint}authorities/{auth_id}", headers)
         # Error handling
         except requests.exceptions.RequestException as generic_error:
+            # HTTP errors are raised before r is assigned
+            if generic_error.response is not None:
+                r = generic_error.response
             self.log.request_generic_error(r, generic_error, msg=f"{api.name} Generic exception")
-            if r.status_code == 404:
+            if r is not None and r.status_code == 404:
                 return Errors.AUTHORIRY_DOES_NOT_EXIST
             else:
                 return Errors.GENERIC_REQUEST_ERROR
         # Succesfully retrieve the record
         else:
             self.log.debug(f"{api.name} Authority {id} retrieved")
-            return r.content
+            return content
+
+    def get_auth_record(self, id:str, format:Content_Type=Content_Type.RAW_MARC) -> MARC_Record|Errors:
+        """Returns the authority record as a Koha_MARC_Record.MARC_Record.
+        format must be RAW_MARC (default), MARCXML or MARC_IN_JSON.
+        If an error occurred, returns an Errors element"""
+        return self.__to_marc_record(Api_Name.GET_AUTH, self.get_auth(id, format), format)
+
+    def get_auths(self, ids:Iterable[str], format:Content_Type=Content_Type.RAW_MARC, max_workers:int=None, ordered:bool=False) -> Iterator[Tuple[str, str|Errors]]:
+        """Fetches many authority records concurrently, WITHOUT decoding them.
+        Yields (id, record or Errors element) tuples
+
+        Takes as argument :
+            - ids {iterable of str} : the authority IDs, can be a lazy iterable
+            - format {Content_Type} : the wanted format (defaults to RAW_MARC)
+            - [optionnal] max_workers {int} : maximum number of requests in flight (defaults to pool_maxsize)
+            - [optionnal] ordered {bool} : if True, yields in input order, else as requests finish (default)"""
+        return self.__fetch_many(self.get_auth, ids, format, max_workers, ordered)
 
     def list_auth(self, query:Dict={}, format:Content_Type=Content_Type.RAW_MARC, page:int=1, nb_res:int=40, auth_type:str=None) -> str|Errors:
         """Returns a list of authorities WITHOUT decoding them.
         If an error occurred, returns an Errors element
         
         If an authority type is provided in the query, will use this one"""
-        # Checks if the provided ID is a number
+        r = self.__list_auth_response(query, format, page, nb_res, auth_type)
+        if type(r) == Errors:
+            return r
+        return r.content
+
+    def iter_authorities(self, query:Dict={}, auth_type:str=None, per_page:int=100, format:Content_Type=Content_Type.JSON, max_pages:int=0) -> Iterator[Dict|bytes|Errors]:
+        """Yields every authority matching the query, one at a time, following the pagination.
+        The next page is fetched while the current one is consumed, at most 2 pages are held in memory.
+        Stops on an empty page, or on a page identical to the previous one (server ignoring _page).
+        If an error occurred, yields an Errors element then stops
+
+        Takes as argument :
+            - [optionnal] query {dict} : same as list_auth()
+            - [optionnal] auth_type {str} : the authority type
+            - [optionnal] per_page {int} : number of authorities per request (defaults to 100)
+            - [optionnal] format {Content_Type} : defaults to JSON
+                - JSON & MARC_IN_JSON : yields each authority as a dict
+                - MARCXML : yields each authority as a MARCXML record (bytes)
+                - RAW_MARC : yields each authority as an ISO2709 record (bytes)
+                - RAW_TEXT is not supported
+            - [optionnal] max_pages {int} : maximum number of pages to request (defaults to 0, no limit)"""
+        content_type = validate_content_type(format)
+        if content_type == Content_Type.RAW_TEXT:
+            yield Errors.CONTENT_TYPE_NOT_SUPPORTED
+            return
+        per_page = validate_int(per_page, default=100)
+        max_pages = validate_int(max_pages, default=0)
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            page = 1
+            previous_page = None
+            future = executor.submit(self.__list_auth_response, query, content_type, page, per_page, auth_type)
+            while future is not None:
+                r = future.result()
+                if type(r) == Errors:
+                    yield r
+                    return
+                # A server ignoring _page sends the same page again
+                page_hash = hash(r.content)
+                if page_hash == previous_page:
+                    self.log.error(f"{Api_Name.GET_AUTH_LIST.name} Page {page} is the same as page {page - 1}, stopping")
+                    break
+                previous_page = page_hash
+                # Prefetch the next page before handling this one
+                has_next = has_next_page(r, page, per_page)
+                records = None
+                if has_next is None:
+                    records = split_records(r.content, content_type)
+                    has_next = len(records) >= per_page
+                if max_pages > 0 and page >= max_pages:
+                    has_next = False
+                future = None
+                if has_next:
+                    future = executor.submit(self.__list_auth_response, query, content_type, page + 1, per_page, auth_type)
+                if records is None:
+                    records = split_records(r.content, content_type)
+                del r
+                if not records:
+                    break
+                yield from records
+                records = None
+                page += 1
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def __list_auth_response(self, query:Dict, format:Content_Type, page:int, nb_res:int, auth_type:str) -> requests.Response|Errors:
+        """Private function for list_auth & iter_authorities.
+        Returns the response of a page of the authority list, or an Errors element"""
         api = Api_Name.GET_AUTH_LIST
         # Checks if content-type is correct
         content_type = validate_content_type(format)
@@ -246,11 +723,11 @@ class KohaRESTAPIClient(object):
         nb_res = validate_int(nb_res, default=1)
 
         # Try getting the authority
+        r = None
         # Hm, I'm getting an error 500 when trying to get the auth record as MARCXML
         # But other 4 format work, so Idk, marcxml issue ? Though it works for biblios
         try:
             headers = {
-                "Authorization":f"{self.token['token_type']} {self.token['access_token']}",
                 "accept":content_type.value
             }
             params = {
@@ -258,13 +735,13 @@ class KohaRESTAPIClient(object):
                 "_per_page":nb_res
             }
             data = {}
-            # If query is a dict, use it as body
+            # If query is a dict, use it as body (copied, auth_type must not be added to the caller's dict)
             if type(query) == dict:
-                data = query
+                data = dict(query)
             # If an auth type is provided and none was provided in the query, adds it
             if auth_type:
                 add_to_dict_if_inexistent(data, "framework_id", str(auth_type))
-            r = requests.get(f"{self.endpoint}authorities", headers=headers, data=data, params=params)
+            r = self.__send("GET", f"{self.endpoint}authorities", headers, data=data, params=params)
             r.raise_for_status()
         # Error handling
         except requests.exceptions.RequestException as generic_error:
@@ -272,8 +749,8 @@ class KohaRESTAPIClient(object):
             return Errors.GENERIC_REQUEST_ERROR
         # Succesfully retrieve the record
         else:
-            self.log.debug(f"{api.name} Authority list retrieved")
-            return r.content
+            self.log.debug(f"{api.name} Authority list retrieved (page {page})")
+            return r
 
     # ----- Biblios -----
 
@@ -291,69 +768,81 @@ class KohaRESTAPIClient(object):
         content_type = validate_content_type(format)
 
         # Try getting the biblio
+        r = None
         try:
             headers = {
-                "Authorization":f"{self.token['token_type']} {self.token['access_token']}",
                 "accept":content_type.value
             }
-            r = requests.get(f"{self.endpoint}biblios/{bibnb}", headers=headers)
-            r.raise_for_status()
+            r, content = self.__get_record(f"{self.endpoint}biblios/{bibnb}", headers)
         # Error handling
         except requests.exceptions.RequestException as generic_error:
+            # HTTP errors are raised before r is assigned
+            if generic_error.response is not None:
+                r = generic_error.response
             self.log.request_generic_error(r, generic_error, msg=f"{api.name} Generic exception")
-            if r.status_code == 404:
+            if r is not None and r.status_code == 404:
                 return Errors.RECORD_DOES_NOT_EXIST
             else:
                 return Errors.GENERIC_REQUEST_ERROR
         # Succesfully retrieve the record
         else:
             self.log.debug(f"{api.name} Record {id} retrieved")
-            return r.content
+            return content
 
-    def __post_biblio(self, api:Api_Name, record:str, format:Content_Type=Content_Type.RAW_MARC, record_schema:Record_Schema=Record_Schema.UNIMARC, framework_id:str=None, id:str=None) -> str|Errors:
+    def get_biblio_record(self, id:str, format:Content_Type=Content_Type.RAW_MARC) -> MARC_Record|Errors:
+        """Returns the record as a Koha_MARC_Record.MARC_Record.
+        format must be RAW_MARC (default), MARCXML or MARC_IN_JSON.
+        If an error occurred, returns an Errors element"""
+        return self.__to_marc_record(Api_Name.GET_BIBLIO, self.get_biblio(id, format), format)
+
+    def __to_marc_record(self, api:Api_Name, content:bytes|Errors, format:Content_Type) -> MARC_Record|Errors:
+        """Private function for get_biblio_record & get_auth_record : decodes the response content"""
+        if type(content) == Errors:
+            return content
+        content_type = validate_content_type(format)
+        if content_type not in [Content_Type.RAW_MARC, Content_Type.MARCXML, Content_Type.MARC_IN_JSON]:
+            self.log.error(f"{api.name} Content type not supported for a MARC record ({content_type.value})")
+            return Errors.CONTENT_TYPE_NOT_SUPPORTED
+        try:
+            return MARC_Record.from_content(content, content_type)
+        except Exception as generic_error:
+            self.log.generic_error(generic_error, msg=f"{api.name} Could not decode the record")
+            return Errors.GENERIC_REQUEST_ERROR
+
+    def get_biblios(self, ids:Iterable[str], format:Content_Type=Content_Type.RAW_MARC, max_workers:int=None, ordered:bool=False) -> Iterator[Tuple[str, str|Errors]]:
+        """Fetches many records concurrently, WITHOUT decoding them.
+        Yields (biblionumber, record or Errors element) tuples
+
+        Takes as argument :
+            - ids {iterable of str} : the biblionumbers, can be a lazy iterable
+            - format {Content_Type} : the wanted format (defaults to RAW_MARC)
+            - [optionnal] max_workers {int} : maximum number of requests in flight (defaults to pool_maxsize)
+            - [optionnal] ordered {bool} : if True, yields in input order, else as requests finish (default)"""
+        return self.__fetch_many(self.get_biblio, ids, format, max_workers, ordered)
+
+    def __post_biblio(self, api:Api_Name, record:str|MARC_Record, format:Content_Type=Content_Type.RAW_MARC, record_schema:Record_Schema=Record_Schema.UNIMARC, framework_id:str=None, id:str=None) -> str|Errors:
         """Private function for add & update biblio.
         Returns the API repsonse content (or an error)
         
         Takes as argument :
             - api {Api_Name} : ADD_BIBLIO or UPDATE_BIBLIO
-            - record {str} : record as a string for the format
+            - record {str or MARC_Record} : record as a string for the format, or a Koha_MARC_Record.MARC_Record encoded in the format
             - format {Content_Type} : format of the record, either RAW_MARC (default), MARCXML or MARC_IN_JSON
             - record_schema {Record_Schema} : UNIMARC (default) or MARC21
             - [optionnal] framework_id {str} : code of the framework ID in Koha
             - [optionnal] id {str} : MANDATORY for UPDATE_BIBLIO : the biblionumber to update (useless for ADD_BIBLIO)"""
-        # Check if the api name is correct : if not, return an error
-        api = validate_api_name(api)
-        if api == None or api not in [
-            Api_Name.ADD_BIBLIO,
-            Api_Name.UPDATE_BIBLIO
-            ]:
-            return Errors.API_NOT_SUPPORTED
-        
-        # Check if the content type is correct : if not, return an error
-        content_type = validate_content_type(format, default=False)
-        if content_type == None or content_type in [
-            Content_Type.JSON,
-            Content_Type.RAW_TEXT
-            ]:
-            return Errors.CONTENT_TYPE_NOT_SUPPORTED
-        
-        # Check if the record chema is correct : if not, return an error
-        record_schema = validate_record_schema(record_schema, default=False)
-        if record_schema == None:
-            return Errors.RECORD_SCHEMA_NOT_SUPPORTED
-
-        # If update, validate the biblionumber
-        if api == Api_Name.UPDATE_BIBLIO:
-            bibnb = validate_bibnb(id)
-            # Leaves if not
-            if bibnb == None:
-                self.log.error(f"{api.name} Invalid input biblionumber ({id})")
-                return Errors.INVALID_BIBNB
+        # Check the parameters
+        validated = validate_post_biblio(api, format, record_schema, id)
+        if type(validated) == Errors:
+            if validated == Errors.INVALID_BIBNB:
+                self.log.error(f"{validate_api_name(api).name} Invalid input biblionumber ({id})")
+            return validated
+        api, content_type, record_schema, bibnb = validated
 
         # Try psoting the biblio
+        r = None
         try:
             headers = {
-                "Authorization":f"{self.token['token_type']} {self.token['access_token']}",
                 "Content-type":content_type.value,
                 "x-record-schema":record_schema.value
             }
@@ -361,51 +850,114 @@ class KohaRESTAPIClient(object):
             if framework_id:
                 headers["x-framework-id"] = framework_id
             data = record # yes just put the record as it is
+            if isinstance(record, MARC_Record):
+                data = record.to_content(content_type)
             url = f"{self.endpoint}biblios"
             method = "POST"
             if api == Api_Name.UPDATE_BIBLIO:
                 url = url + f"/{bibnb}"
                 method = "PUT"
-            r = requests.request(method, url, headers=headers, data=data)
+            r = self.__send(method, url, headers, data=data)
             r.raise_for_status()
         # Error handling
         except requests.exceptions.RequestException as generic_error:
             self.log.request_generic_error(r, generic_error, msg=f"{api.name} Generic exception")
-            if r.status_code == 404:
+            if r is not None and r.status_code == 404:
                 return Errors.RECORD_DOES_NOT_EXIST
             else:
                 return Errors.GENERIC_REQUEST_ERROR
         # Succesfully retrieve the record
         else:
             if api == Api_Name.UPDATE_BIBLIO:
+                self.__invalidate_record(url)
                 self.log.debug(f"{api.name} Record {id} updated")
             else:
                 self.log.debug(f"{api.name} Record added")
             return r.content
 
-    def add_biblio(self, record:str, format:Content_Type=Content_Type.RAW_MARC, record_schema:Record_Schema=Record_Schema.UNIMARC, framework_id:str=None) -> str|Errors:
+    def add_biblio(self, record:str|MARC_Record, format:Content_Type=Content_Type.RAW_MARC, record_schema:Record_Schema=Record_Schema.UNIMARC, framework_id:str=None) -> str|Errors:
         """Add a new biblio record to Koha
         Returns the API repsonse content (or an error)
         
         Takes as argument :
-            - record {str} : record as a string for the format
+            - record {str or MARC_Record} : record as a string for the format, or a Koha_MARC_Record.MARC_Record encoded in the format
             - format {Content_Type} : format of the record, either RAW_MARC (default), MARCXML or MARC_IN_JSON
             - record_schema {Record_Schema} : UNIMARC (default) or MARC21
             - [optionnal] framework_id {str} : code of the framework ID in Koha"""
         return self.__post_biblio(Api_Name.ADD_BIBLIO, record=record, format=format, record_schema=record_schema, framework_id=framework_id)
 
-    def update_biblio(self, id:str, record:str, format:Content_Type=Content_Type.RAW_MARC, record_schema:Record_Schema=Record_Schema.UNIMARC, framework_id:str=None) -> str|Errors:
+    def update_biblio(self, id:str, record:str|MARC_Record, format:Content_Type=Content_Type.RAW_MARC, record_schema:Record_Schema=Record_Schema.UNIMARC, framework_id:str=None) -> str|Errors:
         """Update a biblio record in Koha 
         Returns the API repsonse content (or an error)
         
         Takes as argument :
             - id {str} : the biblionumber to update
-            - record {str} : record as a string for the format
+            - record {str or MARC_Record} : record as a string for the format, or a Koha_MARC_Record.MARC_Record encoded in the format
             - format {Content_Type} : format of the record, either RAW_MARC (default), MARCXML or MARC_IN_JSON
             - record_schema {Record_Schema} : UNIMARC (default) or MARC21
             - [optionnal] framework_id {str} : code of the framework ID in Koha"""
         return self.__post_biblio(Api_Name.UPDATE_BIBLIO, record=record, format=format, record_schema=record_schema, framework_id=framework_id, id=id)
 
+    def bulk_write_biblios(self, items:Iterable[Tuple], journal:str|TextIO=None, max_workers:int=None, max_pending:int=None, ordered:bool=False, on_drained:Callable[[Bulk_Write_Result], None]=None) -> Iterator[Bulk_Write_Result]:
+        """Adds or updates many biblio records concurrently and yields a Bulk_Write_Result per item.
+        Items are read lazily : only max_pending of them are held in memory at once.
+        Every item goes through the same checks as add_biblio / update_biblio.
+        If the generator is closed early, the writes already sent are waited for and still written to the journal.
+
+        Takes as argument :
+            - items {iterable of tuples} : (biblionumber or None, record[, format[, record_schema[, framework_id]]]).
+            A None biblionumber adds the record, else updates it.
+            format defaults to RAW_MARC, record_schema to UNIMARC
+            - [optionnal] journal {str or text file} : if set, appends each result as a JSON line to this file (see read_journal())
+            - [optionnal] max_workers {int} : maximum number of requests in flight (defaults to pool_maxsize)
+            - [optionnal] max_pending {int} : maximum number of items read but not yielded yet (defaults to 2 * max_workers)
+            - [optionnal] ordered {bool} : if True, yields in input order, else as requests finish (default)
+            - [optionnal] on_drained {callable} : called with the Bulk_Write_Result of each write that finished
+            but was not yielded because the generator was closed early"""
+        max_workers = validate_int(max_workers, default=self.pool_maxsize)
+        journal_file = journal
+        if type(journal) == str:
+            journal_file = open(journal, mode="a", encoding="utf-8")
+
+        def drain(indexed_item:Tuple[int, Tuple], result:Bulk_Write_Result) -> None:
+            if journal_file is not None:
+                write_journal_entry(journal_file, result)
+            if on_drained is not None:
+                on_drained(result)
+
+        results = bounded_map(self.__write_item, enumerate(items), max_workers=max_workers, ordered=ordered, max_pending=max_pending, drain=drain)
+        try:
+            for _, result in results:
+                if journal_file is not None:
+                    write_journal_entry(journal_file, result)
+                yield result
+        finally:
+            # Waits for the writes in flight & drains them before closing the journal
+            results.close()
+            if type(journal) == str:
+                journal_file.close()
+
+    def __write_item(self, indexed_item:Tuple[int, Tuple]) -> Bulk_Write_Result:
+        """Private function for bulk_write_biblios : adds or updates a single item"""
+        index, item = indexed_item
+        id, record = item[0], item[1]
+        format = item[2] if len(item) > 2 else Content_Type.RAW_MARC
+        record_schema = item[3] if len(item) > 3 else Record_Schema.UNIMARC
+        framework_id = item[4] if len(item) > 4 else None
+        api = Api_Name.ADD_BIBLIO if id is None else Api_Name.UPDATE_BIBLIO
+        start = time.perf_counter()
+        response = self.__post_biblio(api, record=record, format=format, record_schema=record_schema, framework_id=framework_id, id=id)
+        return Bulk_Write_Result(index, id, api, response, time.perf_counter() - start)
+
+    def __fetch_many(self, method:Callable, ids:Iterable[str], format:Content_Type, max_workers:int, ordered:bool) -> Iterator[Tuple[str, str|Errors]]:
+        """Private function for get_biblios & get_auths.
+        Runs method(id, format) over a bounded thread pool sharing the session"""
+        max_workers = validate_int(max_workers, default=self.pool_maxsize)
+        # More threads than pooled connections would open & discard connections
+        if max_workers > self.pool_maxsize:
+            self.log.debug(f"max_workers ({max_workers}) is greater than pool_maxsize ({self.pool_maxsize})")
+        return bounded_map(lambda id: method(id, format), ids, max_workers=max_workers, ordered=ordered)
+
     # ---------- Logger methods for other classes / functions ----------
     def init_logger(self):
         """Init the logger"""
@@ -437,7 +989,7 @@ class KohaRESTAPIClient(object):
             """Log an error statement with the service then HTTP Status, Method, URL and error reason.
             
             Takes as argument :
-                - requests.Reponse
+                - requests.Reponse, or None if no response was received
                 - reason : the exception message
                 - [optional] msg : a message to display before HTTP infos
                 - [optionnal, default to False] init : if True, set service as 'KohaRESTAPIClient_Init'"""
@@ -448,6 +1000,9 @@ class KohaRESTAPIClient(object):
             service = self.parent.service
             if init:
                 service = self.init_name
+            if r is None:
+                self.logger.error(f"{service} :: {msg}No response || Reason : {reason}")
+                return
             self.logger.error(f"{service} :: {msg}HTTP Status : {r.status_code} || Method : {r.request.method} || URL : {r.url} || Reason : {reason}")
 
         def generic_error(self, reason, msg:str, init=False):
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+# Client-side adaptive rate limiter shared by KohaRESTAPIClient & Koha_SRU
+
+# external imports
+import threading
+import time
+import requests
+from typing import Callable, Dict
+
+# Statuses meaning the server is overloaded
+OVERLOAD_STATUSES = (429, 500, 502, 503, 504)
+
+# ----------------- Class def -----------------
+
+class Rate_Limiter(object):
+    """Rate_Limiter
+    =======
+    Thread-safe limiter capping both the request rate (token bucket) and the number of requests in flight.
+    Both limits adapt (AIMD) : they grow a little after each healthy response,
+    and are cut by decrease_factor when a response is slow, fails or has an overload status.
+    One instance must be shared by every thread (or client) talking to the same server.
+    On init take as arguments :
+    - [optional] max_rate {float} : maximum requests per second (defaults to 10)
+    - [optional] min_rate {float} : the rate is never cut below this value (defaults to 0.5)
+    - [optional] rate_increase {float} : requests per second added after each healthy response (defaults to 0.1)
+    - [optional] burst {int} : maximum number of requests sent at once after an idle time (defaults to max_concurrency)
+    - [optional] initial_concurrency {int} : starting number of requests in flight (defaults to 4)
+    - [optional] min_concurrency {int} : defaults to 1
+    - [optional] max_concurrency {int} : defaults to 16
+    - [optional] latency_threshold {float} : a response slower than this many seconds counts as an overload (defaults to 2)
+    - [optional] decrease_factor {float} : multiplier applied to both limits on overload (defaults to 0.5)
+    - [optional] cooldown {float} : minimum seconds between two decreases, so a burst of errors only cuts once (defaults to 1)
+    Raises ValueError if max_rate or min_rate is not strictly positive"""
+
+    def __init__(self, max_rate:float=10, min_rate:float=0.5, rate_increase:float=0.1, burst:int=None, initial_concurrency:int=4, min_concurrency:int=1, max_concurrency:int=16, latency_threshold:float=2, decrease_factor:float=0.5, cooldown:float=1):
+        # A null rate would never refill the bucket
+        if not float(max_rate) > 0 or not float(min_rate) > 0:
+            raise ValueError(f"max_rate & min_rate must be > 0 (got {max_rate} & {min_rate})")
+        self.max_rate = float(max_rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.rate_increase = float(rate_increase)
+        self.min_concurrency = max(int(min_concurrency), 1)
+        self.max_concurrency = max(int(max_concurrency), self.min_concurrency)
+        self.burst = max(int(burst), 1) if burst else self.max_concurrency
+        self.latency_threshold = latency_threshold
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        # Current state
+        self.rate = self.max_rate
+        self.concurrency = float(min(max(int(initial_concurrency), self.min_concurrency), self.max_concurrency))
+        self.in_flight = 0
+        self.__tokens = float(self.burst)
+        self.__last_refill = time.monotonic()
+        self.__last_decrease = 0
+        self.__condition = threading.Condition()
+        # Stats
+        self.nb_requests = 0
+        self.nb_overloads = 0
+
+    def __refill(self) -> None:
+        """Adds the tokens earned since the last refill. Must be called with the lock held"""
+        now = time.monotonic()
+        self.__tokens = min(self.burst, self.__tokens + (now - self.__last_refill) * self.rate)
+        self.__last_refill = now
+
+    def acquire(self) -> None:
+        """Blocks until a request can be sent"""
+        with self.__condition:
+            while True:
+                self.__refill()
+                if self.in_flight < int(self.concurrency) and self.__tokens >= 1:
+                    self.__tokens -= 1
+                    self.in_flight += 1
+                    return
+                # Waits for the next token, or for a request to finish
+                wait = None
+                if self.__tokens < 1:
+                    wait = (1 - self.__tokens) / self.rate
+                self.__condition.wait(wait)
+
+    def release(self, latency:float, overloaded:bool=False) -> None:
+        """Signals the end of a request and adapts the limits
+
+        Takes as argument :
+            - latency {float} : duration of the request in seconds
+            - [optionnal] overloaded {bool} : True if the request failed or got an overload status"""
+        with self.__condition:
+            self.in_flight -= 1
+            self.nb_requests += 1
+            if overloaded or latency > self.latency_threshold:
+                self.nb_overloads += 1
+                now = time.monotonic()
+                if now - self.__last_decrease >= self.cooldown:
+                    self.__last_decrease = now
+                    self.concurrency = max(self.min_concurrency, self.concurrency * self.decrease_factor)
+                    self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            else:
+                # Roughly +1 concurrent request once every current slot succeeded
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+                self.rate = min(self.max_rate, self.rate + self.rate_increase)
+            self.__condition.notify_all()
+
+    def call(self, do_request:Callable[[], requests.Response]) -> requests.Response:
+        """Sends a request once the limiter allows it, then adapts the limits with its outcome.
+        Returns the response, or raises the exception raised by do_request
+
+        Takes as argument :
+            - do_request {callable} : sends the request and returns a requests.Response"""
+        self.acquire()
+        start = time.perf_counter()
+        overloaded = True
+        try:
+            r = do_request()
+            overloaded = r.status_code in OVERLOAD_STATUSES
+            return r
+        finally:
+            self.release(time.perf_counter() - start, overloaded)
+
+    def stats(self) -> Dict:
+        """Returns the current limits & counters as a dict"""
+        with self.__condition:
+            return {
+                "rate":self.rate,
+                "concurrency":int(self.concurrency),
+                "in_flight":self.in_flight,
+                "nb_requests":self.nb_requests,
+                "nb_overloads":self.nb_overloads
+            }
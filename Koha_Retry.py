@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+# Retry policy shared by KohaRESTAPIClient, AsyncKohaRESTAPIClient, Koha_SRU & Koha_API_PublicBiblio
+
+# external imports
+import logging
+import random
+import time
+import requests
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Iterable
+
+# Methods that can be sent twice without side effects
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+# ----------------- Class def -----------------
+
+class Retry_Policy(object):
+    """Retry_Policy
+    =======
+    Decides when a request must be sent again and how long to wait before.
+    On init take as arguments :
+    - [optional] max_attempts {int} : total number of attempts, 1 disables retries (defaults to 3)
+    - [optional] backoff_factor {float} : the wait before attempt n is at most backoff_factor * 2 ** (n - 1) seconds (defaults to 0.5)
+    - [optional] max_backoff {float} : maximum wait between two attempts in seconds (defaults to 30)
+    - [optional] jitter {bool} : if True (default), waits a random time between 0 and the backoff ("full jitter")
+    - [optional] retry_statuses {iterable of int} : HTTP statuses to retry (defaults to 429, 502, 503, 504)
+    - [optional] respect_retry_after {bool} : if True (default), waits the time asked by the Retry-After header,
+    up to max_retry_after seconds
+    - [optional] max_retry_after {float} : defaults to 120
+    - [optional] retry_non_idempotent {bool} : if False (default), POST requests are only retried
+    when they did not reach the server (connection timeout) or were rejected with a 429
+
+Connection errors & timeouts are always retried for idempotent methods."""
+
+    def __init__(self, max_attempts:int=3, backoff_factor:float=0.5, max_backoff:float=30, jitter:bool=True, retry_statuses:Iterable[int]=(429, 502, 503, 504), respect_retry_after:bool=True, max_retry_after:float=120, retry_non_idempotent:bool=False):
+        self.max_attempts = max(int(max_attempts), 1)
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+        self.retry_non_idempotent = retry_non_idempotent
+
+    def is_idempotent(self, method:str) -> bool:
+        """Returns True if the method can be blindly retried"""
+        return self.retry_non_idempotent or str(method).upper() in IDEMPOTENT_METHODS
+
+    def should_retry_status(self, method:str, status:int) -> bool:
+        """Returns True if a response with this status must be retried"""
+        if status not in self.retry_statuses:
+            return False
+        # 429 : the server refused the request without processing it
+        return status == 429 or self.is_idempotent(method)
+
+    def should_retry_exception(self, method:str, error:Exception) -> bool:
+        """Returns True if a request that raised this exception must be retried"""
+        # Never connected : the request was not sent
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+            return self.is_idempotent(method)
+        return False
+
+    def backoff(self, attempt:int) -> float:
+        """Returns the time to wait in seconds after the failed attempt number attempt (starting at 1)"""
+        wait = min(self.max_backoff, self.backoff_factor * (2 ** (attempt - 1)))
+        if self.jitter:
+            return random.uniform(0, wait)
+        return wait
+
+    def retry_after(self, header:str|None) -> float|None:
+        """Returns the wait asked by a Retry-After header value in seconds, or None if it is missing / invalid"""
+        if not self.respect_retry_after or not header:
+            return None
+        header = header.strip()
+        if header.isdigit():
+            wait = float(header)
+        else:
+            try:
+                date = parsedate_to_datetime(header)
+            except (TypeError, ValueError):
+                return None
+            if date.tzinfo is None:
+                date = date.replace(tzinfo=timezone.utc)
+            wait = (date - datetime.now(timezone.utc)).total_seconds()
+        return min(max(wait, 0), self.max_retry_after)
+
+    def wait_time(self, attempt:int, retry_after_header:str|None=None) -> float:
+        """Returns the time to wait after the failed attempt number attempt,
+        using the Retry-After header value if provided"""
+        wait = self.retry_after(retry_after_header)
+        if wait is None:
+            return self.backoff(attempt)
+        return wait
+
+    def send(self, do_request:Callable[[], requests.Response], method:str="GET", logger:logging.Logger=None, idempotent:bool=None) -> requests.Response:
+        """Calls do_request until it returns a response that must not be retried, or attempts are exhausted.
+        Returns the last response, raises the last exception if the last attempt raised one.
+
+        Takes as argument :
+            - do_request {callable} : sends the request and returns a requests.Response (must not raise_for_status)
+            - [optionnal] method {str} : the HTTP method, used to know if the request is idempotent
+            - [optionnal] logger {logging.Logger} : logs each retry as a warning
+            - [optionnal] idempotent {bool} : overrides the method based idempotency check"""
+        if idempotent is not None:
+            method = "GET" if idempotent else "POST"
+        attempt = 1
+        while True:
+            try:
+                r = do_request()
+            except requests.exceptions.RequestException as error:
+                if attempt >= self.max_attempts or not self.should_retry_exception(method, error):
+                    raise
+                wait = self.wait_time(attempt)
+                reason = repr(error)
+            else:
+                if attempt >= self.max_attempts or not self.should_retry_status(method, r.status_code):
+                    return r
+                wait = self.wait_time(attempt, r.headers.get("Retry-After"))
+                reason = f"HTTP Status {r.status_code}"
+                # Releases the connection before waiting
+                r.close()
+            if logger:
+                logger.warning(f"Retry_Policy :: {reason}, attempt {attempt}/{self.max_attempts}, retrying in {wait:.2f}s")
+            time.sleep(wait)
+            attempt += 1
@@ -6,6 +6,21 @@ import logging
 import requests
 import xml.etree.ElementTree as ET
 import urllib.parse
+import io
+import re
+import copy
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from typing import IO, Iterator, List
+
+# internal imports
+from Koha_Retry import Retry_Policy
+from Koha_Rate_Limiter import Rate_Limiter
+from Koha_MARC_Record import MARC_Record
+from Koha_Cache import LRU_Cache, MISSING
+from Koha_MARC_Selector import compile_selector
+from Koha_XML_Backend import fromstring, iterparse
 
 #https://koha-community.org/manual/20.11/fr/html/webservices.html#sru-server
 # https://www.loc.gov/standards/sru/sru-1-1.html
@@ -150,6 +165,51 @@ class SRU_Boolean_Operators(Enum):
     OR = " or "
     NOT = " not "
 
+# --------------- Functions ---------------
+
+# CQL tokens : quoted strings, parenthesis, relation symbols, words
+CQL_TOKENS = re.compile(r'"(?:[^"\\]|\\.)*"?|[()]|<=|>=|<>|[=<>]|[^\s()=<>"]+')
+CQL_RELATION_SYMBOLS = ("<=", ">=", "<>", "=", "<", ">")
+CQL_KEYWORDS = ("and", "or", "not", "prox", "exact", "any", "all", "adj", "within", "encloses")
+CQL_RELATION_WORDS = CQL_KEYWORDS[4:]
+
+def normalize_query(query:str) -> str:
+    """Returns a canonical form of a CQL query, used as a cache key :
+    whitespaces are collapsed, removed around relation symbols & parenthesis,
+    boolean operators, relation words & indexes are lowercased.
+    Quoted strings and search terms are kept as they are, even if they are keywords (title=AND)"""
+    tokens = CQL_TOKENS.findall(str(query))
+    output = ""
+    previous = None
+    # What the previous token allows : "clause" (index or search term), "relation", "term" or "boolean"
+    expected = "clause"
+    for index, token in enumerate(tokens):
+        next_token = tokens[index + 1] if index + 1 < len(tokens) else None
+        if token == "(" or token == ")":
+            expected = "clause" if token == "(" else "boolean"
+        elif expected == "relation":
+            if not token.startswith('"'):
+                token = token.lower()
+            expected = "term"
+        elif expected == "boolean" and token.lower() in CQL_KEYWORDS[:4]:
+            token = token.lower()
+            expected = "clause"
+        elif expected != "term" and not token.startswith('"') and (
+                next_token in CQL_RELATION_SYMBOLS
+                or (next_token or "").lower() in CQL_RELATION_WORDS
+            ):
+            # Index
+            token = token.lower()
+            expected = "relation"
+        else:
+            # Search term
+            expected = "boolean"
+        if previous is not None and previous not in CQL_RELATION_SYMBOLS + ("(",) and token not in CQL_RELATION_SYMBOLS + (")",):
+            output += " "
+        output += token
+        previous = token
+    return output
+
 # --------------- Class Objects ---------------
 
 # ---------- SRU Query ----------
@@ -200,8 +260,14 @@ class Koha_SRU(object):
     On init take as arguments :
         - Koha server URL
         - the version (defaults to 2.0)
-        - [optional] service {str} : Name of the service for the logs"""
-    def __init__(self, url:str, version:SRU_Version.V1_1, service="Koha_SRU"):
+        - [optional] service {str} : Name of the service for the logs
+        - [optional] retry_policy {Retry_Policy} : retries transient errors (defaults to Retry_Policy())
+        - [optional] rate_limiter {Rate_Limiter} : adapts the request rate & concurrency to the server health
+        - [optional] cache {LRU_Cache} : caches the responses of successful searches & counts, keyed by the normalized query
+        (see normalize_query()), start record, maximum records & record schema.
+        The response is parsed once when stored, a hit skips the request & the parse : each SRU_Result_Search gets its own copy of the tree.
+        Set its ttl & max_size (bytes of the cached responses) to bound it. Streamed searches are not cached"""
+    def __init__(self, url:str, version:SRU_Version.V1_1, service="Koha_SRU", retry_policy:Retry_Policy=None, rate_limiter:Rate_Limiter=None, cache:LRU_Cache=None):
         # Const
         if url[-1:] in ["/", "\\"]:
             url = url[:len(url)-1]
@@ -216,6 +282,9 @@ class Koha_SRU(object):
         # logs
         self.logger = logging.getLogger(service)
         self.service = service
+        self.retry_policy = retry_policy if retry_policy is not None else Retry_Policy()
+        self.rate_limiter = rate_limiter
+        self.cache = cache
 
     def explain(self):
         """GET an explain request from the SRU and returns a SRU_Result_Explain instance"""
@@ -227,7 +296,7 @@ class Koha_SRU(object):
 
         # Request
         try:
-            r = requests.get(url)
+            r = self.retry_policy.send(lambda: self.__get(url), "GET", self.logger)
             r.raise_for_status()
         except requests.exceptions.HTTPError:
             status = Status.ERROR
@@ -299,22 +368,15 @@ class Koha_SRU(object):
     #     return SRU_Result_Scan(status, error_msg, result,
     #             maximum_terms, response_position, scan_clause, url)
 
-    def search(self, query:str, record_schema=SRU_Record_Schemas.MARCXML, start_record=1, maximum_records=100):
+    def search(self, query:str, record_schema=SRU_Record_Schemas.MARCXML, start_record=1, maximum_records=100, stream=False):
         """GET a search retrieve request from the SRU and returns a SRU_Result_Search instance
         Takes as arguments :
             - query {str} : the query
             - [optional] record_schema {SRU_Record_Schema} : the record schema
             - [optional] start_record {int} : the position of the first result in the query result list (> 0)
-            - [optional] maximum_records {int} : the maximum records to be returned (between 1 and 1000)"""
-
-        # Query part
-        query = urllib.parse.quote(query)
-
-        # Control provided record schema and set it to its string form
-        if type(record_schema) == SRU_Record_Schemas:
-            record_schema = record_schema.value
-        elif record_schema not in [e.value for e in SRU_Record_Schemas]:
-                record_schema = SRU_Record_Schemas.MARCXML.value
+            - [optional] maximum_records {int} : the maximum records to be returned (between 1 and 1000)
+            - [optional] stream {bool} : if True, the response is parsed incrementally while it is downloaded,
+            records must then be read with SRU_Result_Search.iter_records(). Defaults to False"""
 
         # Checks some input values validity
         maximum_records = self.to_int(maximum_records)
@@ -330,17 +392,54 @@ class Koha_SRU(object):
         elif start_record < 1:
             start_record = 1
 
+        return self.__search_retrieve(query, record_schema, start_record, maximum_records, stream)
+
+    def count(self, query:str, record_schema=SRU_Record_Schemas.MARCXML):
+        """GET a search retrieve request asking for no record (maximumRecords=0) and returns a SRU_Result_Search instance.
+        Use its nb_results property to know how many records match the query, records is always empty
+        Takes as arguments :
+            - query {str} : the query
+            - [optional] record_schema {SRU_Record_Schema} : the record schema"""
+        return self.__search_retrieve(query, record_schema, 1, 0, False)
+
+    def __search_retrieve(self, query:str, record_schema, start_record:int, maximum_records:int, stream:bool):
+        """Private function for search & count : sends the search retrieve request, without checking start_record and maximum_records.
+        Non streamed results are served from / stored in the cache if set"""
+        # Control provided record schema and set it to its string form
+        if type(record_schema) == SRU_Record_Schemas:
+            record_schema = record_schema.value
+        elif record_schema not in [e.value for e in SRU_Record_Schemas]:
+                record_schema = SRU_Record_Schemas.MARCXML.value
+
+        cache_key = None
+        if self.cache is not None and not stream:
+            cache_key = (self.endpoint, self.version, normalize_query(query), start_record, maximum_records, record_schema)
+
+        # Query part
+        query = urllib.parse.quote(query)
+
         # Defines the URL
         url = f"{self.endpoint}?version={self.version}&recordSchema={record_schema}"\
             f"&operation={SRU_Operations.SEARCH.value}&query={query}"\
                 f"&startRecord={start_record}&maximumRecords={maximum_records}"                                
+
+        # Cache lookup : the cache holds the response string & its parsed tree, never handed out to callers
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not MISSING:
+                self.logger.debug(f"{query} :: Koha_SRU Search Retrieve :: Served from cache")
+                result, frozen_xml = cached
+                return SRU_Result_Search(Status.SUCCESS, None, result,
+                    record_schema, self.version, maximum_records,
+                    start_record, query, url, frozen_xml=frozen_xml)
+
         status = None
         error_msg = None
         result = ""
 
         # Request
         try:
-            r = requests.get(url)
+            r = self.retry_policy.send(lambda: self.__get(url, stream=stream), "GET", self.logger)
             r.raise_for_status()
         except requests.exceptions.HTTPError:
             status = Status.ERROR
@@ -353,11 +452,96 @@ class Koha_SRU(object):
         else:
             status = Status.SUCCESS
             self.logger.debug(f"{query} :: Koha_SRU Search Retrieve :: Success")
-            result = r.content.decode('utf-8')
-
+            if stream:
+                # Undo gzip / deflate while reading the raw stream
+                r.raw.decode_content = True
+                result = r.raw
+            else:
+                result = r.content.decode('utf-8')
+
+        if cache_key is not None and status == Status.SUCCESS:
+            # Parsed once for the cache & this result, which gets a copy like the next hits
+            frozen_xml = fromstring(result)
+            self.cache.put(cache_key, (result, frozen_xml), size=len(r.content))
+            return SRU_Result_Search(status, error_msg, result,
+                record_schema, self.version, maximum_records,
+                start_record, query, url, frozen_xml=frozen_xml)
         return SRU_Result_Search(status, error_msg, result,
                 record_schema, self.version, maximum_records,
-                start_record, query, url)
+                start_record, query, url, streaming=stream)
+
+    def __get(self, url:str, stream:bool=False) -> requests.Response:
+        """Sends a single GET request, waiting for the rate limiter if one is set"""
+        if self.rate_limiter is None:
+            return requests.get(url, stream=stream)
+        return self.rate_limiter.call(lambda: requests.get(url, stream=stream))
+
+    def __fetch_page(self, query:str, record_schema, start_record:int, maximum_records:int):
+        """Private function for iter_search : downloads a whole page without parsing it,
+        it will be parsed incrementally by SRU_Result_Search.iter_records()"""
+        res = self.search(query, record_schema, start_record, maximum_records, stream=True)
+        if not res.error:
+            res.buffer()
+        return res
+
+    def iter_search(self, query:str, page_size:int=1000, record_schema=SRU_Record_Schemas.MARCXML, start_record:int=1) -> Iterator[ET.Element|Errors]:
+        """Yields every record of the query result list, one at a time, as a marc:record Element
+        (an lxml element if lxml is installed, see Koha_XML_Backend).
+        The next page is requested while the current one is consumed, at most 2 pages are held in memory.
+        Pages are parsed incrementally, each record is freed once the caller moved to the next one.
+        Each page starts where the previous one ended (nextRecordPosition, else the number of records it returned) :
+        if the server returns less records than page_size, no record is skipped and the next requests ask for that many.
+        If a request fails, yields an Errors element then stops. Stops on a page without records
+        Takes as arguments :
+            - query {str} : the query
+            - [optional] page_size {int} : maximum records per request (between 1 and 1000, defaults to 1000)
+            - [optional] record_schema {SRU_Record_Schema} : the record schema
+            - [optional] start_record {int} : the position of the first record to return (> 0)"""
+        page_size = self.to_int(page_size)
+        if not page_size or page_size > 1000:
+            page_size = 1000
+        elif page_size < 1:
+            page_size = 10
+        start_record = self.to_int(start_record)
+        if not start_record or start_record < 1:
+            start_record = 1
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            future = executor.submit(self.__fetch_page, query, record_schema, start_record, page_size)
+            while future is not None:
+                res = future.result()
+                if res.error:
+                    yield Errors(res.error)
+                    return
+                nb_results = res.get_nb_results()
+                # Prefetch the next page before handling this one, expecting this one to be full
+                expected_start = start_record + page_size
+                future = None
+                if expected_start <= nb_results:
+                    future = executor.submit(self.__fetch_page, query, record_schema, expected_start, page_size)
+                nb_records = 0
+                for record in res.iter_records():
+                    nb_records += 1
+                    yield record
+                next_start = res.get_next_record_position()
+                del res
+                if nb_records == 0:
+                    break
+                if next_start is None or next_start <= start_record:
+                    next_start = start_record + nb_records
+                if next_start != expected_start:
+                    # The server capped maximumRecords : the prefetched page starts too far
+                    self.logger.debug(f"{query} :: Koha_SRU Iter Search :: {nb_records} records returned out of {page_size} asked, next page starts at {next_start}")
+                    if future is not None:
+                        future.cancel()
+                    page_size = min(page_size, max(next_start - start_record, 1))
+                    future = None
+                    if next_start <= nb_results:
+                        future = executor.submit(self.__fetch_page, query, record_schema, next_start, page_size)
+                start_record = next_start
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
 
     def generate_query(self, list: list):
         """Returns a query from multiple parts of query as a string.
@@ -401,7 +585,7 @@ class SRU_Result_Explain(object):
         else:
             self.error = None
         self.result_as_string = result
-        self.result = ET.fromstring(result)
+        self.result = fromstring(result)
 
     def get_result(self):
             """Return the result as an ET Element."""
@@ -488,34 +672,75 @@ class SRU_Result_Explain(object):
 class SRU_Result_Search(object):
     """SRU_Result_Search
     =======
-    A set of function to handle a search retrieve request response from Sudoc's SRU"""
+    A set of function to handle a search retrieve request response from Sudoc's SRU
+
+    The response is only parsed when first needed : result, result_as_parsed_xml, nb_results, records and records_id
+    are computed when first accessed.
+    If frozen_xml (the response already parsed, e.g. by the cache) is set, result_as_parsed_xml is a copy of it
+    instead of a new parse : frozen_xml itself is never modified nor returned.
+
+    If streaming is True, result is a binary file-like object parsed incrementally :
+    records, records_id, result and result_as_string are not set, use iter_records() and nb_results"""
 
     closing_tags_fix = "</record></srw:recordData></srw:record>"
 
-    def __init__(self, status: Status, error: Errors, result: str, record_schema: str, version:str, maximum_records: int, start_record: int, query: str, url: str):
+    def __init__(self, status: Status, error: Errors, result: str|IO[bytes], record_schema: str, version:str, maximum_records: int, start_record: int, query: str, url: str, streaming: bool=False, frozen_xml: ET.Element=None):
         self.operation = SRU_Operations.SEARCH.value
         self.url = url
         self.status = status.value
+        self.streaming = streaming
         if error:
             self.error = error.value
             return
         else:
             self.error = None
-        self.result_as_string = result
-        self.result_as_parsed_xml = ET.fromstring(result)
-        self.result = self.result_as_parsed_xml
-        
+
         # Original query parameters
         self.record_schema = record_schema
         self.version = version
         self.maximum_records = maximum_records
         self.start_record = start_record
         self.query = query
-        
-        # Calculated infos
-        self.nb_results = self.get_nb_results()
-        self.records = self.get_records()
-        self.records_id = self.get_records_id()
+
+        if streaming:
+            self.__source = result
+            self.__stream = None
+            self.__pending_records = deque()
+            self.__nb_results = None
+            self.__next_record_position = None
+            return
+
+        self.result_as_string = result
+        self.__frozen_xml = frozen_xml
+
+    # Calculated infos, computed on first access then cached
+
+    @cached_property
+    def result_as_parsed_xml(self) -> ET.Element:
+        """The parsed response, lxml element if lxml is installed. Not set in streaming mode"""
+        if self.__frozen_xml is not None:
+            return copy.deepcopy(self.__frozen_xml)
+        return fromstring(self.result_as_string)
+
+    @cached_property
+    def result(self) -> ET.Element:
+        """Same as result_as_parsed_xml. Not set in streaming mode"""
+        return self.result_as_parsed_xml
+
+    @cached_property
+    def nb_results(self) -> int:
+        """The number of results as an int (see get_nb_results())"""
+        return self.get_nb_results()
+
+    @cached_property
+    def records(self) -> List[ET.Element]:
+        """All zs:record Elements as a list (see get_records()), lxml elements if lxml is installed. Not set in streaming mode"""
+        return self.get_records()
+
+    @cached_property
+    def records_id(self) -> List[str]:
+        """All records 001 as a list of strings (see get_records_id()). Not set in streaming mode"""
+        return self.get_records_id()
 
     def get_result(self):
             """Return the result as a string or ET Element depending the chosen recordPacking"""
@@ -531,6 +756,15 @@ class SRU_Result_Search(object):
 
     def get_nb_results(self):
         """Returns the number of results as an int."""
+        if self.streaming:
+            # numberOfRecords comes before the records : parse until it is found
+            stream = self.__get_stream()
+            while self.__nb_results is None:
+                try:
+                    self.__pending_records.append(next(stream))
+                except StopIteration:
+                    break
+            return self.__nb_results or 0
         if self.result_as_parsed_xml.findall(f"zs{self.version}:numberOfRecords", XML_NS):
             # Abes SRU crashed FCR because numberofrecords return None
             try:
@@ -540,15 +774,112 @@ class SRU_Result_Search(object):
         else: 
             return 0
 
+    def get_next_record_position(self) -> int|None:
+        """Returns the nextRecordPosition as an int, or None if the response has none (last page).
+        In streaming mode, it is only known once all records were read"""
+        if self.error:
+            return None
+        if self.streaming:
+            return self.__next_record_position
+        try:
+            return int(self.result_as_parsed_xml.find(f"zs{self.version}:nextRecordPosition", XML_NS).text)
+        except (AttributeError, TypeError, ValueError):
+            return None
+
     def get_records(self):
-        """Returns all records as a list"""
+        """Returns all zs:record Elements as a list (lxml elements if lxml is installed, see iter_records())"""
         return self.result_as_parsed_xml.findall(f".//zs{self.version}:record", XML_NS)
     
     def get_records_id(self):
         """Returns all records as a list of strings"""
-        records = self.get_records()
-        output = []
-        for record in records:
-            # Controlfield 001 search
-            output.append(record.find(".//marc:controlfield[@tag='001']", XML_NS).text)
-        return output
+        selector = compile_selector("001")
+        # Controlfield 001 of each record, None if it has none
+        return [selector.first(record) for record in self.records]
+
+    def iter_records(self) -> Iterator[ET.Element]:
+        """Yields each record as a marc:record Element.
+        If lxml is installed, they are lxml elements, else xml.etree.ElementTree Elements (see Koha_XML_Backend) :
+        lxml adds .getparent() & co, and its etree.tostring() returns bytes by default.
+        Use Koha_XML_Backend.tostring() to serialize them whatever the backend.
+        In streaming mode, records are parsed while they are read, and each of them
+        is freed once the next one is requested (unless the caller kept a reference to it).
+        Streaming results can only be iterated once"""
+        if self.error:
+            return
+        if not self.streaming:
+            for record in self.records:
+                marc_record = record.find(".//marc:record", XML_NS)
+                if marc_record is not None:
+                    yield marc_record
+            return
+        stream = self.__get_stream()
+        while self.__pending_records:
+            yield self.__pending_records.popleft()
+        yield from stream
+
+    def iter_marc_records(self) -> Iterator[MARC_Record]:
+        """Yields each record as a Koha_MARC_Record.MARC_Record (see iter_records()).
+        In streaming mode, only one record is kept as an ET Element at once"""
+        for record in self.iter_records():
+            yield MARC_Record.from_marcxml(record)
+
+    def get_marc_records(self) -> List[MARC_Record]:
+        """Returns all records as a list of Koha_MARC_Record.MARC_Record"""
+        return list(self.iter_marc_records())
+
+    def buffer(self) -> None:
+        """In streaming mode, downloads the whole response before any parsing.
+        Frees the connection early, at the cost of keeping the raw response in memory"""
+        if self.streaming and not self.error and self.__stream is None:
+            source = self.__source
+            self.__source = io.BytesIO(source.read())
+            source.close()
+
+    def close(self) -> None:
+        """In streaming mode, closes the response stream"""
+        if self.streaming and not self.error:
+            self.__source.close()
+
+    def __get_stream(self) -> Iterator[ET.Element]:
+        """Returns the generator parsing the response stream, creating it on first call"""
+        if self.__stream is None:
+            self.__stream = self.__parse_stream()
+        return self.__stream
+
+    def __parse_stream(self) -> Iterator[ET.Element]:
+        """Parses the response stream with iterparse, yielding each marc:record Element.
+        Each zs:record is cleared & detached once its marc:record was consumed"""
+        ns = XML_NS[f"zs{self.version}"]
+        nb_results_tag = f"{{{ns}}}numberOfRecords"
+        next_position_tag = f"{{{ns}}}nextRecordPosition"
+        records_tag = f"{{{ns}}}records"
+        record_tag = f"{{{ns}}}record"
+        marc_record_tag = f"{{{XML_NS['marc']}}}record"
+        container = None
+        try:
+            for event, elem in iterparse(self.__source, events=("start", "end"),
+                                         tags=(nb_results_tag, next_position_tag, records_tag, record_tag, marc_record_tag)):
+                if event == "start":
+                    if elem.tag == records_tag:
+                        container = elem
+                elif elem.tag == marc_record_tag:
+                    yield elem
+                elif elem.tag == record_tag:
+                    elem.clear()
+                    if container is not None:
+                        container.remove(elem)
+                elif elem.tag == nb_results_tag:
+                    # Abes SRU crashed FCR because numberofrecords return None
+                    try:
+                        self.__nb_results = int(elem.text)
+                    except (TypeError, ValueError):
+                        self.__nb_results = 0
+                elif elem.tag == next_position_tag:
+                    try:
+                        self.__next_record_position = int(elem.text)
+                    except (TypeError, ValueError):
+                        pass
+        finally:
+            if self.__nb_results is None:
+                self.__nb_results = 0
+            self.__source.close()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# Coalesces duplicate concurrent calls, used by KohaRESTAPIClient.get_biblio & get_auth
+
+# external imports
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+# ----------------- Class def -----------------
+
+class Flight(object):
+    """Flight
+    =======
+    A call in progress : waiters block on done until the leader sets result or error"""
+    __slots__ = ("done", "result", "error", "nb_waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error:BaseException = None
+        self.nb_waiters = 0
+
+class Single_Flight(object):
+    """Single_Flight
+    =======
+    Thread-safe : while a call for a key is in progress, other calls with the same key
+    wait for it and get the same result (or exception) instead of running the function again.
+    The result is not kept once the call ended (see Koha_Cache for caching)."""
+
+    def __init__(self):
+        self.__flights:Dict[Hashable, Flight] = {}
+        self.__lock = threading.Lock()
+        # Stats
+        self.nb_calls = 0
+        self.nb_shared = 0
+
+    def do(self, key:Hashable, func:Callable[[], Any]) -> Any:
+        """Returns func(), or the result of the call in progress for this key.
+        Raises the exception raised by func
+
+        Takes as argument :
+            - key {hashable} : identifies identical calls
+            - func {callable} : the call, without arguments"""
+        with self.__lock:
+            self.nb_calls += 1
+            flight = self.__flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight()
+                self.__flights[key] = flight
+            else:
+                flight.nb_waiters += 1
+                self.nb_shared += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = func()
+            return flight.result
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self.__lock:
+                # forget() may have removed it, and a new call for the key may be in progress
+                if self.__flights.get(key) is flight:
+                    del self.__flights[key]
+            flight.done.set()
+
+    def forget(self, key:Hashable) -> None:
+        """Stops sharing the call in progress for this key (e.g. its result is outdated) :
+        later calls run func again. Callers already waiting still get its result
+
+        Takes as argument :
+            - key {hashable} : identifies identical calls"""
+        with self.__lock:
+            self.__flights.pop(key, None)
+
+    def stats(self) -> Dict:
+        """Returns the counters as a dict"""
+        with self.__lock:
+            return {
+                "in_flight":len(self.__flights),
+                "calls":self.nb_calls,
+                "shared":self.nb_shared
+            }
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+# XML parsing backend : lxml when it is installed, xml.etree.ElementTree otherwise.
+# Selected once at import, used by Koha_SRU, Koha_API_PublicBiblio, Koha_MARC_Record & Koha_REST_API_Client
+
+# external imports
+import xml.etree.ElementTree as std_ET
+from typing import IO, Iterator, Tuple
+
+try:
+    from lxml import etree as ET
+    BACKEND = "lxml"
+    # Koha_MARC_File_Reader still builds xml.etree Elements
+    ELEMENT_TYPES = (ET._Element, std_ET.Element)
+except ImportError:
+    import xml.etree.ElementTree as ET
+    BACKEND = "ElementTree"
+    ELEMENT_TYPES = (std_ET.Element,)
+
+# Raised by fromstring() & iterparse() on malformed XML (lxml's XMLSyntaxError inherits from it)
+ParseError = ET.ParseError
+
+# ----------------- Func def -----------------
+
+def is_element(obj) -> bool:
+    """Returns True if obj is an Element of any backend"""
+    return isinstance(obj, ELEMENT_TYPES)
+
+def fromstring(text:str|bytes):
+    """Parses an XML document and returns its root Element.
+    lxml refuses str with an encoding declaration : str are encoded to UTF-8 bytes first"""
+    if BACKEND == "lxml" and isinstance(text, str):
+        text = text.encode("utf-8")
+    return ET.fromstring(text)
+
+def iterparse(source:IO[bytes], events:Tuple[str, ...]=("end",), tags:Tuple[str, ...]=None) -> Iterator[Tuple[str, object]]:
+    """Yields (event, Element) while parsing a binary file-like object.
+    tags {tuple of "{ns}local"} : with lxml, only these elements are reported (filtered in C).
+    ElementTree reports all elements : the caller must still check elem.tag"""
+    if BACKEND == "lxml" and tags:
+        return ET.iterparse(source, events=events, tag=tags)
+    return ET.iterparse(source, events=events)
+
+def tostring(elem) -> bytes:
+    """Returns an Element serialized as UTF-8 bytes, without XML declaration, whatever the backend"""
+    if BACKEND == "lxml" and isinstance(elem, ET._Element):
+        return ET.tostring(elem, encoding="utf-8")
+    return std_ET.tostring(elem, encoding="utf-8")
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+# Compares xml.etree.ElementTree & lxml on SRU pages of MARCXML records.
+# Run from the repository root : python benchmarks/bench_xml_backend.py [--records 1000] [--repeat 5]
+
+# external imports
+import argparse
+import io
+import time
+import xml.etree.ElementTree as std_ET
+try:
+    from lxml import etree as lxml_ET
+except ImportError:
+    lxml_ET = None
+
+# internal imports
+from samples import sample_record, sru_page
+from Koha_MARC_Record import MARC_Record
+from Koha_MARC_Selector import Tag_Index, compile_selector
+import Koha_XML_Backend
+
+MARC_RECORD_TAG = "{http://www.loc.gov/MARC21/slim}record"
+ZS_RECORD_TAG = "{http://www.loc.gov/zing/srw/}record"
+
+# ----------------- Func def -----------------
+
+def best_time(func, repeat:int) -> float:
+    """Returns the fastest of repeat runs of func, in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def parse(etree, page:bytes):
+    """Parses the whole page"""
+    return etree.fromstring(page)
+
+def stream(etree, page:bytes) -> int:
+    """Parses the page the way Koha_SRU streaming mode does : each zs:record is cleared once read"""
+    nb = 0
+    # lxml reports only these tags (filtered in C), like Koha_XML_Backend.iterparse()
+    options = {"tag":(MARC_RECORD_TAG, ZS_RECORD_TAG)} if etree is lxml_ET else {}
+    for _, elem in etree.iterparse(io.BytesIO(page), events=("end",), **options):
+        if elem.tag == MARC_RECORD_TAG:
+            nb += 1
+        elif elem.tag == ZS_RECORD_TAG:
+            elem.clear()
+    return nb
+
+def records_id(etree, page:bytes) -> list:
+    """Parses the page & returns the 001 of each record, like SRU_Result_Search.get_records_id()"""
+    selector = compile_selector("001")
+    return [selector.first(record) for record in etree.fromstring(page).iter(MARC_RECORD_TAG)]
+
+def extract(etree, page:bytes) -> list:
+    """Parses the page & reads 5 fields of each record from a single Tag_Index"""
+    selectors = [compile_selector(path) for path in ("001", "200$a", "214|210$c", "100$a[9:13]", "606$a")]
+    output = []
+    for record in etree.fromstring(page).iter(MARC_RECORD_TAG):
+        index = Tag_Index(record)
+        output.append([selector.values(index) for selector in selectors])
+    return output
+
+def to_marc_records(etree, page:bytes) -> list:
+    """Parses the page & converts each record to a MARC_Record"""
+    return [MARC_Record.from_marcxml(record) for record in etree.fromstring(page).iter(MARC_RECORD_TAG)]
+
+CASES = [
+    ("fromstring", parse),
+    ("iterparse (streaming)", stream),
+    ("fromstring + records id", records_id),
+    ("fromstring + 5 selectors", extract),
+    ("fromstring + MARC_Record", to_marc_records)
+]
+
+# ----------------- Main -----------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compares the XML parsers on SRU pages of MARCXML records")
+    parser.add_argument("--records", type=int, default=1000, help="records per page (defaults to 1000)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per case, the fastest is kept (defaults to 5)")
+    args = parser.parse_args()
+
+    page = sru_page(sample_record(id) for id in range(1, args.records + 1))
+    backends = [("ElementTree", std_ET)]
+    if lxml_ET is not None:
+        backends.append(("lxml", lxml_ET))
+    print(f"Koha_XML_Backend : {Koha_XML_Backend.BACKEND}")
+    print(f"Page : {args.records} records, {len(page) / 1024 / 1024:.1f} MiB, best of {args.repeat} runs")
+    if lxml_ET is None:
+        print("lxml is not installed : only ElementTree is measured")
+    print(f"{'case':<28}" + "".join(f"{name:>22}" for name, _ in backends))
+    for case, func in CASES:
+        times = [best_time(lambda: func(etree, page), args.repeat) for _, etree in backends]
+        line = f"{case:<28}" + "".join(f"{elapsed * 1000:>10.1f} ms {args.records / elapsed:>7.0f}/s" for elapsed in times)
+        if len(times) == 2:
+            line += f"   x{times[0] / times[1]:.2f}"
+        print(line)
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+# Offline stand-in for a Koha server, for the benchmarks.
+# Emulates the REST API (oauth/token, biblios, authorities, public/biblios) & the SRU (/biblios).
+# Run it on its own : python benchmarks/mock_koha.py --port 8080 --latency 0.02
+# or let run_benchmarks.py start it in a separate process
+
+# external imports
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# internal imports
+from samples import sample_record, sample_authority, sru_page
+
+MARCXML = "application/marcxml+xml"
+MARC_IN_JSON = "application/marc-in-json"
+RAW_MARC = "application/marc"
+RAW_TEXT = "text/plain"
+JSON = "application/json"
+
+RECORD_PATH = re.compile(r"^/api/v1/(public/biblios|biblios|authorities)/+(\d+)$")
+
+SRU_EXPLAIN = b'<?xml version="1.0" encoding="UTF-8"?>\n<zs:explainResponse xmlns:zs="http://www.loc.gov/zing/srw/">'\
+    b'<zs:version>1.1</zs:version><zs:record><zs:recordSchema>http://explain.z3950.org/dtd/2.0/</zs:recordSchema>'\
+    b'<zs:recordPacking>xml</zs:recordPacking><zs:recordData><explain xmlns="http://explain.z3950.org/dtd/2.0/">'\
+    b'<serverInfo protocol="SRU"><host>localhost</host><port>9999</port><database>biblios</database></serverInfo>'\
+    b'</explain></zs:recordData></zs:record></zs:explainResponse>'
+
+# ----------------- Class def -----------------
+
+class Mock_Koha_Config(object):
+    """Mock_Koha_Config
+    =======
+    What the mock server answers.
+    On init take as arguments :
+    - [optional] latency {float} : seconds waited before each answer (defaults to 0)
+    - [optional] jitter {float} : random seconds added to latency, between 0 and jitter (defaults to 0)
+    - [optional] nb_records {int} : number of biblios & authorities, ids from 1 to nb_records (others are 404).
+    Also the number of SRU results (defaults to 10000)
+    - [optional] nb_items {int} : 995 fields per biblio (defaults to 3)
+    - [optional] abstract_size {int} : length of the 330$a of each biblio, to tune the payload size (defaults to 600)
+    - [optional] token_lifetime {int} : expires_in of the OAuth tokens (defaults to 3600)
+    - [optional] sru_max_records {int} : caps the SRU maximumRecords, like a server configured with a lower limit (defaults to None, no cap)"""
+
+    def __init__(self, latency:float=0, jitter:float=0, nb_records:int=10000, nb_items:int=3, abstract_size:int=600, token_lifetime:int=3600, sru_max_records:int=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.nb_records = nb_records
+        self.nb_items = nb_items
+        self.abstract_size = abstract_size
+        self.token_lifetime = token_lifetime
+        self.sru_max_records = sru_max_records
+
+        # Payloads are rendered once : the server must not compete with the measured client for the CPU
+        @lru_cache(maxsize=20000)
+        def biblio(id:int, format:str) -> bytes:
+            return render(sample_record(id, self.nb_items, self.abstract_size), format)
+
+        @lru_cache(maxsize=20000)
+        def authority(id:int, format:str) -> bytes:
+            return render(sample_authority(id), format)
+
+        @lru_cache(maxsize=64)
+        def search_page(version:str, start:int, nb:int) -> bytes:
+            records = (sample_record(id, self.nb_items, self.abstract_size) for id in range(start, start + nb))
+            return sru_page(records, self.nb_records, start, version)
+
+        self.biblio = biblio
+        self.authority = authority
+        self.search_page = search_page
+
+    def wait(self) -> None:
+        """Waits for the configured latency"""
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            time.sleep(delay)
+
+def render(record, format:str) -> bytes:
+    """Returns a sample record in the requested format"""
+    if format == MARC_IN_JSON:
+        return json.dumps(record.to_marc_in_json()).encode("utf-8")
+    if format == RAW_MARC:
+        return record.to_iso2709()
+    if format == RAW_TEXT:
+        return repr(record).encode("utf-8")
+    if format == JSON:
+        return json.dumps({"biblio_id":record.get_value("001"), "title":record.get_value("200", "a")}).encode("utf-8")
+    return b'<?xml version="1.0" encoding="UTF-8"?>\n' + record.to_marcxml()
+
+class Mock_Koha_Handler(BaseHTTPRequestHandler):
+    """Answers the requests, with the Mock_Koha_Config set as the server config attribute"""
+    protocol_version = "HTTP/1.1"
+    # Without it, keep-alive requests wait for the delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, status:int, body:bytes=b"", content_type:str=JSON, headers:dict=None) -> None:
+        """Sends the answer"""
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def read_body(self) -> bytes:
+        """Reads the request body so the connection can be reused"""
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def do_POST(self):
+        self.read_body()
+        config = self.server.config
+        if self.path.startswith("/api/v1/oauth/token"):
+            self.server.count("token")
+            return self.send(200, json.dumps({"access_token":f"token{time.monotonic_ns()}", "token_type":"Bearer",
+                                               "expires_in":config.token_lifetime}).encode("utf-8"))
+        if self.path.rstrip("/") == "/api/v1/biblios":
+            self.server.count("write")
+            config.wait()
+            return self.send(200, json.dumps({"id":random.randint(1, config.nb_records)}).encode("utf-8"))
+        self.send(404, b'{"error":"Not found"}')
+
+    def do_PUT(self):
+        self.read_body()
+        config = self.server.config
+        match = RECORD_PATH.match(self.path)
+        if match and match.group(1) == "biblios":
+            self.server.count("write")
+            config.wait()
+            return self.send(200, json.dumps({"id":int(match.group(2))}).encode("utf-8"))
+        self.send(404, b'{"error":"Not found"}')
+
+    def do_GET(self):
+        self.read_body()
+        config = self.server.config
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        accept = self.headers.get("accept", MARCXML)
+        if url.path.rstrip("/") == "/biblios":
+            self.server.count("sru")
+            config.wait()
+            return self.sru(params)
+        if url.path.rstrip("/") == "/api/v1/authorities":
+            self.server.count("list")
+            config.wait()
+            return self.authorities_page(params, accept)
+        match = RECORD_PATH.match(url.path)
+        if match is None:
+            return self.send(404, b'{"error":"Not found"}')
+        self.server.count("record")
+        config.wait()
+        endpoint, id = match.group(1), int(match.group(2))
+        if not 0 < id <= config.nb_records:
+            return self.send(404, b'{"error":"Object not found"}')
+        # Sample records never change : their ETag only depends on the id & format
+        etag = f'"{endpoint}/{id}/{accept}"'
+        if self.headers.get("If-None-Match") == etag:
+            return self.send(304, headers={"ETag":etag})
+        payload = config.authority if endpoint == "authorities" else config.biblio
+        self.send(200, payload(id, accept), accept, {"ETag":etag})
+
+    def authorities_page(self, params:dict, accept:str) -> None:
+        """Answers a paginated authority list, with X-Total-Count"""
+        config = self.server.config
+        page = int(params.get("_page", ["1"])[0])
+        per_page = int(params.get("_per_page", ["20"])[0])
+        ids = range((page - 1) * per_page + 1, min(page * per_page, config.nb_records) + 1)
+        headers = {"X-Total-Count":str(config.nb_records)}
+        if accept == JSON:
+            body = json.dumps([{"authority_id":id, "framework_id":"NP"} for id in ids]).encode("utf-8")
+        elif accept == MARC_IN_JSON:
+            body = b"[" + b",".join(config.authority(id, MARC_IN_JSON) for id in ids) + b"]"
+        elif accept == RAW_MARC:
+            body = b"".join(config.authority(id, RAW_MARC) for id in ids)
+        else:
+            accept = MARCXML
+            body = b'<?xml version="1.0" encoding="UTF-8"?>\n<collection xmlns="http://www.loc.gov/MARC21/slim">'\
+                + b"".join(config.authority(id, MARCXML).split(b"?>", 1)[1] for id in ids) + b"</collection>"
+        self.send(200, body, accept, headers)
+
+    def sru(self, params:dict) -> None:
+        """Answers an SRU explain or searchRetrieve request"""
+        config = self.server.config
+        if params.get("operation", [""])[0] == "explain":
+            return self.send(200, SRU_EXPLAIN, "text/xml")
+        version = params.get("version", ["1.1"])[0]
+        start = int(params.get("startRecord", ["1"])[0])
+        maximum = int(params.get("maximumRecords", ["100"])[0])
+        if config.sru_max_records is not None:
+            maximum = min(maximum, config.sru_max_records)
+        nb = max(min(start + maximum - 1, config.nb_records) - start + 1, 0)
+        self.send(200, config.search_page(version, start, nb), "text/xml")
+
+class Mock_Koha(ThreadingHTTPServer):
+    """Mock_Koha
+    =======
+    A threaded HTTP server answering like Koha, with sample UNIMARC records.
+    On init take as arguments :
+    - [optional] config {Mock_Koha_Config} : defaults to Mock_Koha_Config()
+    - [optional] host {str} : defaults to 127.0.0.1
+    - [optional] port {int} : defaults to 0, any free port
+    Use start() to serve in a background thread, or serve_forever()"""
+    daemon_threads = True
+
+    def __init__(self, config:Mock_Koha_Config=None, host:str="127.0.0.1", port:int=0):
+        super().__init__((host, port), Mock_Koha_Handler)
+        self.config = config if config is not None else Mock_Koha_Config()
+        self.counters = {}
+        self.__lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        """Returns the server URL, to use as the Koha URL (REST API & SRU)"""
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def count(self, counter:str) -> None:
+        """Counts a request"""
+        with self.__lock:
+            self.counters[counter] = self.counters.get(counter, 0) + 1
+
+    def start(self) -> str:
+        """Serves in a daemon thread and returns the server URL"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.url
+
+    def stop(self) -> None:
+        """Stops serving & closes the socket"""
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+# ----------------- Main -----------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline Koha stand-in for the benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="defaults to any free port")
+    parser.add_argument("--latency", type=float, default=0, help="seconds waited before each answer")
+    parser.add_argument("--jitter", type=float, default=0, help="random extra latency, between 0 and jitter seconds")
+    parser.add_argument("--records", type=int, default=10000, help="number of biblios & authorities, and of SRU results")
+    parser.add_argument("--items", type=int, default=3, help="995 fields per biblio")
+    parser.add_argument("--abstract-size", type=int, default=600, help="length of the 330$a of each biblio")
+    args = parser.parse_args()
+
+    server = Mock_Koha(Mock_Koha_Config(args.latency, args.jitter, args.records, args.items, args.abstract_size), args.host, args.port)
+    # The first line is read by run_benchmarks.py
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+
+# Benchmarks the clients against the offline Koha stand-in (mock_koha.py) :
+# throughput, p50 / p99 latency & peak memory of single calls, bulk fetches, SRU harvests & record parsing.
+# Run from the repository root : python benchmarks/run_benchmarks.py [--latency 0.02] [--save results.json] [--baseline results.json]
+# These are benchmarks, not tests : nothing here needs a Koha instance or a .env file
+
+# external imports
+import argparse
+import gc
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+# internal imports
+from samples import sample_record, sru_page
+from mock_koha import render, MARCXML, MARC_IN_JSON, RAW_MARC
+from Koha_REST_API_Client import KohaRESTAPIClient, Content_Type, Status as Client_Status
+from Koha_API_PublicBiblio import Koha_API_PublicBiblio, Public_Biblio_Record, PublicBiblioFetcher
+from Koha_SRU import Koha_SRU, SRU_Version, SRU_Result_Search, Status
+from Koha_MARC_Record import MARC_Record
+from Koha_ISO2709 import iter_iso2709
+from Koha_Batch_Extract import Batch_Extractor
+import Koha_XML_Backend
+
+# ----------------- Class def -----------------
+
+class Bench_Context(object):
+    """Bench_Context
+    =======
+    What the cases share : the mock server URL, the options & the sample payloads for the parsing cases"""
+
+    def __init__(self, url:str, args:argparse.Namespace):
+        self.url = url
+        self.args = args
+        self.ids = [str(id) for id in range(1, min(args.calls, args.records) + 1)]
+        self.bulk_ids = [str(id) for id in range(1, min(args.bulk, args.records) + 1)]
+        records = [sample_record(id) for id in range(1, args.parse + 1)]
+        self.marcxml = [render(record, MARCXML) for record in records]
+        self.iso2709 = [render(record, RAW_MARC) for record in records]
+        self.marc_in_json = [render(record, MARC_IN_JSON) for record in records]
+        self.iso2709_file = b"".join(self.iso2709)
+        self.sru_page = sru_page(records)
+
+    def client(self) -> KohaRESTAPIClient:
+        """Returns a new REST API client"""
+        koha = KohaRESTAPIClient(self.url, "benchmark", "benchmark", pool_maxsize=self.args.workers)
+        if koha.status != Client_Status.SUCCESS:
+            raise RuntimeError(f"Can't get a token from {self.url} : {koha.error_msg}")
+        return koha
+
+class Case(object):
+    """Case
+    =======
+    A benchmark : func gets the Bench_Context and returns (number of operations, latency of each operation in seconds).
+    Latencies are None when operations overlap (bulk cases) : only the throughput is measured"""
+
+    def __init__(self, name:str, group:str, func:Callable[[Bench_Context], Tuple[int, List[float]|None]]):
+        self.name = name
+        self.group = group
+        self.func = func
+
+CASES:List[Case] = []
+
+def case(name:str, group:str):
+    """Registers a benchmark case"""
+    def register(func):
+        CASES.append(Case(name, group, func))
+        return func
+    return register
+
+# ----------------- Func def -----------------
+
+def timed_loop(items, func) -> Tuple[int, List[float]]:
+    """Calls func on each item and returns (number of calls, latency of each call)"""
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - start)
+    return len(latencies), latencies
+
+def percentile(latencies:List[float], p:int) -> float|None:
+    """Returns the p-th percentile of the latencies (None if there are less than 2)"""
+    if not latencies or len(latencies) < 2:
+        return None
+    return statistics.quantiles(latencies, n=100, method="inclusive")[p - 1]
+
+def run_case(bench:Case, ctx:Bench_Context, memory:bool) -> Dict:
+    """Runs a case once to warm up (server payloads, connections), once timed, then once under tracemalloc if memory is True"""
+    bench.func(ctx)
+    gc.collect()
+    start = time.perf_counter()
+    nb, latencies = bench.func(ctx)
+    elapsed = time.perf_counter() - start
+    result = {
+        "case":bench.name,
+        "group":bench.group,
+        "operations":nb,
+        "seconds":round(elapsed, 4),
+        "throughput":round(nb / elapsed, 1) if elapsed else None,
+        "p50_ms":None,
+        "p99_ms":None,
+        "peak_kib":None
+    }
+    if latencies:
+        result["p50_ms"] = round(percentile(latencies, 50) * 1000, 3)
+        result["p99_ms"] = round(percentile(latencies, 99) * 1000, 3)
+    if memory:
+        # Measured apart : tracemalloc slows allocations down a lot
+        gc.collect()
+        tracemalloc.start()
+        bench.func(ctx)
+        result["peak_kib"] = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    return result
+
+def start_mock(args:argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    """Starts mock_koha.py in a separate process (the server must not share the GIL with the measured client).
+    Returns the process & the server URL"""
+    process = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_koha.py"),
+                                "--latency", str(args.latency), "--jitter", str(args.jitter),
+                                "--records", str(args.records), "--items", str(args.items),
+                                "--abstract-size", str(args.abstract_size)],
+                               stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().strip()
+    if not url:
+        process.wait()
+        raise RuntimeError("mock_koha.py did not start")
+    return process, url
+
+def compare(results:List[Dict], baseline_path:str, tolerance:float) -> List[str]:
+    """Returns the regressions against a saved run : throughput lower or p99 higher than the baseline by more than tolerance"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {result["case"]:result for result in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        before = baseline.get(result["case"])
+        if before is None:
+            continue
+        if before["throughput"] and result["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{result['case']} : throughput {before['throughput']}/s -> {result['throughput']}/s")
+        if before["p99_ms"] and result["p99_ms"] and result["p99_ms"] > before["p99_ms"] * (1 + tolerance):
+            regressions.append(f"{result['case']} : p99 {before['p99_ms']} ms -> {result['p99_ms']} ms")
+    return regressions
+
+def print_results(results:List[Dict]) -> None:
+    """Prints the results as a table"""
+    def fmt(value, unit=""):
+        return "-" if value is None else f"{value}{unit}"
+    print(f"{'case':<44}{'ops':>7}{'ops/s':>11}{'p50':>12}{'p99':>12}{'peak':>12}")
+    for result in results:
+        print(f"{result['case']:<44}{result['operations']:>7}{fmt(result['throughput']):>11}"
+              f"{fmt(result['p50_ms'], ' ms'):>12}{fmt(result['p99_ms'], ' ms'):>12}{fmt(result['peak_kib'], ' KiB'):>12}")
+
+# ----------------- Cases -----------------
+
+# ---------- Single calls ----------
+
+@case("get_biblio (RAW_MARC)", "single")
+def get_biblio(ctx:Bench_Context):
+    with ctx.client() as koha:
+        return timed_loop(ctx.ids, lambda id: koha.get_biblio(id, Content_Type.RAW_MARC))
+
+@case("get_biblio_record (MARCXML)", "single")
+def get_biblio_record(ctx:Bench_Context):
+    with ctx.client() as koha:
+        return timed_loop(ctx.ids, lambda id: koha.get_biblio_record(id, Content_Type.MARCXML))
+
+@case("get_auth (RAW_MARC)", "single")
+def get_auth(ctx:Bench_Context):
+    with ctx.client() as koha:
+        return timed_loop(ctx.ids, lambda id: koha.get_auth(id, Content_Type.RAW_MARC))
+
+@case("Koha_API_PublicBiblio (MARCXML)", "single")
+def public_biblio(ctx:Bench_Context):
+    return timed_loop(ctx.ids, lambda id: Koha_API_PublicBiblio(id, ctx.url).get_title_info())
+
+@case("SRU search (100 records)", "single")
+def sru_search(ctx:Bench_Context):
+    sru = Koha_SRU(ctx.url, SRU_Version.V1_1)
+    starts = range(1, min(ctx.args.records, 100 * 20), 100)
+    return timed_loop(starts, lambda start: sru.search("dc.title=benchmark", start_record=start, maximum_records=100).get_records_id())
+
+# ---------- Bulk fetches ----------
+
+@case("get_biblios (bulk, RAW_MARC)", "bulk")
+def get_biblios(ctx:Bench_Context):
+    with ctx.client() as koha:
+        return sum(1 for _ in koha.get_biblios(ctx.bulk_ids, Content_Type.RAW_MARC, max_workers=ctx.args.workers)), None
+
+@case("get_auths (bulk, RAW_MARC)", "bulk")
+def get_auths(ctx:Bench_Context):
+    with ctx.client() as koha:
+        return sum(1 for _ in koha.get_auths(ctx.bulk_ids, Content_Type.RAW_MARC, max_workers=ctx.args.workers)), None
+
+@case("PublicBiblioFetcher (bulk, MARCXML)", "bulk")
+def public_biblio_fetcher(ctx:Bench_Context):
+    with PublicBiblioFetcher(ctx.url, max_workers=ctx.args.workers) as fetcher:
+        return sum(1 for record in fetcher.fetch(ctx.bulk_ids) if record.get_title_info()), None
+
+@case("iter_authorities (100 per page, RAW_MARC)", "bulk")
+def iter_authorities(ctx:Bench_Context):
+    with ctx.client() as koha:
+        return sum(1 for _ in koha.iter_authorities(per_page=100, format=Content_Type.RAW_MARC)), None
+
+# ---------- SRU harvests ----------
+
+@case("SRU iter_search (1000 per page)", "harvest")
+def sru_harvest(ctx:Bench_Context):
+    sru = Koha_SRU(ctx.url, SRU_Version.V1_1)
+    return sum(1 for _ in sru.iter_search("dc.title=benchmark", page_size=1000)), None
+
+@case("SRU iter_search + MARC_Record", "harvest")
+def sru_harvest_records(ctx:Bench_Context):
+    sru = Koha_SRU(ctx.url, SRU_Version.V1_1)
+    return sum(1 for record in sru.iter_search("dc.title=benchmark", page_size=1000) if MARC_Record.from_marcxml(record).leader), None
+
+# ---------- Record parsing ----------
+
+@case("parse MARCXML -> MARC_Record", "parsing")
+def parse_marcxml(ctx:Bench_Context):
+    return timed_loop(ctx.marcxml, MARC_Record.from_marcxml)
+
+@case("parse ISO2709 -> MARC_Record", "parsing")
+def parse_iso2709(ctx:Bench_Context):
+    return timed_loop(ctx.iso2709, MARC_Record.from_iso2709)
+
+@case("parse marc-in-json -> MARC_Record", "parsing")
+def parse_marc_in_json(ctx:Bench_Context):
+    return timed_loop(ctx.marc_in_json, MARC_Record.from_marc_in_json)
+
+@case("Public_Biblio_Record parse + accessors", "parsing")
+def parse_public_biblio(ctx:Bench_Context):
+    def parse(content):
+        record = Public_Biblio_Record("1", content=content)
+        return record.get_title_info(), record.get_dates_pub(), record.get_editeurs(), record.get_ppn("009")
+    return timed_loop(ctx.marcxml, parse)
+
+@case("SRU page (records id)", "parsing")
+def parse_sru_page(ctx:Bench_Context):
+    result = SRU_Result_Search(Status.SUCCESS, None, ctx.sru_page, "marcxml", "1.1", ctx.args.parse, 1, "benchmark", ctx.url)
+    return len(result.get_records_id()), None
+
+@case("Batch_Extractor (ISO2709 file, 5 columns)", "parsing")
+def batch_extract(ctx:Bench_Context):
+    extractor = Batch_Extractor(["001", "200$a", "214|210$c", "100$a[9:13]", "606$a"], multiple="join")
+    return len(extractor.extract(iter_iso2709(ctx.iso2709_file))["001"]), None
+
+# ----------------- Main -----------------
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks against an offline Koha stand-in")
+    parser.add_argument("--url", help="URL of an already running mock_koha.py (defaults to starting one)")
+    parser.add_argument("--group", action="append", choices=["single", "bulk", "harvest", "parsing"], help="only run these groups (repeatable)")
+    parser.add_argument("--case", help="only run the cases whose name contains this text")
+    parser.add_argument("--latency", type=float, default=0.005, help="mock server latency in seconds (defaults to 0.005)")
+    parser.add_argument("--jitter", type=float, default=0, help="mock server random extra latency in seconds")
+    parser.add_argument("--records", type=int, default=5000, help="records on the mock server, harvested by the SRU cases (defaults to 5000)")
+    parser.add_argument("--items", type=int, default=3, help="995 fields per biblio (defaults to 3)")
+    parser.add_argument("--abstract-size", type=int, default=600, help="length of the 330$a of each biblio (defaults to 600)")
+    parser.add_argument("--calls", type=int, default=200, help="requests per single call case (defaults to 200)")
+    parser.add_argument("--bulk", type=int, default=2000, help="records per bulk case (defaults to 2000)")
+    parser.add_argument("--workers", type=int, default=10, help="concurrent requests of the bulk cases (defaults to 10)")
+    parser.add_argument("--parse", type=int, default=1000, help="records per parsing case (defaults to 1000)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc runs")
+    parser.add_argument("--save", help="writes the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON file saved by a previous run : exits with 1 if a case regressed")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="regression tolerance against the baseline (defaults to 0.25)")
+    args = parser.parse_args()
+
+    process = None
+    url = args.url
+    if url is None:
+        process, url = start_mock(args)
+    try:
+        ctx = Bench_Context(url, args)
+        print(f"Mock Koha : {url} (latency {args.latency}s) || XML backend : {Koha_XML_Backend.BACKEND} || Python {sys.version.split()[0]}")
+        results = []
+        for bench in CASES:
+            if args.group and bench.group not in args.group:
+                continue
+            if args.case and args.case.lower() not in bench.name.lower():
+                continue
+            results.append(run_case(bench, ctx, not args.no_memory))
+        print_results(results)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({"latency":args.latency, "xml_backend":Koha_XML_Backend.BACKEND, "results":results}, f, indent=2)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+# Representative UNIMARC records & SRU pages for the benchmarks
+
+# external imports
+import os
+import sys
+from xml.sax.saxutils import escape
+
+# The Koha_* modules are at the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# internal imports
+from Koha_MARC_Record import MARC_Record, MARC_Field, MARC_Subfield
+
+SRU_NS = {
+    "1.1": "http://www.loc.gov/zing/srw/",
+    "2.0": "http://docs.oasis-open.org/ns/search-ws/sruResponse"
+}
+
+# ----------------- Func def -----------------
+
+def sample_record(id:int, nb_items:int=3, abstract_size:int=600) -> MARC_Record:
+    """Returns a UNIMARC monograph record looking like a Koha one (about 40 fields with 3 items)
+
+    Takes as argument :
+        - id {int} : the biblionumber, in 001
+        - [optionnal] nb_items {int} : number of 995 fields
+        - [optionnal] abstract_size {int} : length of the 330$a abstract, to tune the payload size"""
+    def datafield(tag, *subfields, ind1=" ", ind2=" "):
+        return MARC_Field(tag, ind1=ind1, ind2=ind2, subfields=[MARC_Subfield(code, value) for code, value in subfields])
+    year = 1950 + id % 70
+    fields = [
+        MARC_Field("001", value=str(id)),
+        MARC_Field("003", value=f"http://www.sudoc.fr/{id:08d}X"),
+        MARC_Field("005", value="20230512093000.0"),
+        datafield("010", ("a", f"978-2-07-{id % 1000000:06d}-5"), ("b", "br."), ("d", "22 EUR")),
+        datafield("010", ("z", f"2-07-{id % 1000000:06d}")),
+        datafield("035", ("a", f"(OCoLC){900000000 + id}")),
+        datafield("035", ("a", f"PPN{id:08d}X")),
+        datafield("100", ("a", f"20230512d{year}    m  y0frey50      ba")),
+        datafield("101", ("a", "fre"), ("c", "eng"), ind1="1"),
+        datafield("102", ("a", "FR")),
+        datafield("105", ("a", "y   z   000yy")),
+        datafield("106", ("a", "r")),
+        datafield("181", ("6", "z01"), ("c", "txt"), ("2", "rdacontent")),
+        datafield("182", ("6", "z01"), ("c", "n"), ("2", "rdamedia")),
+        datafield("183", ("6", "z01"), ("a", "nga"), ("2", "RDAfrCarrier")),
+        datafield("200", ("a", f"Titre de la notice {id}"), ("e", "roman"), ("f", "Prénom Nom"), ("g", "traduit de l'anglais par Autre Nom"), ind1="1"),
+        datafield("214", ("a", "Paris"), ("c", "Gallimard"), ("d", f"DL {year}"), ind2="0"),
+        datafield("214", ("d", f"C {year - 1}"), ind2="4"),
+        datafield("215", ("a", f"{100 + id % 500} p."), ("c", "ill."), ("d", "21 cm")),
+        datafield("225", ("a", "Folio"), ("v", str(id % 7000)), ind1="0"),
+        datafield("300", ("a", "Bibliogr. p. 301-310. Index")),
+        datafield("320", ("a", "Notes bibliographiques")),
+        datafield("330", ("a", ("Résumé de l'ouvrage, avec des caractères accentués & des <symboles>. " * (abstract_size // 70 + 1))[:abstract_size])),
+        datafield("410", ("0", "013424165"), ("t", "Folio"), ("x", "0768-0732"), ("v", str(id % 7000)), ind2="|"),
+        datafield("606", ("3", "027224236"), ("a", "Roman"), ("y", "France"), ("z", "20e siècle"), ("2", "rameau")),
+        datafield("606", ("3", "027223701"), ("a", "Littérature"), ("x", "Histoire et critique"), ("2", "rameau")),
+        datafield("606", ("3", "027818497"), ("a", "Identité (psychologie)"), ("x", "Dans la littérature"), ("2", "rameau")),
+        datafield("608", ("3", "027220133"), ("a", "Fiction"), ("2", "rameau")),
+        datafield("676", ("a", "843.914"), ("v", "23")),
+        datafield("686", ("a", "PQ2663"), ("2", "lc")),
+        datafield("700", ("3", "026751925"), ("a", "Nom"), ("b", "Prénom"), ("f", "1940-...."), ("4", "070"), ind2="1"),
+        datafield("701", ("3", "027046990"), ("a", "Autre Nom"), ("b", "Autre Prénom"), ("4", "730"), ind2="1"),
+        datafield("801", ("a", "FR"), ("b", "Abes"), ("c", "20230512"), ("g", "AFNOR"), ind2="3"),
+        datafield("801", ("a", "FR"), ("b", "341725201"), ("c", "20230601"), ("g", "AFNOR"), ind2="2"),
+        datafield("930", ("5", f"341725201:{id}"), ("b", "341725201"), ("a", f"843 NOM {id % 100}"), ("j", "u")),
+    ]
+    for item in range(nb_items):
+        fields.append(datafield("995", ("b", "BU"), ("c", "BU"), ("f", f"{id:08d}{item:03d}"), ("k", f"843 NOM {id % 100}"), ("o", "0"), ("r", "LIV")))
+    return MARC_Record("00000cam0 22000003i 450 ", fields)
+
+def marcxml_collection(records) -> bytes:
+    """Returns records as a MARCXML collection"""
+    output = [b'<?xml version="1.0" encoding="UTF-8"?>\n<collection xmlns="http://www.loc.gov/MARC21/slim">\n']
+    for record in records:
+        output.append(record.to_marcxml())
+        output.append(b"\n")
+    output.append(b"</collection>\n")
+    return b"".join(output)
+
+def sru_page(records, nb_results:int=None, start_record:int=1, version:str="1.1") -> bytes:
+    """Returns a searchRetrieve response (SRU 1.1 or 2.0) with the records as MARCXML, the way Koha sends it
+
+    Takes as argument :
+        - records {iterable of MARC_Record}
+        - [optionnal] nb_results {int} : numberOfRecords (defaults to the number of records)
+        - [optionnal] start_record {int} : recordPosition of the first record
+        - [optionnal] version {str} : "1.1" or "2.0\""""
+    records = list(records)
+    if nb_results is None:
+        nb_results = len(records)
+    output = [f'<?xml version="1.0" encoding="UTF-8"?>\n<zs:searchRetrieveResponse xmlns:zs="{SRU_NS[version]}">'
+              f'<zs:version>{escape(version)}</zs:version><zs:numberOfRecords>{nb_results}</zs:numberOfRecords><zs:records>'.encode("utf-8")]
+    for position, record in enumerate(records, start=start_record):
+        output.append(b"<zs:record><zs:recordSchema>marcxml</zs:recordSchema><zs:recordPacking>xml</zs:recordPacking><zs:recordData>")
+        output.append(record.to_marcxml())
+        output.append(f"</zs:recordData><zs:recordPosition>{position}</zs:recordPosition></zs:record>".encode("utf-8"))
+    output.append(b"</zs:records>")
+    # Like Koha, only when records remain after this page
+    if records and start_record + len(records) <= nb_results:
+        output.append(f"<zs:nextRecordPosition>{start_record + len(records)}</zs:nextRecordPosition>".encode("utf-8"))
+    output.append(b"</zs:searchRetrieveResponse>")
+    return b"".join(output)
+
+def sample_authority(id:int) -> MARC_Record:
+    """Returns a UNIMARC personal name authority record looking like a Koha one
+
+    Takes as argument :
+        - id {int} : the authid, in 001"""
+    def datafield(tag, *subfields, ind1=" ", ind2=" "):
+        return MARC_Field(tag, ind1=ind1, ind2=ind2, subfields=[MARC_Subfield(code, value) for code, value in subfields])
+    fields = [
+        MARC_Field("001", value=str(id)),
+        MARC_Field("003", value=f"http://www.idref.fr/{id:08d}X"),
+        MARC_Field("005", value="20230512093000.0"),
+        datafield("033", ("a", f"http://www.idref.fr/{id:08d}X"), ("2", "IdRef")),
+        datafield("035", ("a", f"(IdRef){id:08d}X")),
+        datafield("100", ("a", "20230512afrey50      ba0")),
+        datafield("101", ("a", "fre")),
+        datafield("102", ("a", "FR")),
+        datafield("103", ("a", f"{1900 + id % 100}"), ("b", f"{1970 + id % 50}")),
+        datafield("106", ("a", "0"), ("b", "1"), ("c", "0")),
+        datafield("120", ("a", "ba")),
+        datafield("152", ("a", "AFNOR")),
+        datafield("200", ("9", "y"), ("a", f"Nom{id}"), ("b", "Prénom"), ("f", f"{1900 + id % 100}-{1970 + id % 50}"), ind2="1"),
+        datafield("300", ("a", "Romancier, essayiste. Auteur de nombreux ouvrages de littérature & de critique."), ind1="0"),
+        datafield("400", ("a", f"Nom{id}"), ("b", "P."), ind2="1"),
+        datafield("400", ("a", f"Pseudonyme{id}"), ind2="1"),
+        datafield("810", ("a", "BN Cat. gén.")),
+        datafield("801", ("a", "FR"), ("b", "Abes"), ("c", "20230512"), ("g", "AFNOR"), ind2="0"),
+    ]
+    return MARC_Record("00000cx  a2200000   45  ", fields)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+# Offline tests : python -m unittest discover -s tests (or pytest tests)
+
+# external imports
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+# internal imports
+from Koha_MARC_File_Reader import MARC_File_Reader
+from Koha_MARC_Record import MARC_Record
+from Koha_REST_API_Client import Content_Type
+from samples import sample_record
+
+class Test_Iter_Bulk_Items(unittest.TestCase):
+
+    def setUp(self):
+        records = [sample_record(id) for id in range(1, 6)]
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.iso2709_path = os.path.join(folder.name, "records.mrc")
+        with open(self.iso2709_path, mode="wb") as f:
+            for record in records:
+                f.write(record.to_iso2709())
+        self.marcxml_path = os.path.join(folder.name, "records.xml")
+        with open(self.marcxml_path, mode="wb") as f:
+            f.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<collection xmlns="http://www.loc.gov/MARC21/slim">\n')
+            for record in records:
+                f.write(record.to_marcxml() + b"\n")
+            f.write(b"</collection>")
+
+    def test_marcxml_records_are_parsed_once(self):
+        reader = MARC_File_Reader(self.marcxml_path)
+        self.assertEqual(reader.format, Content_Type.MARCXML)
+        raw = [data for offset, data in reader.iter_raw()]
+        with mock.patch.object(MARC_Record, "from_marcxml", wraps=MARC_Record.from_marcxml) as parser:
+            items = list(reader.iter_bulk_items(get_id=lambda record: record.get_value("001")))
+            self.assertEqual(parser.call_count, 5)
+        self.assertEqual([item[0] for item in items], ["1", "2", "3", "4", "5"])
+        self.assertEqual([item[1] for item in items], raw)
+        self.assertEqual(MARC_Record.from_marcxml(items[0][1]).get_value("001"), "1")
+
+    def test_iso2709_records_are_sent_as_read(self):
+        reader = MARC_File_Reader(self.iso2709_path)
+        self.assertEqual(reader.format, Content_Type.RAW_MARC)
+        items = list(reader.iter_bulk_items(get_id=lambda record: record.get_value("001")))
+        self.assertEqual([item[0] for item in items], ["1", "2", "3", "4", "5"])
+        self.assertEqual([item[1] for item in items], [data for offset, data in reader.iter_raw()])
+        self.assertEqual([item[0] for item in reader.iter_bulk_items()], [None] * 5)
+
+if __name__ == "__main__":
+    unittest.main()
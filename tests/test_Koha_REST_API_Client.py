@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# Offline tests : python -m unittest discover -s tests (or pytest tests)
+
+# external imports
+import logging
+import os
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+# internal imports
+from Koha_Cache import LRU_Cache, Record_Cache, cache_key
+from Koha_REST_API_Client import KohaRESTAPIClient, Content_Type
+from mock_koha import Mock_Koha, Mock_Koha_Config
+from samples import sample_record
+
+logging.getLogger("KohaRESTAPIClient").setLevel(logging.CRITICAL)
+logging.getLogger("Record_Cache").setLevel(logging.CRITICAL)
+
+class Test_Record_Invalidation(unittest.TestCase):
+
+    def setUp(self):
+        self.server = Mock_Koha(Mock_Koha_Config(nb_records=10))
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.cache = Record_Cache(os.path.join(folder.name, "cache.sqlite"))
+        self.addCleanup(self.cache.close)
+        self.memory_cache = LRU_Cache(capacity=100)
+        self.client = KohaRESTAPIClient(self.server.url, "id", "secret", cache=self.cache, memory_cache=self.memory_cache)
+        self.key = cache_key(f"{self.client.endpoint}biblios/1", Content_Type.MARCXML.value)
+
+    def test_update_during_fetch_is_not_overwritten(self):
+        send = self.client._KohaRESTAPIClient__send
+        updates = []
+
+        def send_then_update(method, url, *args, **kwargs):
+            r = send(method, url, *args, **kwargs)
+            if method == "GET" and not updates:
+                # The record is updated while the GET response is on its way
+                updates.append(self.client.update_biblio("1", sample_record(1), format=Content_Type.MARCXML))
+            return r
+
+        with mock.patch.object(self.client, "_KohaRESTAPIClient__send", side_effect=send_then_update):
+            self.client.get_biblio("1", format=Content_Type.MARCXML)
+        self.assertEqual(len(updates), 1)
+        self.assertNotIn(self.key, self.memory_cache)
+        self.assertIsNone(self.cache.get(self.key))
+        # The next call gets the record from Koha again, and caches it
+        self.client.get_biblio("1", format=Content_Type.MARCXML)
+        self.assertEqual(self.server.counters["record"], 2)
+        self.assertIn(self.key, self.memory_cache)
+        self.assertIsNotNone(self.cache.get(self.key))
+
+    def test_calls_after_update_do_not_join_the_old_request(self):
+        send = self.client._KohaRESTAPIClient__send
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_first_get(method, url, *args, **kwargs):
+            if method == "GET" and not started.is_set():
+                started.set()
+                release.wait(5)
+            return send(method, url, *args, **kwargs)
+
+        with mock.patch.object(self.client, "_KohaRESTAPIClient__send", side_effect=slow_first_get):
+            old_call = threading.Thread(target=self.client.get_biblio, args=("1", Content_Type.MARCXML))
+            old_call.start()
+            self.assertTrue(started.wait(5))
+            self.client.update_biblio("1", sample_record(1), format=Content_Type.MARCXML)
+            # Would wait for the old request if it joined it
+            self.client.get_biblio("1", format=Content_Type.MARCXML)
+            self.assertEqual(self.server.counters["record"], 1)
+            release.set()
+            old_call.join(5)
+        self.assertEqual(self.server.counters["record"], 2)
+        self.assertEqual(self.client.single_flight.stats()["shared"], 0)
+        self.assertEqual(self.client.single_flight.stats()["in_flight"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
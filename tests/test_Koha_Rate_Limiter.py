@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+# Offline tests : python -m unittest discover -s tests (or pytest tests)
+
+# external imports
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# internal imports
+from Koha_Rate_Limiter import Rate_Limiter
+
+class Test_Rate_Limiter(unittest.TestCase):
+
+    def test_null_or_negative_rates_are_refused(self):
+        for kwargs in [{"max_rate":0}, {"min_rate":0}, {"max_rate":-1}, {"min_rate":-0.5}]:
+            with self.assertRaises(ValueError):
+                Rate_Limiter(**kwargs)
+
+    def test_acquire_after_decreases_to_min_rate(self):
+        limiter = Rate_Limiter(max_rate=100, min_rate=50, burst=1, cooldown=0)
+        for _ in range(5):
+            limiter.acquire()
+            limiter.release(0, overloaded=True)
+        self.assertEqual(limiter.rate, 50)
+        # The bucket is empty : acquire() waits for the next token instead of dividing by zero
+        limiter.acquire()
+        limiter.release(0)
+        self.assertEqual(limiter.stats()["nb_requests"], 6)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# Offline tests : python -m unittest discover -s tests (or pytest tests)
+
+# external imports
+import logging
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+# internal imports
+import Koha_SRU as ksru
+from Koha_Cache import LRU_Cache
+from Koha_MARC_Record import MARC_Record
+from mock_koha import Mock_Koha, Mock_Koha_Config
+
+logging.getLogger("Koha_SRU").setLevel(logging.CRITICAL)
+
+def get_ids(records) -> list:
+    """Returns the 001 of each marc:record Element"""
+    return [MARC_Record.from_marcxml(record).get_value("001") for record in records]
+
+class Test_Iter_Search(unittest.TestCase):
+
+    def iter_ids(self, config:Mock_Koha_Config, page_size:int) -> tuple:
+        with Mock_Koha(config) as server:
+            sru = ksru.Koha_SRU(server.url, ksru.SRU_Version.V1_1)
+            records = list(sru.iter_search("dc.title=chat", page_size=page_size))
+            return records, server.counters.get("sru", 0)
+
+    def test_all_pages_are_read(self):
+        records, nb_requests = self.iter_ids(Mock_Koha_Config(nb_records=25), 10)
+        self.assertEqual(get_ids(records), [str(id) for id in range(1, 26)])
+        self.assertEqual(nb_requests, 3)
+
+    def test_capped_pages_skip_no_record(self):
+        # The server returns 7 records per page whatever maximumRecords is
+        records, _ = self.iter_ids(Mock_Koha_Config(nb_records=40, sru_max_records=7), 10)
+        self.assertEqual(get_ids(records), [str(id) for id in range(1, 41)])
+
+    def test_capped_pages_without_next_record_position(self):
+        with mock.patch.object(ksru.SRU_Result_Search, "get_next_record_position", return_value=None):
+            records, _ = self.iter_ids(Mock_Koha_Config(nb_records=40, sru_max_records=7), 10)
+        self.assertEqual(get_ids(records), [str(id) for id in range(1, 41)])
+
+    def test_empty_page_stops(self):
+        # numberOfRecords says 40, but no page has records
+        records, nb_requests = self.iter_ids(Mock_Koha_Config(nb_records=40, sru_max_records=0), 10)
+        self.assertEqual(records, [])
+        self.assertLessEqual(nb_requests, 2)
+
+class Test_SRU_Result_Search(unittest.TestCase):
+
+    def test_response_is_parsed_on_first_access(self):
+        with Mock_Koha(Mock_Koha_Config(nb_records=30)) as server:
+            sru = ksru.Koha_SRU(server.url, ksru.SRU_Version.V1_1)
+            with mock.patch.object(ksru, "fromstring", wraps=ksru.fromstring) as parser:
+                res = sru.search("dc.title=chat", maximum_records=10)
+                self.assertEqual(res.status, ksru.Status.SUCCESS.value)
+                self.assertEqual(parser.call_count, 0)
+                self.assertIs(res.get_result(), res.result_as_parsed_xml)
+                self.assertEqual(res.nb_results, 30)
+                self.assertEqual(len(res.records_id), 10)
+                self.assertEqual(parser.call_count, 1)
+
+class Test_Search_Cache(unittest.TestCase):
+
+    def test_hit_skips_request_and_parse(self):
+        with Mock_Koha(Mock_Koha_Config(nb_records=30)) as server:
+            cache = LRU_Cache(capacity=10)
+            sru = ksru.Koha_SRU(server.url, ksru.SRU_Version.V1_1, cache=cache)
+            with mock.patch.object(ksru, "fromstring", wraps=ksru.fromstring) as parser:
+                first = sru.search("dc.title=chat", maximum_records=10)
+                self.assertEqual(parser.call_count, 1)
+                hit = sru.search("DC.TITLE = chat", maximum_records=10)
+                self.assertEqual(hit.records_id, first.records_id)
+                self.assertEqual(hit.nb_results, 30)
+                self.assertEqual(parser.call_count, 1)
+            self.assertEqual(server.counters["sru"], 1)
+            self.assertEqual(cache.stats()["size"], len(hit.result_as_string.encode("utf-8")))
+
+    def test_hits_do_not_share_elements(self):
+        with Mock_Koha(Mock_Koha_Config(nb_records=30)) as server:
+            sru = ksru.Koha_SRU(server.url, ksru.SRU_Version.V1_1, cache=LRU_Cache(capacity=10))
+            first = sru.search("dc.title=chat", maximum_records=10)
+            first.records[0].clear()
+            hit = sru.search("dc.title=chat", maximum_records=10)
+            self.assertIsNot(hit.result, first.result)
+            self.assertEqual(len(hit.records_id), 10)
+            self.assertEqual(hit.records_id[0], "1")
+
+if __name__ == "__main__":
+    unittest.main()
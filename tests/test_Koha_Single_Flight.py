@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+# Offline tests : python -m unittest discover -s tests (or pytest tests)
+
+# external imports
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# internal imports
+from Koha_Single_Flight import Single_Flight
+
+class Test_Single_Flight(unittest.TestCase):
+
+    def test_forget_starts_a_new_call(self):
+        flights = Single_Flight()
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def old_call():
+            started.set()
+            release.wait(5)
+            return "old"
+
+        leader = threading.Thread(target=lambda: results.append(flights.do("key", old_call)))
+        leader.start()
+        self.assertTrue(started.wait(5))
+        flights.forget("key")
+        self.assertEqual(flights.do("key", lambda: "new"), "new")
+        release.set()
+        leader.join(5)
+        self.assertEqual(results, ["old"])
+        self.assertEqual(flights.stats(), {"in_flight":0, "calls":2, "shared":0})
+
+    def test_forget_keeps_the_new_call_shared(self):
+        flights = Single_Flight()
+        old_started, new_started = threading.Event(), threading.Event()
+        release_old, release_new = threading.Event(), threading.Event()
+
+        def call(started, release, result):
+            started.set()
+            release.wait(5)
+            return result
+
+        old = threading.Thread(target=flights.do, args=("key", lambda: call(old_started, release_old, "old")))
+        old.start()
+        self.assertTrue(old_started.wait(5))
+        flights.forget("key")
+        new = threading.Thread(target=flights.do, args=("key", lambda: call(new_started, release_new, "new")))
+        new.start()
+        self.assertTrue(new_started.wait(5))
+        # The old call ending must not remove the new one
+        release_old.set()
+        old.join(5)
+        self.assertEqual(flights.stats()["in_flight"], 1)
+        release_new.set()
+        new.join(5)
+        self.assertEqual(flights.stats()["in_flight"], 0)
+
+if __name__ == "__main__":
+    unittest.main()